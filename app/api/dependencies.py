@@ -1,16 +1,21 @@
-from collections.abc import Generator
+import uuid
+from datetime import datetime, timezone
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated, Optional
 
-import jwt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
+from sqlalchemy import event
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.config import settings
 from app.core import security
-from app.core.crud.users_crud import get_user_by_email
-from app.core.db import engine
+from app.core.config import settings
+from app.core.crud.users_crud_async import get_user_by_email
+from app.core.db import engine, async_engine, async_read_engine
+from app.core.token_denylist import token_denylist
+from app.core.user_cache import user_cache
 from app.models import TokenData, User
 
 # Object used to let FastAPI know that we want to authenticate using OAuth2
@@ -28,6 +33,60 @@ def get_db() -> Generator[Session, None, None]:
 # Dependency for when database wants to be accessed
 SessionDep = Annotated[Session, Depends(get_db)]
 
+
+# Name of the cookie marking that a client recently wrote to the primary and should read from it as well
+READ_PRIMARY_COOKIE_NAME = "read_primary"
+
+# Key in the session info under which the state of the request using the session is stored
+_REQUEST_STATE_INFO_KEY = "request_state"
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_request_as_writing(session: Session) -> None:
+    """
+    Remember on the request state that the request committed to the primary, so the response can set the
+    READ_PRIMARY_COOKIE_NAME cookie. AsyncSession uses Session under the hood, so this also covers async sessions.
+    """
+    request_state = session.info.get(_REQUEST_STATE_INFO_KEY)
+    if request_state is not None:
+        request_state.committed_to_primary = True
+
+
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Get asynchronous database access to the primary if a session exists. Objects are not expired on commit, since
+    expired attributes cannot be lazily reloaded outside of an awaited call.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        if async_read_engine is not async_engine:
+            session.info[_REQUEST_STATE_INFO_KEY] = request.state
+        yield session
+
+
+# Dependency for when database wants to be accessed from async code without blocking the event loop
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+
+
+async def get_async_read_db(
+    request: Request, session: AsyncSessionDep
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Get asynchronous read-only database access, using the read replica if one is configured. Clients which
+    recently wrote to the primary keep reading from the primary, so they see their own writes despite replication lag.
+    Reads from the primary reuse the primary session of the request (and thereby its connection).
+    """
+    if async_read_engine is async_engine or READ_PRIMARY_COOKIE_NAME in request.cookies:
+        yield session
+    else:
+        async with AsyncSession(
+            async_read_engine, expire_on_commit=False
+        ) as read_session:
+            yield read_session
+
+
+# Dependency for read-only endpoints, which may be served by the read replica
+ReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
+
 # Define the name of the cookie that will store the token
 ACCESS_TOKEN_COOKIE_NAME = "access_token"
 
@@ -43,12 +102,24 @@ async def get_token(request: Request) -> str | None:
 TokenDep = Annotated[str | None, Depends(get_token)]
 
 
-async def get_current_user(token: TokenDep, session: SessionDep) -> User:
+def get_client_ip(request: Request) -> str:
     """
-    Returns the current user if the token is valid.
+    Get the IP address of the client, e.g. to rate limit requests. Behind a proxy, the address is read from the
+    CLIENT_IP_HEADER set by the proxy, since the address of the connection is the one of the proxy.
+    """
+    if settings.CLIENT_IP_HEADER:
+        client_ip = request.headers.get(settings.CLIENT_IP_HEADER)
+        if client_ip:
+            return client_ip
+    return request.client.host if request.client is not None else "unknown"
+
+
+def decode_token_data(token: str | None) -> TokenData:
+    """
+    Decode the data of an access token. Version 1 tokens carry the email as subject, version 2 tokens the id and
+    flags of the user (see security.ACCESS_TOKEN_VERSION).
     :param token: Token used for validation
-    :param session: Database session
-    :return: User data including hashed password
+    :return: Data of the token
     """
     if token is None:
         raise HTTPException(
@@ -61,20 +132,94 @@ async def get_current_user(token: TokenDep, session: SessionDep) -> User:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        email: str = payload.get("sub")
-        if email is None:
+        payload = security.decode_access_token(token)
+        subject: str | None = payload.get("sub")
+        if subject is None:
             raise credentials_exception
-        token_data: TokenData = TokenData(email=email)
-    except InvalidTokenError:
+        version = payload.get("ver", 1)
+        if version == 1:
+            token_data: TokenData = TokenData(email=subject)
+        elif version == security.ACCESS_TOKEN_VERSION:
+            token_data = TokenData(
+                user_id=uuid.UUID(subject),
+                is_active=payload.get("is_active", True),
+                is_superuser=payload.get("is_superuser", False),
+                jti=payload.get("jti"),
+            )
+        else:
+            raise credentials_exception
+        if "exp" in payload:
+            token_data.expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc)
+    except (InvalidTokenError, ValueError):
         raise credentials_exception
-    if token_data.email is None:
+    if token_data.email is None and token_data.user_id is None:
         raise credentials_exception
-    user = get_user_by_email(session, token_data.email)
+    return token_data
+
+
+async def check_token_not_revoked(token_data: TokenData, session: AsyncSession) -> None:
+    """
+    Raises a 401 HTTPException if the token was revoked on logout. Only queries the database if the token matches
+    the bloom filter of the denylist (see token_denylist).
+    :param token_data: Data of the token
+    :param session: Database session
+    """
+    if token_data.jti is not None and await token_denylist.is_revoked(
+        session, token_data.jti
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def get_token_data(token: TokenDep, session: AsyncSessionDep) -> TokenData:
+    """
+    Returns the data of the access token if it is valid and not revoked, without looking up the user. For routes
+    which only need the id of the current user. The flags are the ones at the time of login and the user might have
+    been deleted since, so routes relying on them have to use get_current_user instead.
+    :param token: Token used for validation
+    :param session: Database session
+    :return: Data of the token
+    """
+    token_data = decode_token_data(token)
+    await check_token_not_revoked(token_data, session)
+    return token_data
+
+
+# Dependency for when only the data of the access token of the current user is wanted
+TokenDataDep = Annotated[TokenData, Depends(get_token_data)]
+
+
+async def get_current_user(token: TokenDep, session: AsyncSessionDep) -> User:
+    """
+    Returns the current user if the token is valid and not revoked. Users are looked up by id, or by email for tokens
+    issued before the id was added to the tokens, and cached by the subject of the token (see user_cache).
+    :param token: Token used for validation
+    :param session: Database session
+    :return: User data including hashed password
+    """
+    token_data = decode_token_data(token)
+    await check_token_not_revoked(token_data, session)
+    cache_key = (
+        str(token_data.user_id) if token_data.user_id is not None else token_data.email
+    )
+    cached_user = user_cache.get(cache_key)  # type: ignore[arg-type]
+    if cached_user is not None:
+        # Attach the cached user to the session without querying the database
+        return await session.merge(cached_user, load=False)
+    if token_data.user_id is not None:
+        user = await session.get(User, token_data.user_id)
+    else:
+        user = await get_user_by_email(session, token_data.email)  # type: ignore[arg-type]
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user_cache.set(cache_key, user)  # type: ignore[arg-type]
     return user
 
 
@@ -82,7 +227,9 @@ async def get_current_user(token: TokenDep, session: SessionDep) -> User:
 CurrentUserDep = Annotated[User, Depends(get_current_user)]
 
 
-async def get_current_user_optional(token: TokenDep, session: SessionDep) -> Optional[User]:
+async def get_current_user_optional(
+    token: TokenDep, session: AsyncSessionDep
+) -> Optional[User]:
     """
     Returns the current user if a token is provided and it is valid, otherwise returns None.
     :param token: Token used for validation
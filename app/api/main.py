@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.routers import login, users, plants, requests
+from app.api.routers import login, users, plants, requests, admin
 
 # Merge different api router to one for easier inclusion
 api_router = APIRouter()
@@ -7,3 +7,4 @@ api_router.include_router(login.router, tags=["login"])
 api_router.include_router(users.router, tags=["users"])
 api_router.include_router(plants.router, tags=["plants"])
 api_router.include_router(requests.router, tags=["requests"])
+api_router.include_router(admin.router, tags=["admin"])
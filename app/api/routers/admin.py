@@ -0,0 +1,75 @@
+from typing import Any
+
+from fastapi import APIRouter, HTTPException
+
+from app.api.dependencies import CurrentUserDep
+from app.core.db import engine, async_engine, async_read_engine
+from app.core.pool import get_pool_statistics
+from app.core.password_hashing import password_hashing_pool
+from app.core.token_denylist import token_denylist
+from app.core.user_cache import user_cache
+from app.models import (
+    PoolsStatisticsPublic,
+    CachesStatisticsPublic,
+    PasswordHashingStatisticsPublic,
+)
+
+# Router for api endpoints regarding administration/monitoring of the app
+router = APIRouter()
+
+
+@router.get("/admin/pools", response_model=PoolsStatisticsPublic)
+async def read_pool_statistics(current_user: CurrentUserDep) -> Any:
+    """
+    Retrieve the state of the database connection pools of this worker, if current_user is a superuser.
+    :param current_user: Currently logged-in user
+    :return: List of pool statistics with number of pools as a PoolsStatisticsPublic instance
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=401,
+            detail="You are not authorized to view the database statistics.",
+        )
+    pools = [
+        get_pool_statistics("sync", engine.pool),  # type: ignore[arg-type]
+        get_pool_statistics("async", async_engine.pool),  # type: ignore[arg-type]
+    ]
+    if async_read_engine is not async_engine:
+        pools.append(
+            get_pool_statistics("replica", async_read_engine.pool)  # type: ignore[arg-type]
+        )
+    return PoolsStatisticsPublic(data=pools, count=len(pools))
+
+
+@router.get("/admin/caches", response_model=CachesStatisticsPublic)
+async def read_cache_statistics(current_user: CurrentUserDep) -> Any:
+    """
+    Retrieve the state of the in-process caches of this worker, if current_user is a superuser.
+    :param current_user: Currently logged-in user
+    :return: List of cache statistics with number of caches as a CachesStatisticsPublic instance
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=401,
+            detail="You are not authorized to view the cache statistics.",
+        )
+    caches = [
+        user_cache.get_statistics("users"),
+        token_denylist.get_statistics("revoked_tokens"),
+    ]
+    return CachesStatisticsPublic(data=caches, count=len(caches))
+
+
+@router.get("/admin/password-hashing", response_model=PasswordHashingStatisticsPublic)
+async def read_password_hashing_statistics(current_user: CurrentUserDep) -> Any:
+    """
+    Retrieve the state of the password hashing pool of this worker, if current_user is a superuser.
+    :param current_user: Currently logged-in user
+    :return: Statistics of the pool as a PasswordHashingStatisticsPublic instance
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=401,
+            detail="You are not authorized to view the password hashing statistics.",
+        )
+    return password_hashing_pool.get_statistics()
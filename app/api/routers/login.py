@@ -3,11 +3,25 @@ from datetime import timedelta
 from fastapi import Depends, APIRouter, HTTPException, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app.api.dependencies import SessionDep, ACCESS_TOKEN_COOKIE_NAME, OptionalCurrentUserDep
-from app.core.crud.users_crud import authenticate_user
-from app.core.security import create_access_token
+from app.api.dependencies import (
+    AsyncSessionDep,
+    ACCESS_TOKEN_COOKIE_NAME,
+    OptionalCurrentUserDep,
+    TokenDep,
+    decode_token_data,
+    get_client_ip,
+)
+from app.core.crud.users_crud_async import authenticate_user
+from app.core.password_hashing import PasswordHashingUnavailable
+from app.core.rate_limit import (
+    RateLimitUnavailable,
+    is_rate_limited,
+    login_ip_limit,
+    login_account_limit,
+)
+from app.core.security import create_user_access_token
+from app.core.token_denylist import token_denylist
 from app.core.config import settings
-from app.models import User
 
 # Router for api endpoints regarding login functionality
 router = APIRouter()
@@ -15,26 +29,45 @@ router = APIRouter()
 
 @router.post("/login/token")
 async def login_for_access_token(
+    request: Request,
     response: Response,
-    session: SessionDep,
+    session: AsyncSessionDep,
     form_data: OAuth2PasswordRequestForm = Depends(),
 ):
     """
-    OAuth2 Login endpoint according to spec with cookies.
+    OAuth2 Login endpoint according to spec with cookies. Attempts are rate limited per IP address and per account
+    before the password is checked, so guessing passwords cannot exhaust the password hashing pool.
+    :param request: Request object to identify the client
     :param session: Database session to check if plant exists
     :param form_data: User data to identify
     :param response: Response object to set cookie
     :return: Message indicating successful login. Cookie is sent in response as HTTP only cookie.
     """
-    user = authenticate_user(session, form_data.username, form_data.password)
+    try:
+        rate_limited = await is_rate_limited(
+            (login_ip_limit, get_client_ip(request)),
+            (login_account_limit, form_data.username.lower()),
+        )
+    except RateLimitUnavailable:
+        raise HTTPException(
+            status_code=503, detail="Login is temporarily unavailable, try again later."
+        )
+    if rate_limited:
+        raise HTTPException(
+            status_code=429, detail="Too many login attempts, try again later."
+        )
+    try:
+        user = await authenticate_user(session, form_data.username, form_data.password)
+    except PasswordHashingUnavailable:
+        raise HTTPException(
+            status_code=503, detail="Too many login attempts, try again later."
+        )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    access_token = create_user_access_token(user, expires_delta=access_token_expires)
 
     # Set the access token in an HttpOnly cookie
     response.set_cookie(
@@ -51,15 +84,26 @@ async def login_for_access_token(
 
 
 @router.post("/logout")
-async def logout(optional_user: OptionalCurrentUserDep, response: Response):
+async def logout(
+    optional_user: OptionalCurrentUserDep,
+    token: TokenDep,
+    session: AsyncSessionDep,
+    response: Response,
+):
     """
-    Logout endpoint to delete the access token cookie. If user is not logged in returns a 405 HTTPException.
+    Logout endpoint to delete the access token cookie and revoke the access token, so it cannot be used anymore even
+    if the cookie was copied. If user is not logged in returns a 405 HTTPException.
     :param optional_user: Optional user to check if logged in
+    :param token: Access token to revoke
+    :param session: Database session to store the revocation
     :param response: Response object to delete cookie
     :return: Message indicating successful logout
     """
     if optional_user is None:
         raise HTTPException(status_code=405, detail="You are not logged in")
+    token_data = decode_token_data(token)
+    if token_data.jti is not None and token_data.expires_at is not None:
+        await token_denylist.revoke(session, token_data.jti, token_data.expires_at)
 
     # Manually override the cookie to expire it, using the same attributes.
     response.delete_cookie(
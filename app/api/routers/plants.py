@@ -1,20 +1,29 @@
 import uuid
-from typing import Any
+from typing import Any, Literal
 
-from fastapi import APIRouter, HTTPException, UploadFile, Form
+from fastapi import APIRouter, HTTPException, UploadFile, Form, Query
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 
 from app.core.config import settings
-from app.core.crud import plants_crud
-from app.api.dependencies import SessionDep, CurrentUserDep
-from app.models import PlantPublic, Plant, PlantsPublic, PlantCreate
+from app.core.crud import plants_crud_async
+from app.core.plant_matches import tag_index
+from app.api.dependencies import AsyncSessionDep, CurrentUserDep, ReadSessionDep
+from app.models import (
+    PlantPublic,
+    Plant,
+    PlantsPublic,
+    PlantCreate,
+    PlantMatchesPublic,
+)
 
 # Router for api endpoints regarding plants/creation of ad functionality
 router = APIRouter()
 
 
 @router.post("/plants/create", response_model=PlantPublic)
-def create_plant_ad(
-    session: SessionDep,
+async def create_plant_ad(
+    session: AsyncSessionDep,
     current_user: CurrentUserDep,
     name: str = Form(...),
     description: str | None = Form(None),
@@ -29,13 +38,16 @@ def create_plant_ad(
     :param name: Name of the plant.
     :param description: Description of the plant.
     :param city: City of the plant.
-    :param tags: Tags of the plant.
+    :param tags: Tags of the plant, at most MAX_PLANT_TAGS of at most MAX_PLANT_TAG_LENGTH characters.
     :param image: Optional image of the plant.
     :return: Name, description, owner_id and id of the created plant.
     """
     # Remove empty string tags
     tags = [tag for tag in tags if tag != ""]
-    plant_in = PlantCreate(name=name, description=description, city=city, tags=tags)
+    try:
+        plant_in = PlantCreate(name=name, description=description, city=city, tags=tags)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
     if isinstance(image, str) or image is None:
         image = None
     else:
@@ -45,26 +57,96 @@ def create_plant_ad(
                 detail="Image upload is not configured for the app.",
             )
 
-    plant: Plant = plants_crud.create_plant(session, current_user, plant_in, image)
+    plant: Plant = await plants_crud_async.create_plant(
+        session, current_user, plant_in, image
+    )
     return plant
 
 
 @router.get("/plants/", response_model=PlantsPublic)
-def read_plants(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_plants(
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    city: str | None = None,
+    tags: list[str] = Query([]),
+    tags_match: Literal["any", "all"] = "any",
+    owner_id: uuid.UUID | None = None,
+) -> Any:
     """
-    Retrieve all existing plant ads.
+    Retrieve all existing plant ads, optionally filtered by city, tags and owner.
     :param session: Current database session.
     :param skip: Number of plant ads to skip.
     :param limit: Limit of plant ads to retrieve.
+    :param cursor: Cursor of the previous page to retrieve the next page.
+    :param city: City of the plant ads (case-insensitive).
+    :param tags: Tags of the plant ads.
+    :param tags_match: Whether the plant ads have to have "any" or "all" of the given tags.
+    :param owner_id: Id of the owner of the plant ads.
     :return: List of plants with number of plants as a PlantsPublic instance.
     """
-    plants_public = plants_crud.get_all_plant_ads(session, skip, limit)
+    # Remove empty string tags
+    tags = [tag for tag in tags if tag != ""]
+    try:
+        plants_public = await plants_crud_async.get_all_plant_ads(
+            session,
+            skip,
+            limit,
+            cursor,
+            city=city,
+            tags=tags,
+            tags_match=tags_match,
+            owner_id=owner_id,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return plants_public
+
+
+@router.get("/plants/search", response_model=PlantsPublic)
+async def search_plants(
+    session: ReadSessionDep,
+    q: str = Query(min_length=1, max_length=255),
+    mode: Literal["fulltext", "fuzzy"] = "fulltext",
+    threshold: float = Query(0.3, ge=0, le=1),
+    limit: int = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Search plant ads, ordered by relevance. The full-text search matches words in the name and description, the
+    fuzzy search tolerates typos in the name and city.
+    :param session: Current database session.
+    :param q: Search query, e.g. monstera or "monstera deliciosa" -variegated.
+    :param mode: Whether to use the full-text or fuzzy search.
+    :param threshold: Minimum similarity of the query and the name or city of the plant ads for the fuzzy search.
+    :param limit: Limit of plant ads to retrieve.
+    :param cursor: Cursor of the previous page to retrieve the next page.
+    :return: List of plants with number of plants as a PlantsPublic instance.
+    """
+    try:
+        if mode == "fuzzy":
+            plants_public = await plants_crud_async.fuzzy_search_plant_ads(
+                session, q, threshold, limit, cursor
+            )
+        else:
+            plants_public = await plants_crud_async.search_plant_ads(
+                session, q, limit, cursor
+            )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    except RuntimeError:
+        raise HTTPException(status_code=501, detail="Fuzzy search is not available.")
     return plants_public
 
 
 @router.get("/plants/own", response_model=PlantsPublic)
-def read_my_plants(
-    session: SessionDep, current_user: CurrentUserDep, skip: int = 0, limit: int = 100
+async def read_my_plants(
+    session: ReadSessionDep,
+    current_user: CurrentUserDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
 ) -> Any:
     """
     Retrieve all existing plant ads.
@@ -72,23 +154,27 @@ def read_my_plants(
     :param current_user: Currently logged-in user.
     :param skip: Number of plant ads to skip.
     :param limit: Limit of plant ads to retrieve.
+    :param cursor: Cursor of the previous page to retrieve the next page.
     :return: List of plants with number of plants as a PlantsPublic instance.
     """
-    plants_public = plants_crud.get_all_plant_ads_from_one_user(
-        session, current_user.id, skip, limit
-    )
+    try:
+        plants_public = await plants_crud_async.get_all_plant_ads_from_one_user(
+            session, current_user.id, skip, limit, cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
     return plants_public
 
 
 @router.get("/plants/{id}", response_model=PlantPublic)
-def read_plant(session: SessionDep, id: uuid.UUID) -> Any:
+async def read_plant(session: ReadSessionDep, id: uuid.UUID) -> Any:
     """
     Retrieve plant with given id.
     :param id: id of plant.
     :param session: Current database session.
     :return: Plant with given id, if exists.
     """
-    plant = session.get(Plant, id)
+    plant = await plants_crud_async.get_plant(session, id)
     if plant is None:
         raise HTTPException(
             status_code=404,
@@ -97,9 +183,48 @@ def read_plant(session: SessionDep, id: uuid.UUID) -> Any:
     return plant
 
 
+@router.get("/plants/{id}/matches", response_model=PlantMatchesPublic)
+async def read_plant_matches(
+    session: ReadSessionDep,
+    current_user: CurrentUserDep,
+    id: uuid.UUID,
+    limit: int = Query(10, ge=1, le=100),
+) -> Any:
+    """
+    Retrieve possible trades for a plant ad of current_user, i.e. the plant ads of other users who have plant ads
+    sharing tags with it. They are ranked by the mutual overlap, the number of tags of the plant ad which current_user
+    has on their plant ads plus the number of tags of the plant ad of current_user which its owner has on their
+    plant ads.
+    :param session: Current database session.
+    :param current_user: Currently logged-in user
+    :param id: id of plant to find matches for.
+    :param limit: Limit of plant ads to retrieve
+    :return: List of plant ads with their mutual overlap as a PlantMatchesPublic instance
+    """
+    plant = await plants_crud_async.get_plant(session, id)
+    if plant is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No plant with the given id exists.",
+        )
+    if plant.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=401,
+            detail="You are not the owner of the plant.",
+        )
+    if not tag_index.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Plant matches are not available yet, try again later.",
+        )
+    return await tag_index.match_plants(
+        session, plant, limit, settings.PLANT_MATCHES_SEARCH_BUDGET
+    )
+
+
 @router.post("/plants/{id}", response_model=PlantPublic)
-def delete_plant(
-    session: SessionDep, current_user: CurrentUserDep, id: uuid.UUID
+async def delete_plant(
+    session: AsyncSessionDep, current_user: CurrentUserDep, id: uuid.UUID
 ) -> Any:
     """
     Delete plant with given id if current_user is owner.
@@ -108,7 +233,7 @@ def delete_plant(
     :param session: Current database session.
     :return: Plant with given id, if deleted successfully.
     """
-    plant = session.get(Plant, id)
+    plant = await plants_crud_async.get_plant(session, id)
     if plant is None:
         raise HTTPException(
             status_code=404,
@@ -120,5 +245,5 @@ def delete_plant(
                 status_code=401,
                 detail="You are not the owner of the plant.",
             )
-    plant = plants_crud.delete_plant_ad(session, plant)
+    plant = await plants_crud_async.delete_plant_ad(session, plant)
     return plant
@@ -1,17 +1,30 @@
 # Router for api endpoints regarding sending trade requests
+import asyncio
 import uuid
 
-from fastapi import APIRouter, HTTPException, Form
-from sqlalchemy.orm import selectinload
-from sqlmodel import select
+from fastapi import APIRouter, HTTPException, Form, Query, WebSocket, status
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.dependencies import SessionDep, CurrentUserDep
-from app.core.crud import requests_crud
+from app.api.dependencies import (
+    ACCESS_TOKEN_COOKIE_NAME,
+    AsyncSessionDep,
+    CurrentUserDep,
+    ReadSessionDep,
+    get_current_user,
+)
+from app.core.config import settings
+from app.core.crud import plants_crud_async, requests_crud_async
+from app.core.db import async_engine
+from app.core.events import Subscription, event_broker
+from app.core.swap_cycles import swap_graph
 from app.models import (
     TradeRequest,
     Plant,
     TradeRequestsPublic,
     Message,
+    MessagesPublic,
+    SwapCyclesPublic,
+    TradeRequestAcceptedPublic,
     TradeRequestPublic,
 )
 
@@ -22,9 +35,9 @@ router = APIRouter()
     "/requests/create/{outgoing_plant_id}/{incoming_plant_id}",
     response_model=TradeRequestPublic,
 )
-def create_trade_request(
+async def create_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
     message: str | None = Form(None),
@@ -38,17 +51,14 @@ def create_trade_request(
     :param message: Optional message to the owner of the plant the user wants to trade with
     :return: Information about the created trade request as a TradeRequest instance
     """
-    plant_owned_by_user: bool = False
-    for plant in current_user.plants:
-        if plant.id == outgoing_plant_id:
-            plant_owned_by_user = True
-            break
-    if not plant_owned_by_user:
+    if not await plants_crud_async.owns_any_plant(
+        session, current_user.id, outgoing_plant_id
+    ):
         raise HTTPException(
             status_code=401,
             detail="You cannot trade other people's plants (you do not own the plant you want to offer).",
         )
-    incoming_plant: Plant | None = session.get(Plant, incoming_plant_id)
+    incoming_plant: Plant | None = await session.get(Plant, incoming_plant_id)
     if incoming_plant is None:
         raise HTTPException(
             status_code=404,
@@ -59,45 +69,21 @@ def create_trade_request(
             status_code=418,
             detail="You cannot trade with yourself.",
         )
-    # noinspection Pydantic
-    possible_existing_trade = session.exec(
-        select(TradeRequest)
-        .where(TradeRequest.incoming_plant_id == incoming_plant_id)
-        .where(TradeRequest.outgoing_plant_id == outgoing_plant_id)
-    ).first()
-    if possible_existing_trade is not None:
-        raise HTTPException(
-            status_code=409,
-            detail="You already have a trade request for these two plants.",
-        )
-    possible_inverse_existing_trade = session.exec(
-        select(TradeRequest)
-        .where(TradeRequest.outgoing_plant_id == incoming_plant_id)
-        .where(TradeRequest.incoming_plant_id == outgoing_plant_id)
-    ).first()
-    if possible_inverse_existing_trade is not None:
+    trade_request = await requests_crud_async.create_trade_request(
+        session,
+        TradeRequest(
+            outgoing_plant_id=outgoing_plant_id,
+            incoming_plant_id=incoming_plant_id,
+            outgoing_user_id=current_user.id,
+            incoming_user_id=incoming_plant.owner_id,
+        ),
+        message or None,
+    )
+    if trade_request is None:
         raise HTTPException(
             status_code=409,
             detail="You already have a trade request for these two plants.",
         )
-    messages = []
-    if message is not None and message != "":
-        messages.append(
-            Message(
-                sender_id=current_user.id,
-                content=message,
-                incoming_plant_id=incoming_plant_id,
-                outgoing_plant_id=outgoing_plant_id,
-            )
-        )
-    trade_request: TradeRequest = TradeRequest(
-        outgoing_plant_id=outgoing_plant_id,
-        incoming_plant_id=incoming_plant_id,
-        outgoing_user_id=current_user.id,
-        incoming_user_id=incoming_plant.owner_id,
-        messages=messages,
-    )
-    trade_request = requests_crud.create_trade_request(session, trade_request)
     return trade_request
 
 
@@ -105,11 +91,12 @@ def create_trade_request(
     "/requests/outgoing/{outgoing_plant_id}/{incoming_plant_id}",
     response_model=TradeRequestPublic,
 )
-def read_specific_outgoing_trade_request(
+async def read_specific_outgoing_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: ReadSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
+    include_messages: bool = True,
 ):
     """
     Retrieve specific outgoing trade request with the given plant ids if you are the owner of the outgoing plant.
@@ -117,24 +104,26 @@ def read_specific_outgoing_trade_request(
     :param session: Current database session
     :param outgoing_plant_id: id of the plant that is being offered
     :param incoming_plant_id: id of the plant that is wanted in return
+    :param include_messages: Whether to include the messages, see /requests/{outgoing}/{incoming}/messages
     :return: Desired trade request if exists as a TradeRequest instance
     """
-    plant_owned_by_user: bool = False
-    for plant in current_user.plants:
-        if plant.id == outgoing_plant_id:
-            plant_owned_by_user = True
-            break
-    if not plant_owned_by_user:
+    if not await plants_crud_async.owns_any_plant(
+        session, current_user.id, outgoing_plant_id
+    ):
         raise HTTPException(
             status_code=401,
             detail="You do not own a plant with the provided outgoing plant id.",
         )
-    trade_request = session.get(TradeRequest, (outgoing_plant_id, incoming_plant_id))
+    trade_request = await requests_crud_async.get_trade_request(
+        session, outgoing_plant_id, incoming_plant_id, include_messages
+    )
     if trade_request is None:
         raise HTTPException(
             status_code=404,
             detail="No trade request with the given plant ids exists.",
         )
+    if not include_messages:
+        return requests_crud_async.without_messages(trade_request)
     return trade_request
 
 
@@ -142,11 +131,12 @@ def read_specific_outgoing_trade_request(
     "/requests/incoming/{outgoing_plant_id}/{incoming_plant_id}",
     response_model=TradeRequestPublic,
 )
-def read_specific_incoming_trade_request(
+async def read_specific_incoming_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: ReadSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
+    include_messages: bool = True,
 ):
     """
     Retrieve specific incoming trade request with the given plant ids if you are the owner of the incoming plant.
@@ -154,30 +144,37 @@ def read_specific_incoming_trade_request(
     :param session: Current database session
     :param outgoing_plant_id: id of the plant that is being offered
     :param incoming_plant_id: id of the plant that is wanted in return
+    :param include_messages: Whether to include the messages, see /requests/{outgoing}/{incoming}/messages
     :return: Desired trade request if exists as a TradeRequest instance
     """
-    plant_owned_by_user: bool = False
-    for plant in current_user.plants:
-        if plant.id == incoming_plant_id:
-            plant_owned_by_user = True
-            break
-    if not plant_owned_by_user:
+    if not await plants_crud_async.owns_any_plant(
+        session, current_user.id, incoming_plant_id
+    ):
         raise HTTPException(
             status_code=401,
             detail="You do not own a plant with the provided incoming plant id.",
         )
-    trade_request = session.get(TradeRequest, (outgoing_plant_id, incoming_plant_id))
+    trade_request = await requests_crud_async.get_trade_request(
+        session, outgoing_plant_id, incoming_plant_id, include_messages
+    )
     if trade_request is None:
         raise HTTPException(
             status_code=404,
             detail="No trade request with the given plant ids exists.",
         )
+    if not include_messages:
+        return requests_crud_async.without_messages(trade_request)
     return trade_request
 
 
 @router.get("/requests/outgoing/", response_model=TradeRequestsPublic)
-def read_own_outgoing_trade_requests(
-    current_user: CurrentUserDep, session: SessionDep, skip: int = 0, limit: int = 100
+async def read_own_outgoing_trade_requests(
+    current_user: CurrentUserDep,
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_messages: bool = True,
 ):
     """
     Retrieve all existing outgoing trade requests involving oneself.
@@ -185,17 +182,33 @@ def read_own_outgoing_trade_requests(
     :param session: Current database session
     :param skip: Number of requests to skip
     :param limit: Limit of requests to retrieve
+    :param cursor: Cursor of the previous page to retrieve the next page
+    :param include_messages: Whether to include the messages of the trade requests
     :return: List of trade requests with number of requests as a TradeRequestsPublic instance
     """
-    trade_requests = requests_crud.get_all_trade_requests(
-        current_user, session, skip, limit, outgoing_only=True
-    )
+    try:
+        trade_requests = await requests_crud_async.get_all_trade_requests(
+            current_user,
+            session,
+            skip,
+            limit,
+            outgoing_only=True,
+            cursor=cursor,
+            include_messages=include_messages,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
     return trade_requests
 
 
 @router.get("/requests/incoming/", response_model=TradeRequestsPublic)
-def read_own_incoming_trade_requests(
-    current_user: CurrentUserDep, session: SessionDep, skip: int = 0, limit: int = 100
+async def read_own_incoming_trade_requests(
+    current_user: CurrentUserDep,
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_messages: bool = True,
 ):
     """
     Retrieve all existing incoming trade requests involving oneself.
@@ -203,17 +216,33 @@ def read_own_incoming_trade_requests(
     :param session: Current database session
     :param skip: Number of requests to skip
     :param limit: Limit of requests to retrieve
+    :param cursor: Cursor of the previous page to retrieve the next page
+    :param include_messages: Whether to include the messages of the trade requests
     :return: List of trade requests with number of requests as a TradeRequestsPublic instance
     """
-    trade_requests = requests_crud.get_all_trade_requests(
-        current_user, session, skip, limit, incoming_only=True
-    )
+    try:
+        trade_requests = await requests_crud_async.get_all_trade_requests(
+            current_user,
+            session,
+            skip,
+            limit,
+            incoming_only=True,
+            cursor=cursor,
+            include_messages=include_messages,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
     return trade_requests
 
 
 @router.get("/requests/all/", response_model=TradeRequestsPublic)
-def read_own_trade_requests(
-    current_user: CurrentUserDep, session: SessionDep, skip: int = 0, limit: int = 100
+async def read_own_trade_requests(
+    current_user: CurrentUserDep,
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_messages: bool = True,
 ):
     """
     Retrieve all existing trade requests involving oneself.
@@ -221,59 +250,146 @@ def read_own_trade_requests(
     :param session: Current database session
     :param skip: Number of requests to skip
     :param limit: Limit of requests to retrieve
+    :param cursor: Cursor of the previous page to retrieve the next page
+    :param include_messages: Whether to include the messages of the trade requests
     :return: List of trade requests with number of requests as a TradeRequestsPublic instance
     """
-    trade_requests = requests_crud.get_all_trade_requests(
-        current_user, session, skip, limit
-    )
+    try:
+        trade_requests = await requests_crud_async.get_all_trade_requests(
+            current_user,
+            session,
+            skip,
+            limit,
+            cursor=cursor,
+            include_messages=include_messages,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
     return trade_requests
 
 
+@router.get("/requests/cycles/", response_model=SwapCyclesPublic)
+async def read_own_swap_cycles(
+    current_user: CurrentUserDep,
+    session: AsyncSessionDep,
+    max_length: int = Query(
+        settings.SWAP_CYCLES_MAX_LENGTH, ge=3, le=settings.SWAP_CYCLES_MAX_LENGTH
+    ),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Propose swaps between three or more users involving oneself, formed by pending trade requests where each user
+    wants a plant of the next one.
+    :param current_user: Currently logged-in user
+    :param session: Current database session, the primary is used to check that the trade requests are still pending
+    :param max_length: Maximum number of users in a swap
+    :param limit: Limit of swaps to propose
+    :return: List of swaps with number of swaps as a SwapCyclesPublic instance
+    """
+    if not swap_graph.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Swap proposals are not available yet, try again later.",
+        )
+    return await swap_graph.propose_cycles(
+        session,
+        current_user.id,
+        max_length,
+        limit,
+        settings.SWAP_CYCLES_SEARCH_BUDGET,
+    )
+
+
+@router.get(
+    "/requests/{outgoing_plant_id}/{incoming_plant_id}/messages",
+    response_model=MessagesPublic,
+)
+async def read_trade_request_messages(
+    current_user: CurrentUserDep,
+    session: ReadSessionDep,
+    outgoing_plant_id: uuid.UUID,
+    incoming_plant_id: uuid.UUID,
+    limit: int = 100,
+    cursor: str | None = None,
+):
+    """
+    Retrieve the messages of a trade request involving oneself in chronological order, one page at a time.
+    :param current_user: Currently logged-in user
+    :param session: Current database session
+    :param outgoing_plant_id: id of the plant that is being offered
+    :param incoming_plant_id: id of the plant that is wanted in return
+    :param limit: Limit of messages to retrieve
+    :param cursor: Cursor of the previous page to retrieve the next page
+    :return: List of messages with number of messages as a MessagesPublic instance
+    """
+    try:
+        messages = await requests_crud_async.get_trade_request_messages(
+            session, current_user, outgoing_plant_id, incoming_plant_id, limit, cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if messages is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No trade request with the given plant ids exists.",
+        )
+    return messages
+
+
 @router.post(
     "/requests/accept/{outgoing_plant_id}/{incoming_plant_id}",
-    response_model=TradeRequestPublic,
+    response_model=TradeRequestAcceptedPublic,
 )
-def accept_trade_request(
+async def accept_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
 ):
     """
-    Accept a trade request, if the user is owner of the incoming plant.
+    Accept a trade request, if the user is owner of the incoming plant. The other pending trade requests involving one
+    of the two plants are rejected. Only pending trade requests can be accepted, accepting a trade request which was
+    already accepted or rejected (e.g. since a competing trade request was accepted) returns 409 and changes nothing.
     :param current_user: Currently logged-in user.
     :param session: Current database session
     :param outgoing_plant_id: id of the plant that is being offered
     :param incoming_plant_id: id of the plant that is wanted in return
-    :return: Desired changed trade request if exists as a TradeRequest instance
+    :return: Desired changed trade request if exists with the number of rejected trade requests as a
+    TradeRequestAcceptedPublic instance
     """
-    plant_owned_by_user: bool = False
-    for plant in current_user.plants:
-        if plant.id == incoming_plant_id:
-            plant_owned_by_user = True
-            break
-    if not plant_owned_by_user:
+    if not await plants_crud_async.owns_any_plant(
+        session, current_user.id, incoming_plant_id
+    ):
         raise HTTPException(
             status_code=401,
             detail="You do not own a plant with the provided incoming plant id.",
         )
-    trade_request = session.get(TradeRequest, (outgoing_plant_id, incoming_plant_id))
+    trade_request = await requests_crud_async.get_trade_request(
+        session, outgoing_plant_id, incoming_plant_id
+    )
     if trade_request is None:
         raise HTTPException(
             status_code=404,
             detail="No trade request with the given plant ids exists.",
         )
-    trade_request = requests_crud.accept_trade_request(session, trade_request)
-    return trade_request
+    accepted_trade_request = await requests_crud_async.accept_trade_request(
+        session, trade_request
+    )
+    if accepted_trade_request is None:
+        raise HTTPException(
+            status_code=409,
+            detail="The trade request is not pending.",
+        )
+    return accepted_trade_request
 
 
 @router.post(
     "/requests/reject/{outgoing_plant_id}/{incoming_plant_id}",
     response_model=TradeRequestPublic,
 )
-def reject_trade_request(
+async def reject_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
 ):
@@ -285,23 +401,24 @@ def reject_trade_request(
     :param incoming_plant_id: id of the plant that is wanted in return
     :return: Desired changed trade request if exists as a TradeRequest instance
     """
-    plant_owned_by_user: bool = False
-    for plant in current_user.plants:
-        if plant.id == incoming_plant_id:
-            plant_owned_by_user = True
-            break
-    if not plant_owned_by_user:
+    if not await plants_crud_async.owns_any_plant(
+        session, current_user.id, incoming_plant_id
+    ):
         raise HTTPException(
             status_code=401,
             detail="You do not own a plant with the provided incoming plant id.",
         )
-    trade_request = session.get(TradeRequest, (outgoing_plant_id, incoming_plant_id))
+    trade_request = await requests_crud_async.get_trade_request(
+        session, outgoing_plant_id, incoming_plant_id
+    )
     if trade_request is None:
         raise HTTPException(
             status_code=404,
             detail="No trade request with the given plant ids exists.",
         )
-    trade_request = requests_crud.reject_trade_request(session, trade_request)
+    trade_request = await requests_crud_async.reject_trade_request(
+        session, trade_request
+    )
     return trade_request
 
 
@@ -309,9 +426,9 @@ def reject_trade_request(
     "/requests/message/{outgoing_plant_id}/{incoming_plant_id}",
     response_model=TradeRequestPublic,
 )
-def add_message_to_trade_request(
+async def add_message_to_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
     message: str | None = Form(None),
@@ -325,17 +442,16 @@ def add_message_to_trade_request(
     :param message: Message to the other user involved in the trade
     :return: Desired changed trade request if exists as a TradeRequest instance
     """
-    user_involved_in_trade: bool = False
-    for plant in current_user.plants:
-        if plant.id == incoming_plant_id or plant.id == outgoing_plant_id:
-            user_involved_in_trade = True
-            break
-    if not user_involved_in_trade:
+    if not await plants_crud_async.owns_any_plant(
+        session, current_user.id, incoming_plant_id, outgoing_plant_id
+    ):
         raise HTTPException(
             status_code=404,
             detail="You do not own a plant with the given ids.",
         )
-    trade_request = session.get(TradeRequest, (outgoing_plant_id, incoming_plant_id))
+    trade_request = await requests_crud_async.get_trade_request(
+        session, outgoing_plant_id, incoming_plant_id
+    )
     if trade_request is None:
         raise HTTPException(
             status_code=404,
@@ -347,7 +463,9 @@ def add_message_to_trade_request(
         incoming_plant_id=incoming_plant_id,
         outgoing_plant_id=outgoing_plant_id,
     )
-    trade_request = requests_crud.add_message_to_trade_request(session, trade_request, message_with_metadata)
+    trade_request = await requests_crud_async.add_message_to_trade_request(
+        session, trade_request, message_with_metadata
+    )
     return trade_request
 
 
@@ -355,9 +473,9 @@ def add_message_to_trade_request(
     "/requests/delete/{outgoing_plant_id}/{incoming_plant_id}",
     response_model=TradeRequestPublic,
 )
-def delete_trade_request(
+async def delete_trade_request(
     current_user: CurrentUserDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     outgoing_plant_id: uuid.UUID,
     incoming_plant_id: uuid.UUID,
 ):
@@ -369,18 +487,9 @@ def delete_trade_request(
     :param incoming_plant_id: id of the plant the user wants in return
     :return: Information about the deleted trade request as a TradeRequest instance
     """
-    # noinspection Pydantic
-    trade_request = session.exec(
-        select(TradeRequest)
-        .options(
-            # Eagerly load the relationships to avoid lazy loading error: DetachedInstanceError
-            selectinload(TradeRequest.outgoing_plant),
-            selectinload(TradeRequest.incoming_plant),
-            selectinload(TradeRequest.messages),
-        )
-        .where(TradeRequest.incoming_plant_id == incoming_plant_id)
-        .where(TradeRequest.outgoing_plant_id == outgoing_plant_id)
-    ).first()
+    trade_request = await requests_crud_async.get_trade_request(
+        session, outgoing_plant_id, incoming_plant_id
+    )
     if trade_request is None or (
         current_user.id != trade_request.outgoing_user_id
         and current_user.id != trade_request.incoming_user_id
@@ -389,5 +498,59 @@ def delete_trade_request(
             status_code=404,
             detail="No trade request with the given plant ids exists.",
         )
-    trade_request = requests_crud.delete_trade_request(session, trade_request)
+    trade_request = await requests_crud_async.delete_trade_request(
+        session, trade_request
+    )
     return trade_request
+
+
+async def _send_events(websocket: WebSocket, subscription: Subscription) -> None:
+    """
+    Send the events of a subscription to the client until the connection is closed. Closes the connection if the
+    client does not keep up with the events, so it can reload the trade requests and reconnect.
+    """
+    while True:
+        event = await subscription.get()
+        if event is None:
+            await websocket.close(
+                code=status.WS_1013_TRY_AGAIN_LATER,
+                reason="Too many events, reload the trade requests.",
+            )
+            return
+        await websocket.send_json(event)
+
+
+@router.websocket("/requests/events")
+async def trade_request_events(websocket: WebSocket):
+    """
+    WebSocket pushing the events of the trade requests involving oneself as JSON, instead of polling /requests/all/.
+    Events have a "type" of "trade_request_created", "trade_request_status_changed" or "trade_request_deleted" with
+    the ids and status of the trade request, or "message_created" with the new message. Both parties of a trade
+    request receive its events. The connection is authenticated with the access token cookie when it is opened.
+    Browsers send the cookie along with WebSockets opened by any site and CORS does not apply to WebSockets, so
+    connections from origins other than the frontend are closed before the authentication. Clients other than
+    browsers send no origin and are not restricted.
+    :param websocket: WebSocket connection
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in settings.FRONTEND_URLS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    # The session is only used for the authentication, so the connection is not held for the lifetime of the socket
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        try:
+            current_user = await get_current_user(
+                websocket.cookies.get(ACCESS_TOKEN_COOKIE_NAME), session
+            )
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    await websocket.accept()
+    with event_broker.subscribe(current_user.id) as subscription:
+        sender = asyncio.create_task(_send_events(websocket, subscription))
+        try:
+            # Messages of the client are ignored, receiving only detects that the connection was closed
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            sender.cancel()
@@ -1,10 +1,23 @@
 import uuid
 from typing import Any, Optional
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 
-from app.core.crud import users_crud
-from app.api.dependencies import CurrentUserDep, SessionDep, OptionalCurrentUserDep
+from app.core.crud import users_crud_async
+from app.core.password_hashing import PasswordHashingUnavailable
+from app.core.rate_limit import (
+    RateLimitUnavailable,
+    is_rate_limited,
+    signup_ip_limit,
+    signup_account_limit,
+)
+from app.api.dependencies import (
+    CurrentUserDep,
+    AsyncSessionDep,
+    OptionalCurrentUserDep,
+    ReadSessionDep,
+    get_client_ip,
+)
 from app.models import UserPublic, UserCreate, User, UsersPublic
 
 # Router for api endpoints regarding user functionality
@@ -24,14 +37,14 @@ async def read_users_me(
 
 
 @router.get("/users/{id}", response_model=UserPublic)
-def read_user(session: SessionDep, id: uuid.UUID) -> Any:
+async def read_user(session: ReadSessionDep, id: uuid.UUID) -> Any:
     """
     Retrieve user with given id.
     :param id: id of user.
     :param session: Current database session.
     :return: User with given id, if exists.
     """
-    user = session.get(User, id)
+    user = await session.get(User, id)
     if user is None:
         raise HTTPException(
             status_code=404,
@@ -41,27 +54,58 @@ def read_user(session: SessionDep, id: uuid.UUID) -> Any:
 
 
 @router.get("/users/", response_model=UsersPublic)
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> Any:
     """
     Retrieve all existing users.
     :param session: Current database session.
     :param skip: Number of users to skip.
     :param limit: Limit of users to retrieve.
+    :param cursor: Cursor of the previous page to retrieve the next page.
     :return: List of users with number of users as a UsersPublic instance.
     """
-    users_public = users_crud.get_all_users(session, skip=skip, limit=limit)
+    try:
+        users_public = await users_crud_async.get_all_users(
+            session, skip=skip, limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
     return users_public
 
 
 @router.post("/users/signup", response_model=UserPublic)
-def create_user(session: SessionDep, optional_current_user: OptionalCurrentUserDep,  user_in: UserCreate):
+async def create_user(
+    request: Request,
+    session: AsyncSessionDep,
+    optional_current_user: OptionalCurrentUserDep,
+    user_in: UserCreate,
+):
     """
-    Create new user.
+    Create new user. Signups are rate limited per IP address and per email before the password is hashed.
+    :param request: Request object to identify the client
     :param session: Current database session.
     :param optional_current_user: None if the user is not logged in or currently logged-in user otherwise
     :param user_in: The user data for the to-be-created user.
     :return: User data excluding password in shape of a UserPublic instance.
     """
+    try:
+        rate_limited = await is_rate_limited(
+            (signup_ip_limit, get_client_ip(request)),
+            (signup_account_limit, str(user_in.email).lower()),
+        )
+    except RateLimitUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Signup is temporarily unavailable, try again later.",
+        )
+    if rate_limited:
+        raise HTTPException(
+            status_code=429, detail="Too many signups, try again later."
+        )
     if optional_current_user is None and user_in.is_superuser:
         raise HTTPException(
             status_code=401,
@@ -73,19 +117,24 @@ def create_user(session: SessionDep, optional_current_user: OptionalCurrentUserD
                 status_code=401,
                 detail="You are not authorized to create superusers.",
             )
-    user = users_crud.get_user_by_email(session, str(user_in.email))
+    user = await users_crud_async.get_user_by_email(session, str(user_in.email))
     if user:
         raise HTTPException(
             status_code=400,
             detail="A user with this email already exists.",
         )
-    user = users_crud.create_user(session, user_in)
+    try:
+        user = await users_crud_async.create_user(session, user_in)
+    except PasswordHashingUnavailable:
+        raise HTTPException(
+            status_code=503, detail="Too many signups, try again later."
+        )
     return user
 
 
 @router.post("/users/{id}", response_model=UserPublic)
-def delete_user(
-    session: SessionDep, current_user: CurrentUserDep, id: uuid.UUID
+async def delete_user(
+    session: AsyncSessionDep, current_user: CurrentUserDep, id: uuid.UUID
 ) -> Any:
     """
     Delete user with given id if it matches current_user id or current_user is a superuser.
@@ -95,13 +144,13 @@ def delete_user(
     :return: User with given id, if deleted successfully.
     """
     if current_user.is_superuser:
-        user = session.get(User, id)
+        user = await session.get(User, id)
         if user is None:
             raise HTTPException(
                 status_code=404,
                 detail="No user with the given id exists.",
             )
-        user = users_crud.delete_user(session, user)
+        user = await users_crud_async.delete_user(session, user)
         return user
     else:
         if id != current_user.id:
@@ -109,6 +158,6 @@ def delete_user(
                 status_code=401,
                 detail="You are not allowed to delete other users.",
             )
-        user = session.get(User, id)
-        user = users_crud.delete_user(session, user)  # type: ignore # (user is not None since exception would have been raised)
+        user = await session.get(User, id)
+        user = await users_crud_async.delete_user(session, user)  # type: ignore # (user is not None since exception would have been raised)
         return user
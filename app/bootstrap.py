@@ -0,0 +1,18 @@
+"""
+Initialize the database: create/upgrade the schema and create the admin user.
+
+Run with `python -m app.bootstrap` before starting the app, e.g. as release command of a deployment.
+"""
+
+from sqlmodel import Session
+
+from app.core.db import engine, init_db
+
+
+def main() -> None:
+    with Session(engine) as session:
+        init_db(session)
+
+
+if __name__ == "__main__":
+    main()
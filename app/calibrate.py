@@ -0,0 +1,23 @@
+"""
+Calibrate the cost of password hashing: find the bcrypt cost factor for which verifying a password takes at most
+PASSWORD_HASH_TARGET_MS on this machine.
+
+Run with `python -m app.calibrate` on the machine (size) the app is deployed on and set PASSWORD_HASH_BCRYPT_ROUNDS
+to the result. Existing hashes are rehashed with the new cost when their users log in.
+"""
+
+from app.core.config import settings
+from app.core.security import calibrate_bcrypt_rounds
+
+
+def main() -> None:
+    rounds = calibrate_bcrypt_rounds(settings.PASSWORD_HASH_TARGET_MS)
+    print(
+        f"PASSWORD_HASH_BCRYPT_ROUNDS={rounds} "
+        f"(target {settings.PASSWORD_HASH_TARGET_MS:g} ms, "
+        f"currently {settings.PASSWORD_HASH_BCRYPT_ROUNDS})"
+    )
+
+
+if __name__ == "__main__":
+    main()
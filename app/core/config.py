@@ -1,7 +1,8 @@
 import secrets
+from typing import Literal
+
 from pydantic import PostgresDsn, computed_field
 from pydantic_settings import BaseSettings
-from pydantic_core import MultiHostUrl
 
 
 class Settings(BaseSettings):
@@ -22,7 +23,83 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
-   
+    # Connection pool settings, applied per engine and per worker process
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_POOL_MAX_OVERFLOW: int = 10
+    # Seconds to wait for a free connection before giving up
+    POSTGRES_POOL_TIMEOUT: float = 30.0
+    # Test connections before use, since connections go stale when the machines are stopped and restarted
+    POSTGRES_POOL_PRE_PING: bool = True
+    # Seconds after which connections are replaced, -1 to disable
+    POSTGRES_POOL_RECYCLE: int = 1800
+    # Prepare frequently executed statements on the server (psycopg3), so Postgres does not parse them again.
+    # Has to be disabled when connecting through a pooler in transaction mode (e.g. pgbouncer)
+    POSTGRES_PREPARED_STATEMENTS: bool = True
+    # Number of executions of a statement on a connection before it is prepared
+    POSTGRES_PREPARE_THRESHOLD: int = 1
+    # Create/upgrade the schema when the app starts if it is not current. Can be disabled if the database is
+    # initialized by running `python -m app.bootstrap` before starting the app (e.g. as release command)
+    INIT_DB_ON_STARTUP: bool = True
+    # Optional read replica used by read-only endpoints. If not set, all queries go to the primary
+    POSTGRES_REPLICA_SERVER: str | None = None
+    POSTGRES_REPLICA_PORT: int = 5432
+    # Seconds during which a client that wrote something reads from the primary (read-your-writes)
+    POSTGRES_REPLICA_STICKINESS_SECONDS: int = 10
+    # Tables with fewer (estimated) rows than this are counted exactly for the totals of global listings, larger
+    # ones report the row estimate of the query planner instead of running a full COUNT(*)
+    EXACT_COUNT_THRESHOLD: int = 10_000
+    # Number of users cached per worker to authenticate requests without querying the database (0 to disable) and
+    # seconds after which cached users are looked up again, which bounds how long other workers see stale users
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: float = 60.0
+    # Worker threads hashing and verifying passwords (0 to use the default thread pool) and number of hashing jobs that
+    # may be running or queued at the same time, further logins and signups are rejected until jobs have finished
+    PASSWORD_HASHING_WORKERS: int = 1
+    PASSWORD_HASHING_MAX_PENDING: int = 64
+    # Cost factor of bcrypt (log2 of the iterations). Hashes with another cost are rehashed on the next login.
+    # Run `python -m app.calibrate` on the deployed machine (size) to find the cost meeting PASSWORD_HASH_TARGET_MS
+    PASSWORD_HASH_BCRYPT_ROUNDS: int = 12
+    # Target duration of a password verification in milliseconds used by the calibration
+    PASSWORD_HASH_TARGET_MS: float = 250.0
+    # Token bucket rate limits of login and signup per IP address and per account (email), as burst size (capacity)
+    # and refill rate. Buckets are stored in memory per worker or in Postgres, shared by all workers
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal["memory", "postgres"] = "memory"
+    RATE_LIMIT_LOGIN_IP_CAPACITY: int = 20
+    RATE_LIMIT_LOGIN_IP_PER_MINUTE: float = 10
+    RATE_LIMIT_LOGIN_ACCOUNT_CAPACITY: int = 10
+    RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE: float = 5
+    RATE_LIMIT_SIGNUP_IP_CAPACITY: int = 5
+    RATE_LIMIT_SIGNUP_IP_PER_MINUTE: float = 1
+    RATE_LIMIT_SIGNUP_ACCOUNT_CAPACITY: int = 3
+    RATE_LIMIT_SIGNUP_ACCOUNT_PER_MINUTE: float = 1
+    # Header carrying the IP address of the client, set by the proxy in front of the app (Fly-Client-IP on Fly.io).
+    # Only set this if the proxy always overwrites the header, otherwise clients can choose the address they are
+    # rate limited by. Without a header, the address of the connection is used
+    CLIENT_IP_HEADER: str | None = None
+    # Bloom filter of the access tokens revoked on logout. The filter is sized for the expected number of revoked, not
+    # yet expired tokens and the rate of false positives (which are checked against the database). Revocations of
+    # other workers are picked up every TOKEN_DENYLIST_REFRESH_SECONDS
+    TOKEN_DENYLIST_CAPACITY: int = 100_000
+    TOKEN_DENYLIST_ERROR_RATE: float = 0.001
+    TOKEN_DENYLIST_REFRESH_SECONDS: float = 5.0
+    # Number of trade request events queued per WebSocket connection. Connections which fall further behind are closed
+    EVENT_QUEUE_SIZE: int = 100
+    # How events reach the WebSocket connections and the indexes: "memory" only delivers them to the ones of the worker
+    # which committed them, "postgres" to the ones of all workers using LISTEN/NOTIFY
+    EVENT_FANOUT: Literal["memory", "postgres"] = "postgres"
+    # Swap cycles proposed from the index of the pending trade requests. The length is the number of users in a cycle
+    # and the search budget the number of edges of the index visited per search, which bounds the search time. The
+    # index is kept up to date by the trade request events and rebuilt every SWAP_CYCLES_REBUILD_SECONDS
+    SWAP_CYCLES_MAX_LENGTH: int = 5
+    SWAP_CYCLES_SEARCH_BUDGET: int = 50_000
+    SWAP_CYCLES_REBUILD_SECONDS: float = 3600.0
+    # Plant ad matches by mutually overlapping tags from the index of the tags of all plant ads. The search budget is the
+    # number of owners and plant ads counted per search. The index is kept up to date by the plant events and rebuilt
+    # every PLANT_MATCHES_REBUILD_SECONDS
+    PLANT_MATCHES_SEARCH_BUDGET: int = 100_000
+    PLANT_MATCHES_REBUILD_SECONDS: float = 3600.0
+
     # Cloudify
     USE_IMAGE_UPLOAD: bool
     CLOUDINARY_CLOUD_NAME: str
@@ -37,7 +114,7 @@ class Settings(BaseSettings):
     @computed_field  # type: ignore[prop-decorator]
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> PostgresDsn:
-        return MultiHostUrl.build(
+        return PostgresDsn.build(
             scheme="postgresql+psycopg",
             username=self.POSTGRES_USER,
             password=self.POSTGRES_PASSWORD,
@@ -46,6 +123,20 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_DATABASE_URI(self) -> PostgresDsn | None:
+        if self.POSTGRES_REPLICA_SERVER is None:
+            return None
+        return PostgresDsn.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_REPLICA_SERVER,
+            port=self.POSTGRES_REPLICA_PORT,
+            path=self.POSTGRES_DB,
+        )
+
     class Config:
         # Automatically load from a `.env` file for local development (if .env file exists, otherwise use environment variables)
         env_file = ".env"
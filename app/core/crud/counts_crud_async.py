@@ -0,0 +1,64 @@
+import uuid
+
+from sqlalchemy import bindparam, func, text
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import RowCount
+
+# Row estimate of a table based on the statistics of the query planner. Like the planner, the number of rows per page
+# of the last ANALYZE is scaled to the current size of the table, so the estimate follows inserts and deletes between
+# runs of autovacuum. Tables that have never been analyzed have no pages in the statistics and are estimated as empty
+_estimate_row_count = text(
+    """
+    SELECT CASE WHEN relpages > 0
+        THEN (reltuples / relpages * (pg_relation_size(oid) / current_setting('block_size')::integer))::bigint
+        ELSE 0
+    END
+    FROM pg_class WHERE oid = CAST(quote_ident(:table_name) AS regclass)
+    """
+)
+
+# Counts of a user are looked up on every listing of their plant ads and trade requests, so the statement is only
+# built once and the user id and scopes are passed as bound parameters on execution
+# noinspection Pydantic
+_select_row_count = select(func.coalesce(func.sum(RowCount.count), 0)).where(
+    RowCount.owner_id == bindparam("owner_id"),  # type: ignore
+    RowCount.scope.in_(bindparam("scopes", expanding=True)),  # type: ignore
+)
+
+
+async def get_row_count(
+    session: AsyncSession, owner_id: uuid.UUID, scopes: list[str]
+) -> int:
+    """
+    Retrieve the exact number of rows of a user from the counts maintained by database triggers.
+    :param session: Async database session
+    :param owner_id: Id of the user
+    :param scopes: Scopes to add up, "plant", "outgoing_request" and/or "incoming_request"
+    :return: Number of plant ads and/or trade requests (of any status) of the user
+    """
+    result = await session.exec(
+        _select_row_count, params={"owner_id": owner_id, "scopes": scopes}
+    )
+    return int(result.one())
+
+
+async def get_table_count(
+    session: AsyncSession, model: type[SQLModel]
+) -> tuple[int, bool]:
+    """
+    Retrieve the number of rows of a table. Small tables are counted exactly, since this is cheap, for tables with
+    more rows than EXACT_COUNT_THRESHOLD the estimate of the query planner is returned instead of a full COUNT(*).
+    :param session: Async database session
+    :param model: Table model to count the rows of
+    :return: Number of rows and whether it is an estimate
+    """
+    table = model.__table__  # type: ignore
+    result = await session.execute(_estimate_row_count, {"table_name": table.name})
+    estimate = result.scalar_one_or_none() or 0
+    if estimate >= settings.EXACT_COUNT_THRESHOLD:
+        return estimate, True
+    count = (await session.exec(select(func.count()).select_from(table))).one()
+    return count, False
@@ -1,6 +1,8 @@
 import uuid
+from typing import Literal
 
 from fastapi import UploadFile
+from sqlalchemy import func
 from sqlmodel import Session, select
 
 from app.core.config import settings
@@ -38,17 +40,60 @@ def create_plant(
     return plant
 
 
+def filter_plant_ads(
+    statement,
+    city: str | None = None,
+    tags: list[str] | None = None,
+    tags_match: Literal["any", "all"] = "any",
+    owner_id: uuid.UUID | None = None,
+):
+    """
+    Restrict a select statement of plant ads to the ads matching the given filters. The filters are backed by the
+    indexes on Plant: the city is compared case-insensitively (lower(city) index) and the tags use the array
+    operators supported by the GIN index on the tags.
+    :param statement: Select statement of plant ads
+    :param city: City the plant ads have to be in
+    :param tags: Tags the plant ads have to have
+    :param tags_match: Whether the plant ads have to have "any" or "all" of the given tags
+    :param owner_id: Id of the user the plant ads have to belong to
+    :return: Filtered select statement
+    """
+    if city is not None and city.strip() != "":
+        statement = statement.where(func.lower(Plant.city) == city.strip().lower())
+    if tags:
+        if tags_match == "all":
+            # noinspection PyUnresolvedReferences
+            statement = statement.where(Plant.tags.contains(tags))  # type: ignore
+        else:
+            # noinspection PyUnresolvedReferences
+            statement = statement.where(Plant.tags.overlap(tags))  # type: ignore
+    if owner_id is not None:
+        statement = statement.where(Plant.owner_id == owner_id)
+    return statement
+
+
 def get_all_plant_ads(
-    session: Session, skip: int = 0, limit: int = 100
+    session: Session,
+    skip: int = 0,
+    limit: int = 100,
+    city: str | None = None,
+    tags: list[str] | None = None,
+    tags_match: Literal["any", "all"] = "any",
+    owner_id: uuid.UUID | None = None,
 ) -> PlantsPublic:
     """
-    Retrieve all existing plant ads up to the given limit with the given offset.
+    Retrieve all existing plant ads matching the given filters up to the given limit with the given offset.
     :param session: Current database session
     :param skip: Number of ads to skip
     :param limit: Limit of ads to retrieve
+    :param city: City the plant ads have to be in
+    :param tags: Tags the plant ads have to have
+    :param tags_match: Whether the plant ads have to have "any" or "all" of the given tags
+    :param owner_id: Id of the user the plant ads have to belong to
     :return: List of plant ads with number of ads as a PlantsPublic instance
     """
-    statement = select(Plant).offset(skip).limit(limit)
+    statement = filter_plant_ads(select(Plant), city, tags, tags_match, owner_id)
+    statement = statement.offset(skip).limit(limit)
     plants = session.exec(statement).all()
     count = len(plants)
     return PlantsPublic(data=plants, count=count)  # type: ignore
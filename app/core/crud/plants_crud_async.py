@@ -0,0 +1,328 @@
+import uuid
+from datetime import datetime
+from typing import Literal
+
+from fastapi import UploadFile
+from psycopg.errors import UndefinedFunction
+from sqlalchemy import bindparam, cast, exists, func, literal, tuple_
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.dialects.postgresql import REAL, REGCONFIG
+from sqlmodel import select, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.crud import counts_crud_async, plants_crud
+from app.core.images import upload_image_to_cloudinary, delete_image_from_cloudinary
+from app.core.pagination import decode_cursor, paginate
+from app.models import User, PlantCreate, Plant, PlantsPublic
+
+
+async def create_plant(
+    session: AsyncSession,
+    user: User,
+    plant_in: PlantCreate,
+    image: UploadFile | None = None,
+) -> Plant:
+    """
+    Create a new plant ad. The (blocking) image upload is run in a worker thread.
+    :param session: Async database session
+    :param user: User creating the plant ad
+    :param plant_in: Data for the to-be-created plant ad
+    :param image: Optional image of the plant
+    :return: Created plant instance
+    """
+    # Obtain plant id to pass it to image upload
+    plant: Plant = Plant.model_validate(
+        plant_in, update={"owner_id": user.id, "image_url": None}
+    )
+
+    # Handle image upload or set image_url to None
+    image_url = None
+    if image is not None:
+        image_url = await run_in_threadpool(
+            upload_image_to_cloudinary, image, str(plant.id)
+        )
+    plant.image_url = image_url
+    session.add(plant)
+    await session.commit()
+    await session.refresh(plant)
+    return plant
+
+
+async def get_plant(session: AsyncSession, plant_id: uuid.UUID) -> Plant | None:
+    """
+    Retrieve a single plant ad by its id.
+    :param session: Async database session
+    :param plant_id: id of the plant ad
+    :return: Plant ad if it exists, otherwise None
+    """
+    return await session.get(Plant, plant_id)
+
+
+# Ownership is checked on every trade request route, so the statement is only built once. The primary key index
+# finds the plants, without loading all plants of the user
+# noinspection Pydantic
+_select_owns_any_plant = select(
+    exists().where(
+        Plant.id.in_(bindparam("plant_ids", expanding=True)),  # type: ignore
+        Plant.owner_id == bindparam("owner_id"),  # type: ignore
+    )
+)
+
+
+async def owns_any_plant(
+    session: AsyncSession, owner_id: uuid.UUID, *plant_ids: uuid.UUID
+) -> bool:
+    """
+    Check whether a user owns any of the given plant ads, using a single EXISTS query.
+    :param session: Async database session
+    :param owner_id: id of the user
+    :param plant_ids: ids of the plant ads
+    :return: True if the user owns at least one of the plant ads
+    """
+    result = await session.exec(
+        _select_owns_any_plant,
+        params={"owner_id": owner_id, "plant_ids": list(plant_ids)},
+    )
+    return bool(result.one())
+
+
+def _plant_sort_key(plant: Plant) -> tuple[datetime, uuid.UUID]:
+    """
+    Values plant ads are ordered by in listings, backed by the composite indexes on Plant.
+    """
+    return plant.creation_date, plant.id
+
+
+def _select_plant_page(statement, skip: int, limit: int, cursor: str | None):
+    """
+    Order a select statement of plant ads and restrict it to the page after the cursor and offset.
+
+    Throws a ValueError if the cursor is invalid.
+    """
+    statement = statement.order_by(Plant.creation_date, Plant.id)
+    if cursor is not None:
+        # noinspection PyTypeChecker
+        statement = statement.where(
+            tuple_(Plant.creation_date, Plant.id)  # type: ignore
+            > tuple_(*decode_cursor(cursor, (datetime, uuid.UUID)))
+        )
+    # Retrieve one more plant ad than requested to know if there is a next page
+    return statement.offset(skip).limit(limit + 1)
+
+
+async def get_all_plant_ads(
+    session: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    city: str | None = None,
+    tags: list[str] | None = None,
+    tags_match: Literal["any", "all"] = "any",
+    owner_id: uuid.UUID | None = None,
+) -> PlantsPublic:
+    """
+    Retrieve all existing plant ads matching the given filters up to the given limit, ordered by creation date. The
+    page is selected with the cursor of the previous page (keyset pagination) and/or the given offset.
+    The total is only reported if the ads are not filtered by city or tags, since these cannot be counted without
+    visiting all matching ads.
+
+    Throws a ValueError if the cursor is invalid.
+    :param session: Async database session
+    :param skip: Number of ads to skip
+    :param limit: Limit of ads to retrieve
+    :param cursor: Cursor of the previous page, see PlantsPublic.next_cursor
+    :param city: City the plant ads have to be in
+    :param tags: Tags the plant ads have to have
+    :param tags_match: Whether the plant ads have to have "any" or "all" of the given tags
+    :param owner_id: Id of the user the plant ads have to belong to
+    :return: List of plant ads with number of ads, total number of ads and cursor of the next page as a PlantsPublic
+    instance
+    """
+    statement = plants_crud.filter_plant_ads(
+        select(Plant), city, tags, tags_match, owner_id
+    )
+    statement = _select_plant_page(statement, skip, limit, cursor)
+    plants = (await session.exec(statement)).all()
+    page, next_cursor = paginate(plants, limit, _plant_sort_key)
+    total: int | None = None
+    total_is_estimate = False
+    if (city is None or city.strip() == "") and not tags:
+        if owner_id is not None:
+            total = await counts_crud_async.get_row_count(session, owner_id, ["plant"])
+        else:
+            total, total_is_estimate = await counts_crud_async.get_table_count(
+                session, Plant
+            )
+    return PlantsPublic(
+        data=page,  # type: ignore
+        count=len(page),
+        next_cursor=next_cursor,
+        total=total,
+        total_is_estimate=total_is_estimate,
+    )
+
+
+async def get_all_plant_ads_from_one_user(
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> PlantsPublic:
+    """
+    Retrieve all existing plant ads up to the given limit from a specific user, ordered by creation date. The page
+    is selected with the cursor of the previous page (keyset pagination) and/or the given offset.
+
+    Throws a ValueError if the cursor is invalid.
+    :param session: Async database session
+    :param user_id: User id to retrieve plant ads from
+    :param skip: Number of ads to skip
+    :param limit: Limit of ads to retrieve
+    :param cursor: Cursor of the previous page, see PlantsPublic.next_cursor
+    :return: List of plant ads with number of ads, total number of ads and cursor of the next page as a PlantsPublic
+    instance
+    """
+    statement = _select_plant_page(
+        select(Plant).where(Plant.owner_id == user_id), skip, limit, cursor
+    )
+    plants = (await session.exec(statement)).all()
+    page, next_cursor = paginate(plants, limit, _plant_sort_key)
+    total = await counts_crud_async.get_row_count(session, user_id, ["plant"])
+    return PlantsPublic(
+        data=page,  # type: ignore
+        count=len(page),
+        next_cursor=next_cursor,
+        total=total,
+    )
+
+
+def _plant_search_sort_key(row: tuple[Plant, float]) -> tuple[float, uuid.UUID]:
+    """
+    Values the results of the plant search are ordered by (score and id, both descending).
+    """
+    plant, score = row
+    return score, plant.id
+
+
+async def _get_ranked_plant_page(
+    session: AsyncSession, condition, score, limit: int, cursor: str | None
+) -> PlantsPublic:
+    """
+    Retrieve the page of the plant ads matching the condition after the cursor, ordered by the given score.
+
+    Throws a ValueError if the cursor is invalid.
+    :param session: Async database session
+    :param condition: Condition the plant ads have to match
+    :param score: Expression scoring the plant ads, has to return a real
+    :param limit: Limit of ads to retrieve
+    :param cursor: Cursor of the previous page, see PlantsPublic.next_cursor
+    :return: List of plant ads with number of ads and cursor of the next page as a PlantsPublic instance
+    """
+    # noinspection PyTypeChecker
+    statement = (
+        select(Plant, score).where(condition).order_by(score.desc(), Plant.id.desc())  # type: ignore
+    )
+    if cursor is not None:
+        last_score, last_id = decode_cursor(cursor, (float, uuid.UUID))
+        # The score is a real, the score of the cursor has to be compared with the same precision
+        # noinspection PyTypeChecker
+        statement = statement.where(
+            tuple_(score, Plant.id) < tuple_(cast(last_score, REAL), last_id)  # type: ignore
+        )
+    # Retrieve one more plant ad than requested to know if there is a next page
+    rows = (await session.exec(statement.limit(limit + 1))).all()
+    page, next_cursor = paginate(rows, limit, _plant_search_sort_key)
+    return PlantsPublic(
+        data=[plant for plant, _ in page],  # type: ignore
+        count=len(page),
+        next_cursor=next_cursor,
+    )
+
+
+async def search_plant_ads(
+    session: AsyncSession,
+    query: str,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> PlantsPublic:
+    """
+    Full-text search for plant ads by name and description, ordered by relevance (matches in the name rank higher
+    than matches in the description). The query is parsed like a web search (quoted phrases, "or", "-" to exclude
+    words). Matching ads are found using the GIN index on the generated search vector of the plants, so only the
+    matching ads are ranked. The page is selected with the cursor of the previous page (keyset pagination).
+
+    Throws a ValueError if the cursor is invalid.
+    :param session: Async database session
+    :param query: Search query
+    :param limit: Limit of ads to retrieve
+    :param cursor: Cursor of the previous page, see PlantsPublic.next_cursor
+    :return: List of plant ads with number of ads and cursor of the next page as a PlantsPublic instance
+    """
+    search_vector = Plant.__table__.c.search_vector  # type: ignore
+    ts_query = func.websearch_to_tsquery(cast(literal("english"), REGCONFIG), query)
+    return await _get_ranked_plant_page(
+        session,
+        search_vector.op("@@")(ts_query),
+        func.ts_rank(search_vector, ts_query),
+        limit,
+        cursor,
+    )
+
+
+async def fuzzy_search_plant_ads(
+    session: AsyncSession,
+    query: str,
+    threshold: float = 0.3,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> PlantsPublic:
+    """
+    Typo-tolerant search for plant ads by name and city using trigram word similarity (pg_trgm), ordered by
+    similarity. Matching ads are found using the GIN trigram indexes on the name and city of the plants. The page is
+    selected with the cursor of the previous page (keyset pagination).
+
+    Throws a ValueError if the cursor is invalid and a RuntimeError if the pg_trgm extension is not
+    installed in the database.
+    :param session: Async database session
+    :param query: Search query
+    :param threshold: Minimum word similarity between 0 and 1 of the query and the name or city of the ads
+    :param limit: Limit of ads to retrieve
+    :param cursor: Cursor of the previous page, see PlantsPublic.next_cursor
+    :return: List of plant ads with number of ads and cursor of the next page as a PlantsPublic instance
+    """
+    # The <% operator is only supported by the trigram indexes with the threshold set in the database session
+    # instead of comparing the similarity in the query. Setting it locally resets it at the end of the transaction
+    await session.exec(
+        select(
+            func.set_config("pg_trgm.word_similarity_threshold", str(threshold), True)
+        )
+    )
+    condition = or_(
+        literal(query).op("<%")(Plant.city), literal(query).op("<%")(Plant.name)
+    )
+    score = func.greatest(
+        func.word_similarity(query, Plant.name),
+        func.word_similarity(query, Plant.city),
+    )
+    try:
+        return await _get_ranked_plant_page(session, condition, score, limit, cursor)
+    except ProgrammingError as e:
+        if isinstance(e.orig, UndefinedFunction):
+            await session.rollback()
+            raise RuntimeError("Fuzzy search requires the pg_trgm extension.") from e
+        raise
+
+
+async def delete_plant_ad(session: AsyncSession, plant: Plant) -> Plant:
+    """
+    Delete plant ad from database and delete image from image hosting if it exists.
+    :param session: Async database session
+    :param plant: Plant ad to be deleted
+    """
+    if plant.image_url is not None and settings.USE_IMAGE_UPLOAD:
+        await run_in_threadpool(delete_image_from_cloudinary, str(plant.id))
+    await session.delete(plant)
+    await session.commit()
+    return plant
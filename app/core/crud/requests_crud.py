@@ -1,10 +1,31 @@
 import uuid
 
+from sqlalchemy.orm import joinedload, noload, selectinload
 from sqlmodel import Session, select, or_
 
 from app.models import TradeRequest, TradeRequestsPublic, User, Plant, Message
 
 
+def select_trade_requests_with_relationships(include_messages: bool = True):
+    """
+    Select statement for trade requests which eagerly loads the relationships needed for TradeRequestPublic, so a
+    listing takes a fixed number of queries instead of lazily loading the plants and messages of every trade request.
+    The plants are joined into the query, since every trade request has exactly one of each, and the messages are
+    loaded for all trade requests of the result with one additional query.
+    :param include_messages: Whether to load the messages, otherwise they are left empty without a query
+    """
+    # noinspection PyTypeChecker
+    return select(TradeRequest).options(
+        joinedload(TradeRequest.outgoing_plant, innerjoin=True),  # type: ignore
+        joinedload(TradeRequest.incoming_plant, innerjoin=True),  # type: ignore
+        (
+            selectinload(TradeRequest.messages)  # type: ignore
+            if include_messages
+            else noload(TradeRequest.messages)  # type: ignore
+        ),
+    )
+
+
 def create_trade_request(session: Session, trade_request: TradeRequest) -> TradeRequest:
     """
     Create a new trade request.
@@ -88,7 +109,7 @@ def get_all_trade_requests(
     elif outgoing_only:
         # noinspection Pydantic
         statement = (
-            select(TradeRequest)
+            select_trade_requests_with_relationships()
             .where(TradeRequest.outgoing_user_id == user.id)
             .offset(skip)
             .limit(limit)
@@ -96,7 +117,7 @@ def get_all_trade_requests(
     elif incoming_only:
         # noinspection Pydantic
         statement = (
-            select(TradeRequest)
+            select_trade_requests_with_relationships()
             .where(TradeRequest.incoming_user_id == user.id)
             .offset(skip)
             .limit(limit)
@@ -104,7 +125,7 @@ def get_all_trade_requests(
     else:
         # noinspection Pydantic
         statement = (
-            select(TradeRequest)
+            select_trade_requests_with_relationships()
             .where(
                 or_(
                     TradeRequest.outgoing_user_id == user.id,
@@ -0,0 +1,434 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, case, exists, literal_column, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.crud import counts_crud_async, requests_crud
+from app.core.events import collect_trade_request_events
+from app.core.pagination import decode_cursor, paginate
+from app.models import (
+    TradeRequest,
+    TradeRequestAcceptedPublic,
+    TradeRequestPublic,
+    TradeRequestsPublic,
+    User,
+    Message,
+    MessagesPublic,
+)
+
+
+# Trade requests are looked up by their primary key on most requests routes, so the statements (with and without
+# messages) are only built once and the plant ids are passed as bound parameters on execution
+# noinspection Pydantic
+_select_trade_request_by_plant_ids = {
+    include_messages: (
+        requests_crud.select_trade_requests_with_relationships(include_messages)
+        .where(TradeRequest.outgoing_plant_id == bindparam("outgoing_plant_id"))
+        .where(TradeRequest.incoming_plant_id == bindparam("incoming_plant_id"))
+        .execution_options(populate_existing=True)
+    )
+    for include_messages in (True, False)
+}
+
+
+async def get_trade_request(
+    session: AsyncSession,
+    outgoing_plant_id: uuid.UUID,
+    incoming_plant_id: uuid.UUID,
+    include_messages: bool = True,
+) -> TradeRequest | None:
+    """
+    Retrieve a trade request including its plants and messages.
+    :param session: Async database session
+    :param outgoing_plant_id: id of the plant that is being offered
+    :param incoming_plant_id: id of the plant that is wanted in return
+    :param include_messages: Whether to load the messages, see without_messages
+    :return: Trade request if it exists, otherwise None
+    """
+    result = await session.exec(
+        _select_trade_request_by_plant_ids[include_messages],
+        params={
+            "outgoing_plant_id": outgoing_plant_id,
+            "incoming_plant_id": incoming_plant_id,
+        },
+    )
+    return result.first()
+
+
+def without_messages(trade_request: TradeRequest) -> TradeRequestPublic:
+    """
+    Convert a trade request loaded without messages to its public form, with the messages left out (None) instead of
+    being an empty list.
+    :param trade_request: Trade request loaded with include_messages=False
+    :return: Trade request without messages as a TradeRequestPublic instance
+    """
+    return TradeRequestPublic.model_validate(trade_request, update={"messages": None})
+
+
+async def create_trade_request(
+    session: AsyncSession, trade_request: TradeRequest, message: str | None = None
+) -> TradeRequest | None:
+    """
+    Create a new trade request, unless a trade request for the two plants already exists in either direction. Checking
+    and inserting is a single INSERT ... ON CONFLICT DO NOTHING statement backed by the unique index on the unordered
+    pair of plants, so concurrent requests for the same plants cannot both create a trade request.
+    :param trade_request: Trade request to be added to the database, without messages
+    :param session: Async database session
+    :param message: Optional first message of the trade request, sent by the owner of the outgoing plant
+    :return: Created trade request or None if a trade request for the two plants already exists
+    """
+    # noinspection PyTypeChecker
+    created: TradeRequest | None = (
+        await session.execute(
+            insert(TradeRequest)
+            .values(**trade_request.model_dump())
+            .on_conflict_do_nothing()
+            .returning(TradeRequest)
+        )
+    ).scalar_one_or_none()
+    if created is None:
+        await session.rollback()
+        return None
+    # The statement is not part of a flush, so its event has to be collected explicitly
+    await session.run_sync(
+        collect_trade_request_events, "trade_request_created", [created]
+    )
+    if message is not None:
+        session.add(
+            Message(
+                sender_id=created.outgoing_user_id,
+                content=message,
+                outgoing_plant_id=created.outgoing_plant_id,
+                incoming_plant_id=created.incoming_plant_id,
+            )
+        )
+    await session.commit()
+    return await _reload(session, created)
+
+
+def _trade_request_sort_key(
+    trade_request: TradeRequest,
+) -> tuple[datetime, uuid.UUID, uuid.UUID]:
+    """
+    Values trade requests are ordered by in listings, backed by the composite indexes on TradeRequest.
+    """
+    return (
+        trade_request.creation_date,
+        trade_request.outgoing_plant_id,
+        trade_request.incoming_plant_id,
+    )
+
+
+async def get_all_trade_requests(
+    user: User,
+    session: AsyncSession,
+    skip: int,
+    limit: int,
+    outgoing_only: bool = False,
+    incoming_only: bool = False,
+    cursor: str | None = None,
+    include_messages: bool = True,
+) -> TradeRequestsPublic:
+    """
+    Retrieve all existing requests involving oneself up to the given limit, ordered by creation date.
+    Can be either outgoing or incoming only or all kinds of requests. The page is selected with the cursor of the
+    previous page (keyset pagination) and/or the given offset.
+
+    Throws a ValueError  exception if both outgoing_only and incoming_only are true or if the cursor is invalid
+    :param user: Currently logged-in user
+    :param session: Async database session
+    :param skip: Number of ads to skip
+    :param limit: Limit of ads to retrieve
+    :param outgoing_only: Whether to retrieve only outgoing requests
+    :param incoming_only: Whether to retrieve only incoming requests
+    :param cursor: Cursor of the previous page, see TradeRequestsPublic.next_cursor
+    :param include_messages: Whether to include the messages of the trade requests
+    :return: List of trade requests with number of requests, total number of requests and cursor of the next page
+    as a TradeRequestsPublic instance
+    """
+    statement = requests_crud.select_trade_requests_with_relationships(include_messages)
+    if outgoing_only and incoming_only:
+        raise ValueError("Cannot filter by both outgoing and incoming only.")
+    elif outgoing_only:
+        # noinspection Pydantic
+        statement = statement.where(TradeRequest.outgoing_user_id == user.id)
+        count_scopes = ["outgoing_request"]
+    elif incoming_only:
+        # noinspection Pydantic
+        statement = statement.where(TradeRequest.incoming_user_id == user.id)
+        count_scopes = ["incoming_request"]
+    else:
+        count_scopes = ["outgoing_request", "incoming_request"]
+        # noinspection Pydantic
+        statement = statement.where(
+            or_(
+                TradeRequest.outgoing_user_id == user.id,
+                TradeRequest.incoming_user_id == user.id,
+            )
+        )
+    sort_columns = (
+        TradeRequest.creation_date,
+        TradeRequest.outgoing_plant_id,
+        TradeRequest.incoming_plant_id,
+    )
+    statement = statement.order_by(*sort_columns)
+    if cursor is not None:
+        # noinspection PyTypeChecker
+        statement = statement.where(
+            tuple_(*sort_columns)  # type: ignore
+            > tuple_(*decode_cursor(cursor, (datetime, uuid.UUID, uuid.UUID)))
+        )
+    # Retrieve one more trade request than requested to know if there is a next page
+    statement = statement.offset(skip).limit(limit + 1)
+    # noinspection PyTypeChecker
+    trade_requests = (await session.exec(statement)).all()
+    page, next_cursor = paginate(trade_requests, limit, _trade_request_sort_key)
+    if not include_messages:
+        page = [without_messages(trade_request) for trade_request in page]  # type: ignore
+    total = await counts_crud_async.get_row_count(session, user.id, count_scopes)
+    return TradeRequestsPublic(
+        data=page,  # type: ignore
+        count=len(page),
+        next_cursor=next_cursor,
+        total=total,
+    )
+
+
+# Accepts a trade request and rejects the other pending trade requests of its plants in a single statement. The CTE
+# locks the pending trade requests of both plants in primary key order, so concurrent accepts of trade requests sharing
+# a plant wait for each other instead of deadlocking, and the one committing second finds its trade request rejected
+# (the pending condition is rechecked after waiting for a lock). Nothing is updated if the trade request itself is not
+# pending. The status is compared to a literal, so the partial indexes of pending trade requests apply to the statement
+# noinspection Pydantic
+_pending_trade_requests_of_plants = (
+    select(TradeRequest.outgoing_plant_id, TradeRequest.incoming_plant_id)
+    .where(TradeRequest.status == literal_column("0"))
+    .where(
+        or_(
+            TradeRequest.outgoing_plant_id.in_(  # type: ignore
+                [
+                    bindparam("accepted_outgoing_plant_id"),
+                    bindparam("accepted_incoming_plant_id"),
+                ]
+            ),
+            TradeRequest.incoming_plant_id.in_(  # type: ignore
+                [
+                    bindparam("accepted_outgoing_plant_id"),
+                    bindparam("accepted_incoming_plant_id"),
+                ]
+            ),
+        )
+    )
+    .order_by(TradeRequest.outgoing_plant_id, TradeRequest.incoming_plant_id)  # type: ignore
+    .with_for_update()
+    .cte("pending")
+)
+# noinspection Pydantic
+_accept_trade_request = (
+    update(TradeRequest)
+    .where(
+        tuple_(TradeRequest.outgoing_plant_id, TradeRequest.incoming_plant_id).in_(  # type: ignore
+            select(
+                _pending_trade_requests_of_plants.c.outgoing_plant_id,
+                _pending_trade_requests_of_plants.c.incoming_plant_id,
+            )
+        )
+    )
+    .where(
+        exists().where(
+            _pending_trade_requests_of_plants.c.outgoing_plant_id
+            == bindparam("accepted_outgoing_plant_id"),
+            _pending_trade_requests_of_plants.c.incoming_plant_id
+            == bindparam("accepted_incoming_plant_id"),
+        )
+    )
+    .values(
+        status=case(
+            (
+                and_(
+                    TradeRequest.outgoing_plant_id
+                    == bindparam("accepted_outgoing_plant_id"),  # type: ignore
+                    TradeRequest.incoming_plant_id
+                    == bindparam("accepted_incoming_plant_id"),  # type: ignore
+                ),
+                1,
+            ),
+            else_=2,
+        )
+    )
+    .returning(TradeRequest)
+    .execution_options(synchronize_session=False, populate_existing=True)
+)
+
+
+async def accept_trade_request(
+    session: AsyncSession, trade_request: TradeRequest
+) -> TradeRequestAcceptedPublic | None:
+    """
+    Set a trade request as accepted and all other pending trade requests involving one of its plants as rejected, since
+    the plants are traded, in one transaction with a single set-based UPDATE statement.
+    :param trade_request: Trade request to be set as accepted
+    :param session: Async database session
+    :return: Updated trade request with the number of rejected trade requests as TradeRequestAcceptedPublic instance or
+    None if the trade request is not pending (anymore)
+    """
+    updated = (
+        (
+            await session.execute(
+                _accept_trade_request,
+                params={
+                    "accepted_outgoing_plant_id": trade_request.outgoing_plant_id,
+                    "accepted_incoming_plant_id": trade_request.incoming_plant_id,
+                },
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if not updated:
+        await session.rollback()
+        return None
+    # The statement is not part of a flush, so its events have to be collected explicitly
+    await session.run_sync(
+        collect_trade_request_events, "trade_request_status_changed", updated
+    )
+    await session.commit()
+    accepted = await _reload(session, trade_request)
+    return TradeRequestAcceptedPublic.model_validate(
+        accepted, update={"rejected_count": len(updated) - 1}
+    )
+
+
+async def reject_trade_request(
+    session: AsyncSession, trade_request: TradeRequest
+) -> TradeRequest:
+    """
+    Set a trade request as rejected.
+    :param trade_request: Trade request to be set as rejected
+    :param session: Async database session
+    :return: Updated trade request as TradeRequest instance
+    """
+    trade_request.status = 2
+    session.add(trade_request)
+    await session.commit()
+    return await _reload(session, trade_request)
+
+
+async def delete_trade_request(
+    session: AsyncSession, trade_request: TradeRequest
+) -> TradeRequest:
+    """
+    Delete an existing trade request.
+    :param trade_request: Trade request to be deleted from the database
+    :param session: Async database session
+    :return: Deleted trade request as TradeRequest instance
+    """
+    await session.delete(trade_request)
+    await session.commit()
+    return trade_request
+
+
+async def add_message_to_trade_request(
+    session: AsyncSession, trade_request: TradeRequest, message: Message
+) -> TradeRequest:
+    """
+    Add a new message to the trade request. The messages of the trade request have to be loaded already.
+    :param trade_request: Trade request to which the message should be added
+    :param message: Message to be added to the trade request
+    :param session: Async database session
+    :return: Updated trade request as TradeRequest instance
+    """
+    trade_request.messages.append(message)
+    session.add(trade_request)
+    await session.commit()
+    return await _reload(session, trade_request)
+
+
+# Checks that a trade request exists and involves the user before its messages are listed
+# noinspection Pydantic
+_select_user_involved_in_trade_request = select(
+    exists().where(
+        TradeRequest.outgoing_plant_id == bindparam("outgoing_plant_id"),  # type: ignore
+        TradeRequest.incoming_plant_id == bindparam("incoming_plant_id"),  # type: ignore
+        or_(
+            TradeRequest.outgoing_user_id == bindparam("user_id"),
+            TradeRequest.incoming_user_id == bindparam("user_id"),
+        ),
+    )
+)
+
+
+def _message_sort_key(message: Message) -> tuple[datetime, uuid.UUID]:
+    """
+    Values messages are ordered by, backed by the composite index on Message.
+    """
+    return message.timestamp, message.id
+
+
+async def get_trade_request_messages(
+    session: AsyncSession,
+    user: User,
+    outgoing_plant_id: uuid.UUID,
+    incoming_plant_id: uuid.UUID,
+    limit: int,
+    cursor: str | None = None,
+) -> MessagesPublic | None:
+    """
+    Retrieve the messages of a trade request in chronological order, one page at a time (keyset pagination).
+
+    Throws a ValueError exception if the cursor is invalid
+    :param session: Async database session
+    :param user: Currently logged-in user, who has to be involved in the trade request
+    :param outgoing_plant_id: id of the plant that is being offered
+    :param incoming_plant_id: id of the plant that is wanted in return
+    :param limit: Limit of messages to retrieve
+    :param cursor: Cursor of the previous page, see MessagesPublic.next_cursor
+    :return: List of messages with number of messages and cursor of the next page as a MessagesPublic instance or
+    None if no trade request with the given plant ids involving the user exists
+    """
+    sort_columns = (Message.timestamp, Message.id)
+    # noinspection Pydantic
+    statement = (
+        select(Message)
+        .where(Message.outgoing_plant_id == outgoing_plant_id)
+        .where(Message.incoming_plant_id == incoming_plant_id)
+        .order_by(*sort_columns)  # type: ignore
+    )
+    if cursor is not None:
+        # noinspection PyTypeChecker
+        statement = statement.where(
+            tuple_(*sort_columns)  # type: ignore
+            > tuple_(*decode_cursor(cursor, (datetime, uuid.UUID)))
+        )
+    involved = (
+        await session.exec(
+            _select_user_involved_in_trade_request,
+            params={
+                "outgoing_plant_id": outgoing_plant_id,
+                "incoming_plant_id": incoming_plant_id,
+                "user_id": user.id,
+            },
+        )
+    ).one()
+    if not involved:
+        return None
+    # Retrieve one more message than requested to know if there is a next page
+    messages = (await session.exec(statement.limit(limit + 1))).all()
+    page, next_cursor = paginate(messages, limit, _message_sort_key)
+    return MessagesPublic(data=page, count=len(page), next_cursor=next_cursor)
+
+
+async def _reload(session: AsyncSession, trade_request: TradeRequest) -> TradeRequest:
+    """
+    Reload a trade request after a commit, including the relationships needed for TradeRequestPublic.
+    :param session: Async database session
+    :param trade_request: Trade request to be reloaded
+    :return: Reloaded trade request
+    """
+    reloaded = await get_trade_request(
+        session, trade_request.outgoing_plant_id, trade_request.incoming_plant_id
+    )
+    return reloaded  # type: ignore # (trade request was just committed, so it exists)
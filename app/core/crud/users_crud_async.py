@@ -0,0 +1,135 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import bindparam, tuple_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.crud import counts_crud_async
+from app.core.pagination import decode_cursor, paginate
+from app.core.password_hashing import password_hashing_pool
+from app.models import UserCreate, User, UsersPublic
+
+# The user lookup runs on every authenticated request. Building the statement only once lets SQLAlchemy reuse its
+# memoized cache key and compiled SQL, the email is passed as bound parameter on execution
+# noinspection Pydantic
+_select_user_by_email = select(User).where(User.email == bindparam("email"))  # type: ignore
+
+
+async def create_user(session: AsyncSession, user_create: UserCreate) -> User:
+    """
+    Create user entry in database. The password is hashed in the password hashing pool.
+
+    Throws a PasswordHashingUnavailable if too many password hashing jobs are pending.
+    :param session: Async database session
+    :param user_create: User data for the user to be created
+    :return: user that was created including hashed password
+    """
+    hashed_password = await password_hashing_pool.hash_password(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    return db_obj
+
+
+async def get_user_by_email(session: AsyncSession, email: str) -> User | None:
+    """
+    Return instance of User with user data or None if user doesn't exist.
+    :param session: Async database session
+    :param email: Email of user
+    :return: User data including hashed password
+    """
+    result = await session.exec(_select_user_by_email, params={"email": email})
+    return result.first()
+
+
+def _user_sort_key(user: User) -> tuple[datetime, uuid.UUID]:
+    """
+    Values users are ordered by in listings, backed by the composite index on User.
+    """
+    return user.creation_date, user.id
+
+
+async def get_all_users(
+    session: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> UsersPublic:
+    """
+    Retrieve all existing users up to the given limit, ordered by creation date. The page is selected with the
+    cursor of the previous page (keyset pagination) and/or the given offset.
+
+    Throws a ValueError if the cursor is invalid.
+    :param session: Async database session
+    :param skip: Number of users to skip
+    :param limit: Limit of users to retrieve
+    :param cursor: Cursor of the previous page, see UsersPublic.next_cursor
+    :return: List of users with number of users, total number of users and cursor of the next page as a
+    UsersPublic instance
+    """
+    statement = select(User).order_by(User.creation_date, User.id)  # type: ignore
+    if cursor is not None:
+        # noinspection PyTypeChecker
+        statement = statement.where(
+            tuple_(User.creation_date, User.id)  # type: ignore
+            > tuple_(*decode_cursor(cursor, (datetime, uuid.UUID)))
+        )
+    # Retrieve one more user than requested to know if there is a next page
+    statement = statement.offset(skip).limit(limit + 1)
+    users = (await session.exec(statement)).all()
+    page, next_cursor = paginate(users, limit, _user_sort_key)
+    total, total_is_estimate = await counts_crud_async.get_table_count(session, User)
+    return UsersPublic(
+        data=page,  # type: ignore
+        count=len(page),
+        next_cursor=next_cursor,
+        total=total,
+        total_is_estimate=total_is_estimate,
+    )
+
+
+async def authenticate_user(
+    session: AsyncSession, email: str, password: str
+) -> User | None:
+    """
+    Check user email and password against database. The password is verified in the password hashing pool and
+    rehashed if its hash is outdated (see security.pwd_context).
+
+    Throws a PasswordHashingUnavailable if too many password hashing jobs are pending.
+    :param session: Async database session
+    :param email: Email of user
+    :param password: Hashed password of user
+    :return: user if credentials match user in database and None otherwise
+    """
+    db_user = await get_user_by_email(session=session, email=email)
+    if not db_user:
+        return None
+    (
+        verified,
+        new_hashed_password,
+    ) = await password_hashing_pool.verify_and_update_password(
+        password, db_user.hashed_password
+    )
+    if not verified:
+        return None
+    if new_hashed_password is not None:
+        # The hash was created with another cost factor, replace it while the plain password is known
+        db_user.hashed_password = new_hashed_password
+        session.add(db_user)
+        await session.commit()
+    return db_user
+
+
+async def delete_user(session: AsyncSession, user: User) -> User:
+    """
+    Delete user from database.
+    :param session: Async database session
+    :param user: User to be deleted
+    """
+    await session.delete(user)
+    await session.commit()
+    return user
@@ -1,22 +1,240 @@
-from sqlmodel import Session, create_engine, select
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 
 from app.core.crud import users_crud
 from app.core.config import settings
+from app.core.pool import TimedQueuePool, TimedAsyncAdaptedQueuePool
 
 # Models need to be imported before database is initialized
 from app import models  # noqa: F401
 
+# Connection pool and connection options shared by the engines
+engine_options = {
+    "pool_size": settings.POSTGRES_POOL_SIZE,
+    "max_overflow": settings.POSTGRES_POOL_MAX_OVERFLOW,
+    "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+    "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+    # A prepare_threshold of None disables server-side prepared statements in psycopg
+    "connect_args": {
+        "prepare_threshold": (
+            settings.POSTGRES_PREPARE_THRESHOLD
+            if settings.POSTGRES_PREPARED_STATEMENTS
+            else None
+        )
+    },
+}
+
 # Engine used to communicate with database
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), poolclass=TimedQueuePool, **engine_options
+)
 
+# Engine used to communicate with database from async code (api routers). Uses the async mode of psycopg3
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **engine_options,
+)
 
-def init_db(session: Session):
+# Engine used by read-only endpoints. Points to the read replica if one is configured, otherwise to the primary
+if settings.SQLALCHEMY_REPLICA_DATABASE_URI is not None:
+    async_read_engine = create_async_engine(
+        str(settings.SQLALCHEMY_REPLICA_DATABASE_URI),
+        poolclass=TimedAsyncAdaptedQueuePool,
+        **engine_options,
+    )
+else:
+    async_read_engine = async_engine
+
+
+# Version of the database schema defined by the models. Has to be increased whenever the schema changes and the
+# statements upgrading an existing database to the new version have to be added to MIGRATIONS
+SCHEMA_VERSION = 11
+
+# Statements to upgrade the schema of an existing database to the given version. New tables are created by
+# create_all, so this is only needed for changes to existing tables (e.g. new columns or indexes). Statements have to
+# be idempotent, since databases created before the schema was versioned start at version 0.
+MIGRATIONS: dict[int, list[str]] = {
+    1: [],
+    # Creation dates and composite indexes for keyset (cursor) pagination
+    2: [
+        'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS creation_date TIMESTAMP NOT NULL DEFAULT now()',
+        "ALTER TABLE traderequest ADD COLUMN IF NOT EXISTS creation_date TIMESTAMP NOT NULL DEFAULT now()",
+        'CREATE INDEX IF NOT EXISTS ix_user_creation_date_id ON "user" (creation_date, id)',
+        "CREATE INDEX IF NOT EXISTS ix_plant_creation_date_id ON plant (creation_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_plant_owner_id_creation_date_id ON plant (owner_id, creation_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_traderequest_outgoing_user_id_creation_date "
+        "ON traderequest (outgoing_user_id, creation_date, outgoing_plant_id, incoming_plant_id)",
+        "CREATE INDEX IF NOT EXISTS ix_traderequest_incoming_user_id_creation_date "
+        "ON traderequest (incoming_user_id, creation_date, outgoing_plant_id, incoming_plant_id)",
+    ],
+    # Triggers maintaining the per user counts of plant ads and trade requests in the rowcount table
+    3: [
+        """
+        CREATE OR REPLACE FUNCTION adjust_row_count(
+            _scope text, _owner_id uuid, _status integer, _delta integer
+        ) RETURNS void AS $$
+        BEGIN
+            INSERT INTO rowcount (scope, owner_id, status, count)
+            VALUES (_scope, _owner_id, _status, _delta)
+            ON CONFLICT (scope, owner_id, status) DO UPDATE SET count = rowcount.count + EXCLUDED.count;
+            IF _delta < 0 THEN
+                DELETE FROM rowcount
+                WHERE scope = _scope AND owner_id = _owner_id AND status = _status AND count = 0;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION count_plant_rows() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM adjust_row_count('plant', OLD.owner_id, 0, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM adjust_row_count('plant', NEW.owner_id, 0, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION count_traderequest_rows() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM adjust_row_count('outgoing_request', OLD.outgoing_user_id, OLD.status, -1);
+                PERFORM adjust_row_count('incoming_request', OLD.incoming_user_id, OLD.status, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM adjust_row_count('outgoing_request', NEW.outgoing_user_id, NEW.status, 1);
+                PERFORM adjust_row_count('incoming_request', NEW.incoming_user_id, NEW.status, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "CREATE OR REPLACE TRIGGER plant_row_count AFTER INSERT OR DELETE OR UPDATE OF owner_id "
+        "ON plant FOR EACH ROW EXECUTE FUNCTION count_plant_rows()",
+        "CREATE OR REPLACE TRIGGER traderequest_row_count "
+        "AFTER INSERT OR DELETE OR UPDATE OF status, outgoing_user_id, incoming_user_id "
+        "ON traderequest FOR EACH ROW EXECUTE FUNCTION count_traderequest_rows()",
+        # Backfill the counts of existing rows while blocking concurrent writes
+        "LOCK TABLE plant, traderequest IN SHARE MODE",
+        "DELETE FROM rowcount",
+        "INSERT INTO rowcount (scope, owner_id, status, count) "
+        "SELECT 'plant', owner_id, 0, count(*) FROM plant GROUP BY owner_id",
+        "INSERT INTO rowcount (scope, owner_id, status, count) "
+        "SELECT 'outgoing_request', outgoing_user_id, status, count(*) FROM traderequest "
+        "GROUP BY outgoing_user_id, status",
+        "INSERT INTO rowcount (scope, owner_id, status, count) "
+        "SELECT 'incoming_request', incoming_user_id, status, count(*) FROM traderequest "
+        "GROUP BY incoming_user_id, status",
+    ],
+    # Indexes for filtering plants by city and tags
+    4: [
+        "CREATE INDEX IF NOT EXISTS ix_plant_lower_city_creation_date_id ON plant (lower(city), creation_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_plant_tags ON plant USING gin (tags)",
+    ],
+    # Generated full-text search document of plants and its index for the plant search
+    5: [
+        "ALTER TABLE plant ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({models.PLANT_SEARCH_VECTOR_EXPRESSION}) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_plant_search_vector ON plant USING gin (search_vector)",
+    ],
+    # Trigram indexes for the fuzzy plant search. Skipped if the pg_trgm extension is not available on the database
+    # server, in which case the fuzzy search is unavailable
+    6: [
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS ix_plant_name_trgm ON plant USING gin (name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS ix_plant_city_trgm ON plant USING gin (city gin_trgm_ops);
+            END IF;
+        END
+        $$
+        """,
+    ],
+    # Table of the shared rate limit backend, created by create_all
+    7: [],
+    # Table of the access tokens revoked on logout, created by create_all
+    8: [],
+    # Index for the keyset pagination of the messages of a trade request
+    9: [
+        "CREATE INDEX IF NOT EXISTS ix_message_trade_request_timestamp_id "
+        "ON message (incoming_plant_id, outgoing_plant_id, timestamp, id)",
+    ],
+    # At most one trade request per unordered pair of plants, so creating a request and its inverse cannot race
+    10: [
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_traderequest_plant_pair "
+        "ON traderequest (least(outgoing_plant_id, incoming_plant_id), "
+        "greatest(outgoing_plant_id, incoming_plant_id))",
+    ],
+    # Partial indexes of the pending trade requests per plant, for rejecting competing trade requests on accept
+    11: [
+        "CREATE INDEX IF NOT EXISTS ix_traderequest_pending_outgoing_plant_id "
+        "ON traderequest (outgoing_plant_id) WHERE status = 0",
+        "CREATE INDEX IF NOT EXISTS ix_traderequest_pending_incoming_plant_id "
+        "ON traderequest (incoming_plant_id) WHERE status = 0",
+    ],
+}
+
+# Key of the postgres advisory lock serializing the schema bootstrap of concurrently starting workers
+BOOTSTRAP_LOCK_KEY = 7_351_902
+
+
+def get_schema_version(connection: Connection) -> int:
     """
-    Initialize database and create admin user in database using credentials from .env file.
+    Get the version of the schema of the database.
+    :param connection: Database connection
+    :return: Schema version, 0 if the database has not been bootstrapped yet
     """
-    from sqlmodel import SQLModel
+    try:
+        with connection.begin_nested():
+            version = connection.execute(
+                select(models.SchemaVersion.version)  # type: ignore
+            ).scalar()
+    except ProgrammingError:
+        # The schema version table does not exist yet
+        return 0
+    return version or 0
 
-    SQLModel.metadata.create_all(engine)
+
+def migrate_db() -> bool:
+    """
+    Create the tables and upgrade the schema of the database to SCHEMA_VERSION, if it is not current.
+    Safe to be run by several workers at the same time, since the bootstrap is serialized using an advisory lock.
+    :return: True if the schema was upgraded and False if it was already current
+    """
+    with engine.begin() as connection:
+        if get_schema_version(connection) == SCHEMA_VERSION:
+            return False
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": BOOTSTRAP_LOCK_KEY}
+        )
+        # Another worker might have bootstrapped the schema while waiting for the lock
+        version = get_schema_version(connection)
+        if version == SCHEMA_VERSION:
+            return False
+        SQLModel.metadata.create_all(connection)
+        for upgrade_version in range(version + 1, SCHEMA_VERSION + 1):
+            for statement in MIGRATIONS[upgrade_version]:
+                connection.execute(text(statement))
+        connection.execute(models.SchemaVersion.__table__.delete())  # type: ignore
+        connection.execute(
+            models.SchemaVersion.__table__.insert().values(version=SCHEMA_VERSION)  # type: ignore
+        )
+    return True
+
+
+def create_first_superuser(session: Session) -> None:
+    """
+    Create admin user in database using credentials from .env file, if it does not exist.
+    """
     # noinspection Pydantic
     user: models.User | None = session.exec(
         select(models.User).where(models.User.email == settings.FIRST_SUPERUSER)  # type: ignore
@@ -28,3 +246,21 @@ def init_db(session: Session):
             is_superuser=True,
         )
         users_crud.create_user(session=session, user_create=user_in)
+
+
+def init_db(session: Session):
+    """
+    Initialize database and create admin user in database using credentials from .env file.
+    """
+    migrate_db()
+    create_first_superuser(session)
+
+
+def init_db_on_startup() -> None:
+    """
+    Initialize the database when the app starts, if the schema is not current. If it is current, this is a single
+    query, so (cold) starts of the app do not pay for creating the tables and looking up the admin user.
+    """
+    if migrate_db():
+        with Session(engine) as session:
+            create_first_superuser(session)
@@ -0,0 +1,507 @@
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Callable, Generator, Iterable
+from contextlib import contextmanager
+from typing import Any
+
+import psycopg
+from sqlalchemy import event, inspect, orm, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm.attributes import NO_VALUE
+from sqlalchemy.orm.util import identity_key
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import Message, Plant, TradeRequest
+
+logger = logging.getLogger(__name__)
+
+# Key in the session info under which the events of the current transaction are collected until it is committed
+_PENDING_EVENTS_INFO_KEY = "pending_events"
+
+# Postgres channel the events are sent on to the listeners of all workers
+EVENTS_CHANNEL = "events"
+
+
+class Subscription:
+    """
+    Queue of the events of a user for one subscriber (e.g. a WebSocket connection), bound to the event loop of the
+    subscriber. If the subscriber does not keep up and the queue is full, the queued events are dropped and
+    get returns None, so the subscriber can resynchronize instead of silently missing events.
+    """
+
+    def __init__(self, user_id: uuid.UUID, max_size: int):
+        self.user_id = user_id
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue(max_size)
+
+    def _drop_events(self) -> None:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    def _put(self, event: dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._drop_events()
+
+    def _call(self, callback, *args: Any) -> None:
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The event loop of the subscriber was closed
+            pass
+
+    def put(self, event: dict[str, Any]) -> None:
+        """
+        Queue an event. Can be called from any thread.
+        :param event: Event to be queued
+        """
+        self._call(self._put, event)
+
+    def resynchronize(self) -> None:
+        """
+        Drop the queued events and tell the subscriber to resynchronize, e.g. since events might have been missed.
+        Can be called from any thread.
+        """
+        self._call(self._drop_events)
+
+    async def get(self) -> dict[str, Any] | None:
+        """
+        Wait for the next event.
+        :return: Next event or None if events were dropped (e.g. since the queue was full)
+        """
+        return await self._queue.get()
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe broker of the events of the trade requests of users. Events are only delivered to
+    subscribers of this worker process.
+    """
+
+    def __init__(self, max_queue_size: int):
+        self._lock = threading.Lock()
+        self._subscriptions: dict[uuid.UUID, set[Subscription]] = defaultdict(set)
+        self._listeners: list[Callable[[dict[str, Any]], None]] = []
+        self.max_queue_size = max_queue_size
+
+    def add_listener(self, listener: Callable[[dict[str, Any]], None]) -> None:
+        """
+        Call a function with every published event, regardless of the users it is delivered to, e.g. to keep an index
+        up to date. Listeners are called from the publishing thread and should be fast.
+        :param listener: Function called with the event
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    @contextmanager
+    def subscribe(self, user_id: uuid.UUID) -> Generator[Subscription, None, None]:
+        """
+        Context manager subscribing to the events of a user until it is exited. Has to be entered from the event loop
+        the events are consumed on.
+        :param user_id: id of the user
+        :return: Subscription to get the events from
+        """
+        subscription = Subscription(user_id, self.max_queue_size)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions[user_id].discard(subscription)
+                if not self._subscriptions[user_id]:
+                    del self._subscriptions[user_id]
+
+    def publish(self, user_ids: Iterable[uuid.UUID], event: dict[str, Any]) -> None:
+        """
+        Deliver an event to all subscribers of the given users. Can be called from any thread.
+        :param user_ids: ids of the users
+        :param event: Event to be delivered
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for user_id in set(user_ids)
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+            listeners = list(self._listeners)
+        for subscription in subscriptions:
+            subscription.put(event)
+        for listener in listeners:
+            listener(event)
+
+    def resynchronize_subscribers(self) -> None:
+        """
+        Tell all subscribers to resynchronize, since events might have been missed.
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for subscriptions in self._subscriptions.values()
+                for subscription in subscriptions
+            ]
+        for subscription in subscriptions:
+            subscription.resynchronize()
+
+    def subscriber_count(self) -> int:
+        """
+        Count the current subscriptions of all users.
+        :return: Number of subscriptions
+        """
+        with self._lock:
+            return sum(
+                len(subscriptions) for subscriptions in self._subscriptions.values()
+            )
+
+
+# Broker of the events of this worker, fed by the session events below, either directly or through the
+# listener of the notifications of all workers
+event_broker = EventBroker(settings.EVENT_QUEUE_SIZE)
+
+
+class PostgresEventListener:
+    """
+    Listener of the events notified by all workers (see EVENT_FANOUT) on a single connection per worker, which
+    dispatches them to the local subscribers. If the connection is lost, it is reestablished and all subscribers are
+    told to resynchronize, since events might have been missed in between.
+    """
+
+    def __init__(self, broker: EventBroker, retry_seconds: float = 1.0):
+        self._broker = broker
+        self.retry_seconds = retry_seconds
+
+    @staticmethod
+    async def _connect() -> psycopg.AsyncConnection:
+        # The engines use the psycopg dialect of SQLAlchemy, psycopg itself only accepts the plain scheme
+        conninfo = str(settings.SQLALCHEMY_DATABASE_URI).replace(
+            "postgresql+psycopg://", "postgresql://", 1
+        )
+        connection = await psycopg.AsyncConnection.connect(conninfo, autocommit=True)
+        await connection.execute(f"LISTEN {EVENTS_CHANNEL}")
+        return connection
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            notification = json.loads(payload)
+            user_ids = [uuid.UUID(user_id) for user_id in notification["user_ids"]]
+            self._broker.publish(user_ids, notification["event"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed event: %s", payload)
+
+    async def start(self) -> asyncio.Task:
+        """
+        Start listening. Returns once the connection listens (or failed to connect, in which case connecting is retried
+        in the background), so events committed afterwards are not missed.
+        :return: Task listening until it is cancelled
+        """
+        connection: psycopg.AsyncConnection | None = None
+        try:
+            connection = await self._connect()
+        except (psycopg.Error, OSError):
+            logger.exception("Listening for events failed")
+        return asyncio.create_task(self._listen(connection))
+
+    async def _listen(self, connection: psycopg.AsyncConnection | None) -> None:
+        try:
+            while True:
+                try:
+                    if connection is None:
+                        connection = await self._connect()
+                        self._broker.resynchronize_subscribers()
+                    async for notify in connection.notifies():
+                        self._dispatch(notify.payload)
+                except (psycopg.Error, OSError):
+                    logger.exception("Listening for events failed")
+                if connection is not None:
+                    await connection.close()
+                    connection = None
+                await asyncio.sleep(self.retry_seconds)
+        finally:
+            if connection is not None:
+                await connection.close()
+
+
+# Listener of the events of all workers, started with the app if EVENT_FANOUT is "postgres"
+event_listener = PostgresEventListener(event_broker)
+
+
+class EventIndex(ABC):
+    """
+    In-memory index of this worker, built from the database and kept up to date by the published events (of all
+    workers, see EVENT_FANOUT). It is rebuilt periodically, so changes which do not cause events (e.g. rows deleted by
+    cascading foreign keys) do not accumulate. Events received while the index is rebuilt are applied to the current
+    and the rebuilt index. Register apply_event with the event broker to feed the index.
+    """
+
+    # Types of the events the index is updated with, other events are ignored
+    event_types: tuple[str, ...] = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_events: list[dict[str, Any]] | None = None
+        self.ready = False
+
+    @abstractmethod
+    def _rebuild_statement(self):
+        """
+        Select statement of the rows the index is built from.
+        """
+
+    @abstractmethod
+    def _add_row(self, row) -> None:
+        """
+        Add a row of the rebuild statement to the index.
+        """
+
+    @abstractmethod
+    def _apply_event(self, event: dict[str, Any]) -> None:
+        """
+        Update the index with an event, called with the lock held.
+        """
+
+    @abstractmethod
+    def _replace(self, index: "EventIndex") -> None:
+        """
+        Take over the contents of a rebuilt index, called with the lock held.
+        """
+
+    def apply_event(self, event: dict[str, Any]) -> None:
+        """
+        Update the index with an event. Events of other types are ignored.
+        :param event: Event published by the event broker
+        """
+        if event.get("type") not in self.event_types:
+            return
+        try:
+            with self._lock:
+                self._apply_event(event)
+                if self._rebuild_events is not None:
+                    self._rebuild_events.append(event)
+        except (KeyError, ValueError, TypeError):
+            logger.warning("Ignoring malformed event: %s", event)
+
+    async def rebuild(self, engine: AsyncEngine) -> None:
+        """
+        Build a new index from the database and replace the current one with it. Errors are logged, so an unavailable
+        database does not stop the app.
+        :param engine: Async engine of the primary database
+        """
+        with self._lock:
+            self._rebuild_events = []
+        index = type(self)()
+        try:
+            async with engine.connect() as connection:
+                result = await connection.stream(self._rebuild_statement())
+                async for rows in result.partitions(10_000):
+                    for row in rows:
+                        index._add_row(row)
+        except (SQLAlchemyError, OSError):
+            logger.exception("Rebuilding the %s failed", type(self).__name__)
+            with self._lock:
+                self._rebuild_events = None
+            return
+        with self._lock:
+            for rebuild_event in self._rebuild_events:
+                index._apply_event(rebuild_event)
+            self._replace(index)
+            self._rebuild_events = None
+            self.ready = True
+
+    async def run(self, engine: AsyncEngine, interval: float) -> None:
+        """
+        Build the index and rebuild it every interval seconds until cancelled. Started in the background, so building
+        the index does not delay the startup of the app, its users check `ready` until then.
+        :param engine: Async engine of the primary database
+        :param interval: Seconds between rebuilds
+        """
+        while True:
+            await self.rebuild(engine)
+            await asyncio.sleep(interval)
+
+
+# Sends the events of a flush in a single statement. Notifications are transactional, so they are only delivered
+# once the transaction is committed and dropped if it is rolled back
+_notify_events = text(
+    "SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"
+)
+
+
+def _trade_request_event(
+    event_type: str, trade_request: TradeRequest
+) -> dict[str, Any]:
+    return {
+        "type": event_type,
+        "outgoing_plant_id": str(trade_request.outgoing_plant_id),
+        "incoming_plant_id": str(trade_request.incoming_plant_id),
+        "outgoing_user_id": str(trade_request.outgoing_user_id),
+        "incoming_user_id": str(trade_request.incoming_user_id),
+        "status": trade_request.status,
+    }
+
+
+def _plant_created_event(plant: Plant) -> dict[str, Any]:
+    return {
+        "type": "plant_created",
+        "id": str(plant.id),
+        "owner_id": str(plant.owner_id),
+        "tags": plant.tags or [],
+    }
+
+
+def _find_trade_request(session: Session, message: Message) -> TradeRequest | None:
+    """
+    Find the trade request of a message without querying the database, since this runs during a flush. The trade
+    request is either loaded on the message, in the identity map or being inserted with the message.
+    """
+    trade_request = inspect(message).attrs.trade_request.loaded_value  # type: ignore
+    if trade_request is not NO_VALUE and trade_request is not None:
+        return trade_request
+    key = identity_key(
+        TradeRequest, (message.outgoing_plant_id, message.incoming_plant_id)
+    )
+    trade_request = session.identity_map.get(key)
+    if trade_request is not None:
+        return trade_request  # type: ignore
+    for instance in session.new:
+        if (
+            isinstance(instance, TradeRequest)
+            and instance.outgoing_plant_id == message.outgoing_plant_id
+            and instance.incoming_plant_id == message.incoming_plant_id
+        ):
+            return instance
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_events(session: Session, _flush_context) -> None:
+    """
+    Collect the events of new trade requests and messages, status changes and deleted trade requests (and of new and
+    deleted plant ads) of a flush. They are published once the transaction is committed, either locally or to all
+    workers by notifying the listeners (see EVENT_FANOUT). Covers async sessions as well, see _mark_request_as_writing
+    in app.api.dependencies.
+    """
+    events: list[tuple[tuple[uuid.UUID, ...], dict[str, Any]]] = []
+    for instance in session.new:
+        if isinstance(instance, TradeRequest):
+            events.append(
+                (
+                    (instance.outgoing_user_id, instance.incoming_user_id),
+                    _trade_request_event("trade_request_created", instance),
+                )
+            )
+    for instance in session.dirty:
+        if (
+            isinstance(instance, TradeRequest)
+            and inspect(instance).attrs.status.history.has_changes()  # type: ignore
+        ):
+            events.append(
+                (
+                    (instance.outgoing_user_id, instance.incoming_user_id),
+                    _trade_request_event("trade_request_status_changed", instance),
+                )
+            )
+    for instance in session.deleted:
+        if isinstance(instance, TradeRequest):
+            events.append(
+                (
+                    (instance.outgoing_user_id, instance.incoming_user_id),
+                    _trade_request_event("trade_request_deleted", instance),
+                )
+            )
+    # Plant events are not delivered to any user, only to the listeners of the broker (e.g. the tag index)
+    for instance in session.new:
+        if isinstance(instance, Plant):
+            events.append(((), _plant_created_event(instance)))
+    for instance in session.deleted:
+        if isinstance(instance, Plant):
+            events.append(((), {"type": "plant_deleted", "id": str(instance.id)}))
+    for instance in session.new:
+        if isinstance(instance, Message):
+            trade_request = _find_trade_request(session, instance)
+            if trade_request is not None:
+                events.append(
+                    (
+                        (
+                            trade_request.outgoing_user_id,
+                            trade_request.incoming_user_id,
+                        ),
+                        {"type": "message_created", **instance.model_dump(mode="json")},
+                    )
+                )
+    if events:
+        _queue_events(session, events)
+
+
+def _queue_events(
+    session: orm.Session, events: list[tuple[tuple[uuid.UUID, ...], dict[str, Any]]]
+) -> None:
+    """
+    Queue events to be published once the transaction of the session is committed.
+    """
+    if settings.EVENT_FANOUT == "postgres":
+        payloads = [
+            json.dumps(
+                {
+                    "user_ids": [str(user_id) for user_id in user_ids],
+                    "event": queued_event,
+                },
+                # UTF-8 instead of escape sequences, so the payloads stay below the size limit of notifications
+                ensure_ascii=False,
+            )
+            for user_ids, queued_event in events
+        ]
+        session.connection().execute(
+            _notify_events, {"channel": EVENTS_CHANNEL, "payloads": payloads}
+        )
+    else:
+        session.info.setdefault(_PENDING_EVENTS_INFO_KEY, []).extend(events)
+
+
+def collect_trade_request_events(
+    session: orm.Session, event_type: str, trade_requests: Iterable[TradeRequest]
+) -> None:
+    """
+    Collect the events of trade requests inserted or updated by a statement instead of a flush (e.g. INSERT ... ON
+    CONFLICT or a set-based UPDATE), which the session events do not see. They are published once the transaction is
+    committed.
+    :param session: Database session the statement was executed with, e.g. the sync session of an AsyncSession
+    :param event_type: Type of the events, e.g. "trade_request_created"
+    :param trade_requests: Inserted or updated trade requests
+    """
+    events: list[tuple[tuple[uuid.UUID, ...], dict[str, Any]]] = [
+        (
+            (trade_request.outgoing_user_id, trade_request.incoming_user_id),
+            _trade_request_event(event_type, trade_request),
+        )
+        for trade_request in trade_requests
+    ]
+    if events:
+        _queue_events(session, events)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(session: Session) -> None:
+    """
+    Publish the events collected in the committed transaction to the local subscribers.
+    """
+    for user_ids, pending_event in session.info.pop(_PENDING_EVENTS_INFO_KEY, []):
+        event_broker.publish(user_ids, pending_event)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_events(session: Session, previous_transaction) -> None:
+    """
+    Discard the events collected in a transaction which was rolled back. Rolling back a savepoint keeps the events,
+    since the flushes of the savepoint cannot be told apart from the ones of the enclosing transaction.
+    """
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_EVENTS_INFO_KEY, None)
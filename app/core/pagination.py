@@ -0,0 +1,72 @@
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import Callable, Sequence
+from datetime import datetime
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# Functions to parse the values of a cursor back to the types of the columns they belong to
+_PARSERS: dict[type, Callable[[Any], Any]] = {
+    datetime: datetime.fromisoformat,
+    uuid.UUID: uuid.UUID,
+    float: float,
+}
+
+
+def _serialize_cursor_value(value: datetime | uuid.UUID | float) -> str | float:
+    """
+    Serialize a value of a cursor to JSON. Floats (e.g. search ranks) are kept as numbers, so they are restored
+    exactly.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return value
+    return str(value)
+
+
+def encode_cursor(*values: datetime | uuid.UUID | float) -> str:
+    """
+    Encode the sort key of the last row of a page as an opaque cursor token.
+    :param values: Values of the columns the rows are ordered by
+    :return: URL-safe cursor token
+    """
+    serialized = [_serialize_cursor_value(value) for value in values]
+    return base64.urlsafe_b64encode(json.dumps(serialized).encode()).decode()
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> tuple:
+    """
+    Decode a cursor token created by encode_cursor.
+
+    Throws a ValueError if the cursor is malformed or does not match the given types.
+    :param cursor: Cursor token
+    :param types: Types of the columns the rows are ordered by
+    :return: Values of the columns the rows are ordered by
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("Cursor does not match the sort key.")
+        return tuple(_PARSERS[type_](value) for type_, value in zip(types, values))
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def paginate(
+    rows: Sequence[T], limit: int, sort_key: Callable[[T], tuple]
+) -> tuple[list[T], str | None]:
+    """
+    Cut the rows of a page retrieved with limit + 1 down to the limit and create the cursor of the next page.
+    :param rows: Rows retrieved with a limit of limit + 1
+    :param limit: Number of rows per page
+    :param sort_key: Function returning the values of the columns the rows are ordered by
+    :return: Rows of the page and cursor of the next page, None if there is no next page
+    """
+    if limit <= 0 or len(rows) <= limit:
+        return list(rows), None
+    page = list(rows[:limit])
+    return page, encode_cursor(*sort_key(page[-1]))
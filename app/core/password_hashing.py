@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from app.core import security
+from app.core.config import settings
+from app.models import PasswordHashingStatisticsPublic
+
+
+class PasswordHashingUnavailable(Exception):
+    """
+    Raised if a password cannot be hashed or verified right now, since too many password hashing jobs are pending.
+    """
+
+
+class PasswordHashingPool:
+    """
+    Bounded pool of worker threads hashing and verifying passwords with bcrypt, so the CPU heavy hashing does not
+    block the event loop. bcrypt releases the GIL while hashing, so threads do not hold up the request handling and
+    cost no extra memory, unlike worker processes. At most `workers` passwords are hashed at the same time, further
+    jobs are queued up to `max_pending` jobs in total, beyond that jobs are rejected with a PasswordHashingUnavailable,
+    so a burst of logins cannot pile up unbounded latency. With 0 workers, the jobs run in the default thread pool of
+    the event loop instead.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending: int = 0
+        self.max_pending_seen: int = 0
+        self.completed: int = 0
+        self.rejected: int = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor | None:
+        """
+        Get the thread pool, which is started on first use.
+        """
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hashing"
+                )
+            return self._executor
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a function in the pool.
+
+        Throws a PasswordHashingUnavailable if too many jobs are pending.
+        :param function: Function to run
+        :param args: Arguments of the function
+        :return: Result of the function
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHashingUnavailable(
+                    "Too many pending password hashing jobs."
+                )
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            executor = self._get_executor()
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, function, *args
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    async def hash_password(self, password: str) -> str:
+        """
+        Hash a password in the pool.
+
+        Throws a PasswordHashingUnavailable if too many jobs are pending.
+        :param password: Password to be hashed
+        :return: Hashed password as str
+        """
+        return await self._run(security.get_password_hash, password)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Check if plain and hashed password match in the pool.
+
+        Throws a PasswordHashingUnavailable if too many jobs are pending.
+        :param plain_password: Password in plaintext
+        :param hashed_password: Hashed password
+        :return: True if plain password matches hashed password
+        """
+        return await self._run(
+            security.verify_password, plain_password, hashed_password
+        )
+
+    async def verify_and_update_password(
+        self, plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """
+        Check if plain and hashed password match and rehash the password if the hash is outdated in the pool.
+
+        Throws a PasswordHashingUnavailable if too many jobs are pending.
+        :param plain_password: Password in plaintext
+        :param hashed_password: Hashed password
+        :return: True if plain password matches hashed password and the new hash if the password was rehashed,
+        otherwise None
+        """
+        return await self._run(
+            security.verify_and_update_password, plain_password, hashed_password
+        )
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads. The pool is started again on the next job.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_statistics(self) -> PasswordHashingStatisticsPublic:
+        """
+        Collect the current state of the pool.
+        :return: Statistics of the pool as a PasswordHashingStatisticsPublic instance
+        """
+        with self._lock:
+            return PasswordHashingStatisticsPublic(
+                workers=self.workers,
+                max_pending=self.max_pending,
+                pending=self.pending,
+                # Jobs which are not being worked on yet
+                queue_depth=max(self.pending - max(self.workers, 1), 0),
+                max_pending_seen=self.max_pending_seen,
+                completed=self.completed,
+                rejected=self.rejected,
+            )
+
+
+# Pool used to hash and verify passwords from async code
+password_hashing_pool = PasswordHashingPool(
+    settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_MAX_PENDING
+)
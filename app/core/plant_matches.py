@@ -0,0 +1,169 @@
+import heapq
+import uuid
+from collections import Counter, defaultdict
+from typing import Any
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.events import EventIndex, event_broker
+from app.models import Plant, PlantMatchesPublic, PlantMatchPublic
+
+# noinspection Pydantic
+_select_tagged_plants = select(Plant.id, Plant.owner_id, Plant.tags).where(
+    Plant.tags.is_not(None)  # type: ignore
+)
+
+
+class TagIndex(EventIndex):
+    """
+    Inverted index from the tags to the owners of plant ads having them, used to match plant ads by mutually
+    overlapping tags without joining over the tags arrays. It is maintained by the events of created and deleted plant
+    ads (see create_plant and delete_plant_ad).
+    """
+
+    event_types = ("plant_created", "plant_deleted")
+
+    def __init__(self):
+        super().__init__()
+        self._owners_by_tag: dict[str, set[uuid.UUID]] = defaultdict(set)
+        # Owner to the number of their plant ads having each tag
+        self._tags_by_owner: dict[uuid.UUID, Counter[str]] = defaultdict(Counter)
+        self._plants_by_owner: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        # Plant ad to its owner and tags
+        self._plants: dict[uuid.UUID, tuple[uuid.UUID, frozenset[str]]] = {}
+
+    def _add(self, plant_id: uuid.UUID, owner_id: uuid.UUID, tags: list[str]) -> None:
+        self._remove(plant_id)
+        if not tags:
+            return
+        self._plants[plant_id] = (owner_id, frozenset(tags))
+        self._plants_by_owner[owner_id].add(plant_id)
+        for tag in frozenset(tags):
+            self._tags_by_owner[owner_id][tag] += 1
+            self._owners_by_tag[tag].add(owner_id)
+
+    def _remove(self, plant_id: uuid.UUID) -> None:
+        if plant_id not in self._plants:
+            return
+        owner_id, tags = self._plants.pop(plant_id)
+        self._plants_by_owner[owner_id].discard(plant_id)
+        if not self._plants_by_owner[owner_id]:
+            del self._plants_by_owner[owner_id]
+        owner_tags = self._tags_by_owner[owner_id]
+        for tag in tags:
+            owner_tags[tag] -= 1
+            if owner_tags[tag] > 0:
+                continue
+            del owner_tags[tag]
+            self._owners_by_tag[tag].discard(owner_id)
+            if not self._owners_by_tag[tag]:
+                del self._owners_by_tag[tag]
+        if not owner_tags:
+            del self._tags_by_owner[owner_id]
+
+    def _rebuild_statement(self):
+        return _select_tagged_plants
+
+    def _add_row(self, row) -> None:
+        self._add(*row)
+
+    def _apply_event(self, event: dict[str, Any]) -> None:
+        plant_id = uuid.UUID(event["id"])
+        if event["type"] == "plant_created":
+            self._add(plant_id, uuid.UUID(event["owner_id"]), list(event["tags"]))
+        else:
+            self._remove(plant_id)
+
+    def _replace(self, index: "TagIndex") -> None:  # type: ignore[override]
+        self._owners_by_tag = index._owners_by_tag
+        self._tags_by_owner = index._tags_by_owner
+        self._plants_by_owner = index._plants_by_owner
+        self._plants = index._plants
+
+    @property
+    def size(self) -> int:
+        """
+        Number of plant ads with tags in the index.
+        """
+        return len(self._plants)
+
+    def find_matches(
+        self, plant_id: uuid.UUID, limit: int, budget: int
+    ) -> list[tuple[uuid.UUID, int]]:
+        """
+        Find the plant ads of other users whose owners have plant ads sharing tags with a plant ad, ranked by the
+        mutual overlap. The mutual overlap of a plant ad is the number of tags of the plant ad which the owner of the
+        given plant ad has on any of their plant ads, plus the number of tags of the given plant ad which the owner of
+        the plant ad has on any of their plant ads. The owners of the tags are counted starting with the least common
+        tag and the plant ads of the owners starting with the owner sharing the most tags, so the most specific tags
+        and the best owners are counted first if the budget runs out.
+        :param plant_id: id of the plant ad
+        :param limit: Maximum number of plant ads to find
+        :param budget: Maximum number of owners and plant ads to count
+        :return: ids of the plant ads with their mutual overlap, with the largest mutual overlap first
+        """
+        with self._lock:
+            if plant_id not in self._plants:
+                return []
+            owner_id, tags = self._plants[plant_id]
+            # Number of tags of the plant ad each other owner has on their plant ads
+            owner_overlaps: Counter[uuid.UUID] = Counter()
+            for tag in sorted(tags, key=lambda tag: len(self._owners_by_tag[tag])):
+                if len(self._owners_by_tag[tag]) > budget:
+                    break
+                budget -= len(self._owners_by_tag[tag])
+                for other_owner_id in self._owners_by_tag[tag]:
+                    if other_owner_id != owner_id:
+                        owner_overlaps[other_owner_id] += 1
+            own_tags = self._tags_by_owner[owner_id].keys()
+            overlaps: dict[uuid.UUID, int] = {}
+            for other_owner_id, owner_overlap in owner_overlaps.most_common():
+                if len(self._plants_by_owner[other_owner_id]) > budget:
+                    break
+                budget -= len(self._plants_by_owner[other_owner_id])
+                for other_plant_id in self._plants_by_owner[other_owner_id]:
+                    _, other_tags = self._plants[other_plant_id]
+                    overlaps[other_plant_id] = owner_overlap + len(
+                        own_tags & other_tags
+                    )
+        # Ties are broken by the id, so the order is stable
+        return heapq.nlargest(
+            limit, overlaps.items(), key=lambda item: (item[1], item[0])
+        )
+
+    async def match_plants(
+        self, session: AsyncSession, plant: Plant, limit: int, budget: int
+    ) -> PlantMatchesPublic:
+        """
+        Find the plant ads of other users with the largest mutual overlap of tags with a plant ad, see find_matches.
+        The plant ads are loaded with a single query, plant ads which no longer exist are left out.
+        :param session: Async database session
+        :param plant: Plant ad to find matches for
+        :param limit: Maximum number of plant ads to find
+        :param budget: Maximum number of plant ads to count
+        :return: List of plant ads with their mutual overlap as a PlantMatchesPublic instance
+        """
+        matches = self.find_matches(plant.id, limit, budget)
+        plants: dict[uuid.UUID, Plant] = {}
+        if matches:
+            # noinspection Pydantic
+            plants = {
+                matched_plant.id: matched_plant
+                for matched_plant in await session.exec(
+                    select(Plant).where(
+                        Plant.id.in_([plant_id for plant_id, _ in matches])  # type: ignore
+                    )
+                )
+            }
+        data = [
+            PlantMatchPublic(plant=plants[plant_id], overlap=overlap)  # type: ignore
+            for plant_id, overlap in matches
+            if plant_id in plants
+        ]
+        return PlantMatchesPublic(data=data, count=len(data))
+
+
+# Index of the tags of all plant ads, kept up to date by the published plant events
+tag_index = TagIndex()
+event_broker.add_listener(tag_index.apply_event)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, PoolProxiedConnection
+
+from app.models import PoolStatisticsPublic
+
+
+class PoolWaitStatistics:
+    """
+    Thread-safe counters about how long callers had to wait to check out a connection from a pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts: int = 0
+        self.timeouts: int = 0
+        self.total_wait_seconds: float = 0.0
+        self.max_wait_seconds: float = 0.0
+
+    def record_checkout(self, wait_seconds: float) -> None:
+        """
+        Record a successful checkout of a connection.
+        :param wait_seconds: Time it took to obtain the connection in seconds
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def record_timeout(self) -> None:
+        """
+        Record a checkout that failed because the pool limit was reached and the pool timeout exceeded.
+        """
+        with self._lock:
+            self.timeouts += 1
+
+
+class _TimedPoolMixin:
+    """
+    Mixin for queue pools which measures the time it takes to check out a connection. The time includes waiting
+    for a free connection, opening new (overflow) connections and the pre-ping, i.e. the latency a request
+    experiences before its first query can be sent.
+    """
+
+    wait_statistics: PoolWaitStatistics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_statistics = PoolWaitStatistics()
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            connection = super().connect()  # type: ignore[misc]
+        except exc.TimeoutError:
+            self.wait_statistics.record_timeout()
+            raise
+        self.wait_statistics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """
+    QueuePool collecting checkout wait statistics. Used for the sync engine.
+    """
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool collecting checkout wait statistics. Used for the async engine.
+    """
+
+
+def get_pool_statistics(name: str, pool: QueuePool) -> PoolStatisticsPublic:
+    """
+    Collect the current state of a connection pool. Wait statistics are only available for the timed pools above
+    and are reset when the pool is recreated (e.g. when the engine is disposed).
+    :param name: Name to identify the pool in the statistics
+    :param pool: Pool to collect the statistics from
+    :return: Statistics of the pool as a PoolStatisticsPublic instance
+    """
+    wait_statistics = getattr(pool, "wait_statistics", PoolWaitStatistics())
+    checkouts = wait_statistics.checkouts
+    return PoolStatisticsPublic(
+        name=name,
+        size=pool.size(),
+        checked_out=pool.checkedout(),
+        idle=pool.checkedin(),
+        # Negative overflow means that the pool has not yet opened all of its pool_size connections
+        overflow=max(pool.overflow(), 0),
+        max_overflow=pool._max_overflow,
+        checkouts=checkouts,
+        timeouts=wait_statistics.timeouts,
+        average_wait_ms=(
+            wait_statistics.total_wait_seconds / checkouts * 1000 if checkouts else 0.0
+        ),
+        max_wait_ms=wait_statistics.max_wait_seconds * 1000,
+    )
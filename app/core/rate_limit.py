@@ -0,0 +1,218 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+
+
+class RateLimitUnavailable(Exception):
+    """
+    Raised if the rate limit of a request cannot be checked, e.g. since the backend storing the buckets is not
+    reachable. Requests are rejected then instead of passing unlimited.
+    """
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage of token buckets. Buckets start full, lose a token per request and are refilled continuously.
+    """
+
+    @abstractmethod
+    async def consume(self, key: str, capacity: int, refill_per_second: float) -> bool:
+        """
+        Take a token from the bucket with the given key.
+        :param key: Key of the bucket, e.g. name of the limit and IP address
+        :param capacity: Maximum number of tokens in the bucket (burst size)
+        :param refill_per_second: Number of tokens added to the bucket per second
+        :return: True if a token was taken and False if the bucket is empty, i.e. the request is rate limited
+        """
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets in the memory of the worker process. Every worker limits on its own, so with several workers the
+    effective limits are multiplied by the number of workers. The number of buckets is bounded, the least recently
+    used buckets are dropped (i.e. refilled) first.
+    """
+
+    def __init__(self, max_buckets: int = 100_000):
+        self._lock = threading.Lock()
+        # Bucket key to number of tokens and time of the last update
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.max_buckets = max_buckets
+
+    async def consume(self, key: str, capacity: int, refill_per_second: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+# Refills the bucket and takes a token in a single statement, so concurrent requests of several workers cannot take
+# the same token. If the bucket is empty, the WHERE clause prevents the update and no row is returned. Buckets store
+# when they are full again at the latest, so buckets which are equivalent to a missing bucket can be deleted. Buckets
+# which are never refilled have no such time and are kept
+_consume_token = text(
+    """
+    INSERT INTO ratelimitbucket AS bucket (key, tokens, updated_at, full_at)
+    VALUES (
+        :key, :capacity - 1, clock_timestamp(), clock_timestamp() + make_interval(secs => :refill_seconds)
+    )
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = LEAST(
+            :capacity, bucket.tokens + EXTRACT(EPOCH FROM clock_timestamp() - bucket.updated_at) * :rate
+        ) - 1,
+        updated_at = clock_timestamp(),
+        full_at = clock_timestamp() + make_interval(secs => :refill_seconds)
+    WHERE LEAST(
+        :capacity, bucket.tokens + EXTRACT(EPOCH FROM clock_timestamp() - bucket.updated_at) * :rate
+    ) >= 1
+    RETURNING tokens
+    """
+)
+
+_delete_full_buckets = text(
+    "DELETE FROM ratelimitbucket WHERE full_at < clock_timestamp()"
+)
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets in the ratelimitbucket table, shared by all workers and machines using the database. Costs a
+    round trip to the database per request, which is small compared to the password hashing it protects.
+    """
+
+    def __init__(self, engine: AsyncEngine, cleanup_interval: int = 1000):
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._calls = 0
+        self.cleanup_interval = cleanup_interval
+
+    async def consume(self, key: str, capacity: int, refill_per_second: float) -> bool:
+        """
+        Take a token from the bucket with the given key, see RateLimitBackend.consume.
+
+        Throws a RateLimitUnavailable if the database cannot be reached.
+        """
+        with self._lock:
+            self._calls += 1
+            cleanup = self._calls % self.cleanup_interval == 0
+        try:
+            async with self._engine.begin() as connection:
+                result = await connection.execute(
+                    _consume_token,
+                    {
+                        "key": key,
+                        "capacity": capacity,
+                        "rate": refill_per_second,
+                        "refill_seconds": (
+                            capacity / refill_per_second
+                            if refill_per_second > 0
+                            else None
+                        ),
+                    },
+                )
+                allowed = result.first() is not None
+                if cleanup:
+                    await connection.execute(_delete_full_buckets)
+        except (SQLAlchemyError, OSError) as e:
+            raise RateLimitUnavailable(
+                "The rate limit buckets are not available."
+            ) from e
+        return allowed
+
+
+class RateLimit:
+    """
+    Token bucket limit of requests per key (e.g. per IP address or per account).
+    """
+
+    def __init__(self, name: str, capacity: int, per_minute: float):
+        self.name = name
+        self.capacity = capacity
+        self.per_minute = per_minute
+
+    async def hit(self, key: str, backend: RateLimitBackend | None = None) -> bool:
+        """
+        Count a request against the limit.
+
+        Throws a RateLimitUnavailable if the backend is not available.
+        :param key: Key the requests are limited by
+        :param backend: Backend storing the buckets, the configured backend by default
+        :return: True if the request is allowed and False if it is rate limited
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return True
+        return await (backend or get_rate_limit_backend()).consume(
+            f"{self.name}:{key}", self.capacity, self.per_minute / 60
+        )
+
+
+# Limits of the routes hashing passwords. Accounts are identified by the (lower case) email
+login_ip_limit = RateLimit(
+    "login_ip",
+    settings.RATE_LIMIT_LOGIN_IP_CAPACITY,
+    settings.RATE_LIMIT_LOGIN_IP_PER_MINUTE,
+)
+login_account_limit = RateLimit(
+    "login_account",
+    settings.RATE_LIMIT_LOGIN_ACCOUNT_CAPACITY,
+    settings.RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE,
+)
+signup_ip_limit = RateLimit(
+    "signup_ip",
+    settings.RATE_LIMIT_SIGNUP_IP_CAPACITY,
+    settings.RATE_LIMIT_SIGNUP_IP_PER_MINUTE,
+)
+signup_account_limit = RateLimit(
+    "signup_account",
+    settings.RATE_LIMIT_SIGNUP_ACCOUNT_CAPACITY,
+    settings.RATE_LIMIT_SIGNUP_ACCOUNT_PER_MINUTE,
+)
+
+_backend: RateLimitBackend | None = None
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """
+    Get the configured rate limit backend, which is created on first use.
+    :return: In-memory backend or backend shared via Postgres, depending on RATE_LIMIT_BACKEND
+    """
+    global _backend
+    if _backend is None:
+        if settings.RATE_LIMIT_BACKEND == "postgres":
+            # Imported here, so the in-memory backend does not depend on the database engines
+            from app.core.db import async_engine
+
+            _backend = PostgresRateLimitBackend(async_engine)
+        else:
+            _backend = InMemoryRateLimitBackend()
+    return _backend
+
+
+async def is_rate_limited(*hits: tuple[RateLimit, str]) -> bool:
+    """
+    Count a request against several limits, e.g. per IP address and per account. Stops at the first exceeded limit,
+    so a request rejected by the IP address limit does not use up tokens of the account.
+
+    Throws a RateLimitUnavailable if the backend is not available.
+    :param hits: Limits with the key the request is counted for
+    :return: True if any of the limits is exceeded
+    """
+    for limit, key in hits:
+        if not await limit.hit(key):
+            return True
+    return False
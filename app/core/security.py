@@ -1,15 +1,31 @@
+import statistics
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 
 import jwt
 from passlib.context import CryptContext
 from .config import settings
+from app.models import User
 
-# Algorithm used for password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Bounds of the bcrypt cost factor. Costs below 10 are considered too weak, costs above 16 take seconds per hash
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+
+# Algorithm used for password hashing. Hashes created with another cost factor are marked as needing an update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.PASSWORD_HASH_BCRYPT_ROUNDS,
+)
 
 # Algorithm used for JWT encoding
 ALGORITHM = "HS256"
 
+# Version of the claims of access tokens, sent in the "ver" claim. Version 1 tokens (without "ver") carry the email of
+# the user as subject, version 2 tokens the id of the user and the is_active and is_superuser flags
+ACCESS_TOKEN_VERSION = 2
+
 
 def verify_password(plain_password, hashed_password):
     """
@@ -21,6 +37,44 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Check if plain and hashed password match and rehash the password if the hash is outdated (e.g. was created with
+    another cost factor).
+    :param plain_password: Password in plaintext
+    :param hashed_password: Hashed password
+    :return: True if plain password matches hashed password and the new hash if the password was rehashed, otherwise
+    None
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def calibrate_bcrypt_rounds(target_ms: float, samples: int = 3) -> int:
+    """
+    Find the highest bcrypt cost factor for which verifying a password takes at most target_ms on this machine.
+    Each additional round doubles the duration, so costs are measured in increasing order until the target is
+    exceeded. Never returns less than MIN_BCRYPT_ROUNDS, even if that cost exceeds the target.
+    :param target_ms: Target duration of a password verification in milliseconds
+    :param samples: Number of verifications measured per cost, the median is compared with the target
+    :return: Cost factor
+    """
+    rounds = MIN_BCRYPT_ROUNDS
+    for candidate in range(MIN_BCRYPT_ROUNDS, MAX_BCRYPT_ROUNDS + 1):
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=candidate)
+        hashed_password = context.hash("calibration")
+        durations = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            context.verify("calibration", hashed_password)
+            durations.append((time.perf_counter() - start) * 1000)
+        if candidate > MIN_BCRYPT_ROUNDS and statistics.median(durations) > target_ms:
+            break
+        rounds = candidate
+    return rounds
+
+
 def get_password_hash(password):
     """
     Hashes the password
@@ -45,3 +99,36 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def create_user_access_token(user: User, expires_delta: timedelta | None = None):
+    """
+    Create access token for a user carrying the id of the user as subject and the is_active and is_superuser flags,
+    so the user can be looked up by primary key (or not at all if only the id is needed), and a random id (jti), so
+    the token can be revoked.
+    :param user: User to create the access token for
+    :param expires_delta: Duration when the token will expire
+    :return: The encoded JWT token
+    """
+    return create_access_token(
+        data={
+            "sub": str(user.id),
+            "ver": ACCESS_TOKEN_VERSION,
+            "is_active": user.is_active,
+            "is_superuser": user.is_superuser,
+            # Id of the token, so it can be revoked on logout
+            "jti": uuid.uuid4().hex,
+        },
+        expires_delta=expires_delta,
+    )
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Decode and validate an access token.
+
+    Throws an InvalidTokenError if the token is invalid or expired.
+    :param token: The encoded JWT token
+    :return: Claims of the token
+    """
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
@@ -0,0 +1,235 @@
+import uuid
+from collections import defaultdict
+from typing import Any
+
+from sqlalchemy import tuple_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.events import EventIndex, event_broker
+from app.models import (
+    SwapCyclePublic,
+    SwapCyclesPublic,
+    SwapCycleTradeRequestPublic,
+    TradeRequest,
+)
+
+# Cycles of two users are direct trades, which are already possible with a single trade request
+MIN_CYCLE_LENGTH = 3
+
+# Outgoing and incoming user and outgoing and incoming plant of a pending trade request
+TradeRequestKey = tuple[uuid.UUID, uuid.UUID, uuid.UUID, uuid.UUID]
+
+# noinspection Pydantic
+_select_pending_trade_requests = select(
+    TradeRequest.outgoing_user_id,
+    TradeRequest.incoming_user_id,
+    TradeRequest.outgoing_plant_id,
+    TradeRequest.incoming_plant_id,
+).where(TradeRequest.status == 0)
+
+
+class SwapGraph(EventIndex):
+    """
+    Index of the pending trade requests as a directed graph between users, with an edge from the outgoing to the
+    incoming user of every pending trade request, i.e. from a user to the users whose plants they want. Cycles in this
+    graph are swaps between several users. Proposed cycles are checked against the database, so they never contain
+    trade requests which are no longer pending, even if the index missed a change.
+    """
+
+    event_types = (
+        "trade_request_created",
+        "trade_request_status_changed",
+        "trade_request_deleted",
+    )
+
+    def __init__(self):
+        super().__init__()
+        # User to the users whose plants they want, with the plants of the pending trade requests between them
+        self._outgoing: dict[
+            uuid.UUID, dict[uuid.UUID, set[tuple[uuid.UUID, uuid.UUID]]]
+        ] = defaultdict(dict)
+        # User to the users who want their plants
+        self._incoming: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        self.edge_count = 0
+
+    def _add(self, key: TradeRequestKey) -> None:
+        outgoing_user_id, incoming_user_id, outgoing_plant_id, incoming_plant_id = key
+        plants = self._outgoing[outgoing_user_id].setdefault(incoming_user_id, set())
+        if (outgoing_plant_id, incoming_plant_id) not in plants:
+            plants.add((outgoing_plant_id, incoming_plant_id))
+            self._incoming[incoming_user_id].add(outgoing_user_id)
+            self.edge_count += 1
+
+    def _remove(self, key: TradeRequestKey) -> None:
+        outgoing_user_id, incoming_user_id, outgoing_plant_id, incoming_plant_id = key
+        plants = self._outgoing.get(outgoing_user_id, {}).get(incoming_user_id)
+        if plants is None or (outgoing_plant_id, incoming_plant_id) not in plants:
+            return
+        plants.discard((outgoing_plant_id, incoming_plant_id))
+        self.edge_count -= 1
+        if not plants:
+            del self._outgoing[outgoing_user_id][incoming_user_id]
+            if not self._outgoing[outgoing_user_id]:
+                del self._outgoing[outgoing_user_id]
+            self._incoming[incoming_user_id].discard(outgoing_user_id)
+            if not self._incoming[incoming_user_id]:
+                del self._incoming[incoming_user_id]
+
+    def _rebuild_statement(self):
+        return _select_pending_trade_requests
+
+    def _add_row(self, row) -> None:
+        self._add(tuple(row))  # type: ignore
+
+    def _apply_event(self, event: dict[str, Any]) -> None:
+        key = (
+            uuid.UUID(event["outgoing_user_id"]),
+            uuid.UUID(event["incoming_user_id"]),
+            uuid.UUID(event["outgoing_plant_id"]),
+            uuid.UUID(event["incoming_plant_id"]),
+        )
+        if event["type"] != "trade_request_deleted" and event["status"] == 0:
+            self._add(key)
+        else:
+            self._remove(key)
+
+    def _replace(self, index: "SwapGraph") -> None:  # type: ignore[override]
+        self._outgoing = index._outgoing
+        self._incoming = index._incoming
+        self.edge_count = index.edge_count
+
+    def _distances_to(
+        self, user_id: uuid.UUID, max_distance: int, budget: int
+    ) -> tuple[dict[uuid.UUID, int], int]:
+        """
+        Breadth-first search on the reversed edges for the users which want plants leading to the given user within
+        max_distance steps.
+        :return: Users with their distance and the remaining search budget
+        """
+        distances = {user_id: 0}
+        frontier = [user_id]
+        for distance in range(1, max_distance + 1):
+            next_frontier = []
+            for user in frontier:
+                for previous_user in self._incoming.get(user, ()):
+                    budget -= 1
+                    if previous_user not in distances:
+                        distances[previous_user] = distance
+                        next_frontier.append(previous_user)
+                if budget <= 0:
+                    return distances, budget
+            frontier = next_frontier
+        return distances, budget
+
+    def find_cycles(
+        self, user_id: uuid.UUID, max_length: int, limit: int, budget: int
+    ) -> tuple[list[list[TradeRequestKey]], bool]:
+        """
+        Find cycles of pending trade requests involving a user, with MIN_CYCLE_LENGTH to max_length users. The
+        depth-first search from the user only follows users from which the user can be reached again within the
+        remaining length (determined by a breadth-first search backwards from the user first), so it does not explore
+        the graph beyond the cycles. Both searches together visit at most budget edges.
+        :param user_id: id of the user
+        :param max_length: Maximum number of users in a cycle
+        :param limit: Maximum number of cycles to find
+        :param budget: Maximum number of edges to visit
+        :return: Cycles as lists of trade requests starting with one of the user and whether the search was complete
+        """
+        with self._lock:
+            distances, budget = self._distances_to(user_id, max_length - 1, budget)
+            cycles: list[list[uuid.UUID]] = []
+            path = [user_id]
+            on_path = {user_id}
+
+            def search(user: uuid.UUID) -> None:
+                nonlocal budget
+                for next_user in self._outgoing.get(user, {}):
+                    if len(cycles) >= limit or budget <= 0:
+                        return
+                    budget -= 1
+                    if next_user == user_id:
+                        if len(path) >= MIN_CYCLE_LENGTH:
+                            cycles.append(list(path))
+                    elif (
+                        next_user not in on_path
+                        and len(path) + distances.get(next_user, max_length)
+                        <= max_length
+                    ):
+                        path.append(next_user)
+                        on_path.add(next_user)
+                        search(next_user)
+                        on_path.discard(path.pop())
+
+            search(user_id)
+            complete = budget > 0 and len(cycles) < limit
+            return [self._trade_requests(cycle) for cycle in cycles], complete
+
+    def _trade_requests(self, cycle: list[uuid.UUID]) -> list[TradeRequestKey]:
+        """
+        Pick a pending trade request for every step of a cycle of users.
+        """
+        trade_requests = []
+        for user, next_user in zip(cycle, cycle[1:] + cycle[:1]):
+            outgoing_plant_id, incoming_plant_id = min(self._outgoing[user][next_user])
+            trade_requests.append(
+                (user, next_user, outgoing_plant_id, incoming_plant_id)
+            )
+        return trade_requests
+
+    async def propose_cycles(
+        self,
+        session: AsyncSession,
+        user_id: uuid.UUID,
+        max_length: int,
+        limit: int,
+        budget: int,
+    ) -> SwapCyclesPublic:
+        """
+        Find swap cycles involving a user, see find_cycles. The trade requests of the cycles are checked to still be
+        pending with a single query, stale ones are removed from the index and their cycles left out.
+        :param session: Async database session
+        :param user_id: id of the user
+        :param max_length: Maximum number of users in a cycle
+        :param limit: Maximum number of cycles to propose
+        :param budget: Maximum number of edges to visit
+        :return: List of cycles with number of cycles as a SwapCyclesPublic instance
+        """
+        cycles, complete = self.find_cycles(user_id, max_length, limit, budget)
+        keys = {key for cycle in cycles for key in cycle}
+        pending: set[TradeRequestKey] = set()
+        if keys:
+            # noinspection PyTypeChecker
+            rows = await session.exec(
+                _select_pending_trade_requests.where(
+                    tuple_(
+                        TradeRequest.outgoing_plant_id,  # type: ignore
+                        TradeRequest.incoming_plant_id,  # type: ignore
+                    ).in_([(key[2], key[3]) for key in keys])
+                )
+            )
+            pending = {tuple(row) for row in rows.all()}  # type: ignore
+        with self._lock:
+            for key in keys - pending:
+                self._remove(key)
+        data = [
+            SwapCyclePublic(
+                trade_requests=[
+                    SwapCycleTradeRequestPublic(
+                        outgoing_user_id=key[0],
+                        incoming_user_id=key[1],
+                        outgoing_plant_id=key[2],
+                        incoming_plant_id=key[3],
+                    )
+                    for key in cycle
+                ]
+            )
+            for cycle in cycles
+            if pending.issuperset(cycle)
+        ]
+        return SwapCyclesPublic(data=data, count=len(data), complete=complete)
+
+
+# Index of the pending trade requests of all users, kept up to date by the published trade request events
+swap_graph = SwapGraph()
+event_broker.add_listener(swap_graph.apply_event)
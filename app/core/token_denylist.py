@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import CacheStatisticsPublic, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# Revocations are picked up from this long before the latest known revocation, since the revocation time is set when
+# the transaction starts and a revocation might be committed after later ones
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """
+    Set of strings with false positives but without false negatives, using a fixed amount of memory. Positions of an
+    item are derived from a single blake2b digest using double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> list[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        # Odd step, so the positions do not repeat
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item to the filter. Only items which were not in the filter yet are counted, so adding an item again
+        does not fill up the filter.
+        :param item: Item to add
+        :return: True if the item was not in the filter yet
+        """
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class TokenDenylist:
+    """
+    Denylist of access tokens revoked on logout. Revocations are stored in the revokedtoken table and every worker
+    keeps a bloom filter of the revoked token ids, so checking a token which was not revoked does not query the
+    database. Only tokens matching the filter (revoked tokens and false positives) are looked up.
+    The filter is rebuilt from the table on startup (and when it is over capacity) and refreshed incrementally in the
+    background, so tokens revoked by other workers are rejected after at most the refresh interval. Until the filter
+    has been built, every token is looked up.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate)
+        self._latest_revoked_at: datetime | None = None
+        # Revocations within REFRESH_OVERLAP of the latest one, which the next refresh selects again
+        self._recent_revocations: dict[str, datetime] = {}
+        self.ready = False
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def add(self, jti: str) -> None:
+        """
+        Add a revoked token to the filter of this worker.
+        :param jti: Id of the token
+        """
+        self._filter.add(jti)
+
+    async def is_revoked(self, session: AsyncSession, jti: str) -> bool:
+        """
+        Check whether a token was revoked. Only queries the database if the token matches the filter. Lookups before
+        the filter was built are not counted as hits, so the statistics only describe the filter.
+        :param session: Async database session
+        :param jti: Id of the token
+        :return: True if the token was revoked
+        """
+        if self.ready:
+            if jti not in self._filter:
+                self.misses += 1
+                return False
+            self.hits += 1
+        return await session.get(RevokedToken, jti) is not None
+
+    async def revoke(
+        self, session: AsyncSession, jti: str, expires_at: datetime
+    ) -> None:
+        """
+        Revoke a token until it expires.
+        :param session: Async database session
+        :param jti: Id of the token
+        :param expires_at: Expiry of the token, after which the revocation is deleted
+        """
+        await session.execute(
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing()
+        )
+        await session.commit()
+        self.add(jti)
+
+    def _add_revocations(self, rows) -> None:
+        for jti, revoked_at in rows:
+            if jti in self._recent_revocations:
+                continue
+            self._filter.add(jti)
+            self._recent_revocations[jti] = revoked_at
+            if self._latest_revoked_at is None or revoked_at > self._latest_revoked_at:
+                self._latest_revoked_at = revoked_at
+        if self._latest_revoked_at is not None:
+            overlap_start = self._latest_revoked_at - REFRESH_OVERLAP
+            self._recent_revocations = {
+                jti: revoked_at
+                for jti, revoked_at in self._recent_revocations.items()
+                if revoked_at >= overlap_start
+            }
+
+    async def rebuild(self, session: AsyncSession) -> None:
+        """
+        Delete the expired revocations and build a new filter of the remaining ones, sized for at least twice their
+        number.
+        :param session: Async database session
+        """
+        await session.exec(
+            delete(RevokedToken).where(RevokedToken.expires_at <= func.now())  # type: ignore
+        )
+        await session.commit()
+        rows = (
+            await session.exec(select(RevokedToken.jti, RevokedToken.revoked_at))
+        ).all()
+        denylist = TokenDenylist(max(self.capacity, 2 * len(rows)), self.error_rate)
+        denylist._add_revocations(rows)
+        self._filter = denylist._filter
+        self._latest_revoked_at = denylist._latest_revoked_at
+        self._recent_revocations = denylist._recent_revocations
+        self.ready = True
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """
+        Add the revocations since the last refresh (of any worker) to the filter. Revocations selected again because of
+        the REFRESH_OVERLAP are skipped.
+        :param session: Async database session
+        """
+        statement = select(RevokedToken.jti, RevokedToken.revoked_at).where(
+            RevokedToken.expires_at > func.now()  # type: ignore
+        )
+        if self._latest_revoked_at is not None:
+            statement = statement.where(
+                RevokedToken.revoked_at >= self._latest_revoked_at - REFRESH_OVERLAP  # type: ignore
+            )
+        self._add_revocations((await session.exec(statement)).all())
+
+    async def update(self, engine: AsyncEngine) -> None:
+        """
+        Rebuild the filter if it has not been built yet or is over capacity, otherwise refresh it. Errors are logged,
+        so an unavailable database does not stop the app.
+        :param engine: Async engine of the primary database
+        """
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                if not self.ready or self._filter.count > self._filter.capacity:
+                    await self.rebuild(session)
+                else:
+                    await self.refresh(session)
+        except (SQLAlchemyError, OSError):
+            logger.exception("Updating the token denylist failed")
+
+    async def run(self, engine: AsyncEngine, interval: float) -> None:
+        """
+        Update the filter every interval seconds until cancelled.
+        :param engine: Async engine of the primary database
+        :param interval: Seconds between updates
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.update(engine)
+
+    def get_statistics(self, name: str) -> CacheStatisticsPublic:
+        """
+        Collect the current state of the filter. Hits are tokens matching the filter, which are looked up.
+        :param name: Name to identify the filter in the statistics
+        :return: Statistics of the filter as a CacheStatisticsPublic instance
+        """
+        return CacheStatisticsPublic(
+            name=name,
+            size=self._filter.count,
+            max_size=self._filter.capacity,
+            hits=self.hits,
+            misses=self.misses,
+        )
+
+
+# Denylist of the access tokens revoked on logout, checked by the dependencies resolving the current user
+token_denylist = TokenDenylist(
+    settings.TOKEN_DENYLIST_CAPACITY, settings.TOKEN_DENYLIST_ERROR_RATE
+)
@@ -0,0 +1,144 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import User, CacheStatisticsPublic
+
+
+class UserCache:
+    """
+    Thread-safe, bounded LRU cache of user records with a time to live, keyed by the subject of access tokens.
+    Only the column values are cached, every lookup returns a new detached User instance, which can be attached to
+    the session of the request using session.merge(user, load=False) without querying the database.
+    The cache is local to the worker process, so other workers only see changes to a user after the time to live.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: str) -> User | None:
+        """
+        Get the cached user for the given token subject.
+        :param key: Subject of the access token
+        :return: Detached user instance if the user is cached and the entry did not expire, otherwise None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            values = entry[1]
+        user = User.model_validate(values)
+        make_transient_to_detached(user)
+        return user
+
+    def set(self, key: str, user: User) -> None:
+        """
+        Cache the column values of a user, evicting the least recently used user if the cache is full.
+        :param key: Subject of the access token
+        :param user: User to be cached
+        """
+        if self.max_size <= 0:
+            return
+        values = {
+            column.key: getattr(user, column.key)
+            for column in User.__table__.columns  # type: ignore
+        }
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: uuid.UUID) -> None:
+        """
+        Remove all cached entries of a user. Scans the cache, which is bounded and only done when a user changes.
+        :param user_id: id of the user
+        """
+        with self._lock:
+            for key in [
+                key
+                for key, (_, values) in self._entries.items()
+                if values["id"] == user_id
+            ]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        Remove all cached entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def get_statistics(self, name: str) -> CacheStatisticsPublic:
+        """
+        Collect the current state of the cache.
+        :param name: Name to identify the cache in the statistics
+        :return: Statistics of the cache as a CacheStatisticsPublic instance
+        """
+        with self._lock:
+            return CacheStatisticsPublic(
+                name=name,
+                size=len(self._entries),
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+            )
+
+
+# Cache of the users resolved from access tokens by get_current_user
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+
+# Key in the session info under which the ids of the users changed in the current transaction are collected
+_CHANGED_USER_IDS_INFO_KEY = "changed_user_ids"
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _collect_changed_user(_mapper, _connection, user: User) -> None:
+    """
+    Collect the users updated (e.g. deactivated) or deleted through the ORM, which are removed from the cache once the
+    transaction is committed. Covers async sessions as well, see _mark_request_as_writing in app.api.dependencies.
+    """
+    session = object_session(user)
+    if session is not None:
+        session.info.setdefault(_CHANGED_USER_IDS_INFO_KEY, set()).add(user.id)
+    else:
+        user_cache.invalidate_user(user.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    """
+    Remove the users changed in the committed transaction from the cache. This is not done during the flush, since a
+    concurrent request could cache the old values again before the transaction is committed.
+    """
+    for user_id in session.info.pop(_CHANGED_USER_IDS_INFO_KEY, ()):
+        user_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changed_users(session: Session, previous_transaction) -> None:
+    """
+    Forget the users changed in a transaction which was rolled back, they are unchanged in the database. Rolling back a
+    savepoint keeps them, since its flushes cannot be told apart from the ones of the enclosing transaction.
+    """
+    if not previous_transaction.nested:
+        session.info.pop(_CHANGED_USER_IDS_INFO_KEY, None)
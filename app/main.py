@@ -1,18 +1,65 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
 
 from .api.main import api_router
 from .core.config import settings
-from .core.db import init_db, engine
+from .api.dependencies import READ_PRIMARY_COOKIE_NAME
+from .core.db import init_db_on_startup, async_engine, async_read_engine
 from .core.images import set_cloudinary_config
+from .core.password_hashing import password_hashing_pool
+from .core.events import event_listener
+from .core.plant_matches import tag_index
+from .core.swap_cycles import swap_graph
+from .core.token_denylist import token_denylist
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Initialize the database, this is skipped if the schema is current. Runs in a worker thread, since the migration
+    # and hashing the password of the admin user would block the event loop
+    if settings.INIT_DB_ON_STARTUP:
+        await run_in_threadpool(init_db_on_startup)
+    # Build the filter of revoked access tokens and keep it up to date with the revocations of other workers
+    await token_denylist.update(async_engine)
+    denylist_task = asyncio.create_task(
+        token_denylist.run(async_engine, settings.TOKEN_DENYLIST_REFRESH_SECONDS)
+    )
+    # Dispatch the events of all workers to the WebSocket connections and indexes of this worker
+    event_listener_task = (
+        await event_listener.start() if settings.EVENT_FANOUT == "postgres" else None
+    )
+    # Build the indexes of the pending trade requests (swap proposals) and of the tags of the plant ads (plant ad
+    # matches), which the events keep up to date. They are built in the background, so a large table does not delay
+    # the startup; the routes using them return 503 until they are ready
+    swap_graph_task = asyncio.create_task(
+        swap_graph.run(async_engine, settings.SWAP_CYCLES_REBUILD_SECONDS)
+    )
+    tag_index_task = asyncio.create_task(
+        tag_index.run(async_engine, settings.PLANT_MATCHES_REBUILD_SECONDS)
+    )
+    yield
+    for task in (denylist_task, event_listener_task, swap_graph_task, tag_index_task):
+        if task is not None:
+            task.cancel()
+            # Wait for the task to stop, so it does not use connections of the engine disposed below
+            with suppress(asyncio.CancelledError):
+                await task
+    password_hashing_pool.shutdown()
+    # Close the pooled async connections, since they are bound to the event loop that is shutting down
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
 
 # Initialize the FastAPI app
-app = FastAPI(title="PlantSwap")
+app = FastAPI(title="PlantSwap", lifespan=lifespan)
 
 
 @app.exception_handler(RequestValidationError)
@@ -43,10 +90,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def read_your_writes_middleware(request: Request, call_next):
+    """
+    Make clients which just wrote to the primary read from the primary for a while, see get_async_read_db.
+    """
+    response = await call_next(request)
+    if getattr(request.state, "committed_to_primary", False):
+        response.set_cookie(
+            key=READ_PRIMARY_COOKIE_NAME,
+            value="1",
+            httponly=True,
+            max_age=settings.POSTGRES_REPLICA_STICKINESS_SECONDS,
+            secure=True,
+            samesite="none",
+            domain=f".{settings.DOMAIN}",
+        )
+    return response
+
+
 # Include the API endpoints specified in /api/routers/...
 app.include_router(api_router)
-# Initialize the database
-init_db(Session(engine))
 # Set cloudinary config
 if settings.USE_IMAGE_UPLOAD:
     set_cloudinary_config()
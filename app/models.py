@@ -1,10 +1,19 @@
 import uuid
 from datetime import datetime
-
-from pydantic import BaseModel, EmailStr
-from sqlalchemy import String, ForeignKeyConstraint
+from typing import Annotated
+
+from pydantic import BaseModel, EmailStr, StringConstraints
+from sqlalchemy import (
+    String,
+    DateTime,
+    ForeignKeyConstraint,
+    Index,
+    Computed,
+    func,
+    text,
+)
 from sqlalchemy.orm import RelationshipProperty
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from sqlmodel import SQLModel, Field, Relationship, Column
 
 
@@ -25,6 +34,11 @@ class UserPublic(UserBase):
 class UsersPublic(SQLModel):
     data: list[UserPublic]
     count: int
+    # Cursor to retrieve the next page, None if this is the last page
+    next_cursor: str | None = None
+    # Total number of rows of the listing (not only of this page) and whether it is a planner estimate
+    total: int | None = None
+    total_is_estimate: bool = False
 
 
 # User properties to receive via API on creation
@@ -36,6 +50,9 @@ class UserCreate(UserBase):
 class User(UserBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    creation_date: datetime = Field(default_factory=datetime.now)
+    # Composite index for the keyset (cursor) pagination of the user listing
+    __table_args__ = (Index("ix_user_creation_date_id", "creation_date", "id"),)
     plants: list["Plant"] = Relationship(back_populates="owner", cascade_delete=True)
     incoming_requests: list["TradeRequest"] = Relationship(
         sa_relationship=RelationshipProperty(
@@ -63,9 +80,17 @@ class PlantBase(SQLModel):
     city: str = Field(min_length=1, max_length=255)
 
 
+# Maximum number of tags of a plant ad and length of a tag. Keeps the event of a new plant ad (see app.core.events)
+# below the size limit of Postgres notifications (8000 bytes)
+MAX_PLANT_TAGS = 20
+MAX_PLANT_TAG_LENGTH = 50
+
+
 # Properties to receive on plant creation
 class PlantCreate(PlantBase):
-    pass
+    tags: list[Annotated[str, StringConstraints(max_length=MAX_PLANT_TAG_LENGTH)]] = (
+        Field(default=[], max_length=MAX_PLANT_TAGS)
+    )
 
 
 # Plant database model
@@ -74,7 +99,22 @@ class Plant(PlantBase, table=True):
     name: str = Field(max_length=255)
     description: str = Field(max_length=255)
     city: str = Field(max_length=255)
-    creation_date: datetime = Field(default=datetime.now())
+    creation_date: datetime = Field(default_factory=datetime.now)
+    # Composite indexes for the keyset (cursor) pagination of all plants, of the plants of a user and of the plants
+    # in a city (case-insensitive). The GIN index on the tags serves the any/all tag filters
+    __table_args__ = (
+        Index("ix_plant_creation_date_id", "creation_date", "id"),
+        Index("ix_plant_owner_id_creation_date_id", "owner_id", "creation_date", "id"),
+        Index(
+            "ix_plant_lower_city_creation_date_id",
+            func.lower(text("city")),
+            "creation_date",
+            "id",
+        ),
+        Index("ix_plant_tags", "tags", postgresql_using="gin"),
+        # The trigram indexes on name and city for the fuzzy search depend on the pg_trgm extension and are only
+        # created by the migrations (see app.core.db.MIGRATIONS)
+    )
     # Foreign key to owner of plant. Indexed to be able to search all plants of a specific user more efficiently
     owner_id: uuid.UUID = Field(
         foreign_key="user.id", nullable=False, ondelete="CASCADE", index=True
@@ -103,6 +143,26 @@ class Plant(PlantBase, table=True):
     )
 
 
+# Weighted full-text search document of a plant ad (name A, description B), generated by the database. It is added to
+# the table but not mapped on the model, so it is not loaded with every plant ad and only used by the plant search
+PLANT_SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+Plant.__table__.append_column(  # type: ignore
+    Column(
+        "search_vector",
+        TSVECTOR,
+        Computed(PLANT_SEARCH_VECTOR_EXPRESSION, persisted=True),
+    )
+)
+Index(
+    "ix_plant_search_vector",
+    Plant.__table__.c.search_vector,  # type: ignore
+    postgresql_using="gin",
+)
+
+
 # Plant properties to return via API, id is always required
 class PlantPublic(PlantBase):
     id: uuid.UUID
@@ -117,6 +177,24 @@ class PlantPublic(PlantBase):
 class PlantsPublic(SQLModel):
     data: list[PlantPublic]
     count: int
+    # Cursor to retrieve the next page, None if this is the last page
+    next_cursor: str | None = None
+    # Total number of rows of the listing (not only of this page) and whether it is a planner estimate
+    total: int | None = None
+    total_is_estimate: bool = False
+
+
+# Plant ad of another user sharing tags with a plant ad
+class PlantMatchPublic(SQLModel):
+    plant: PlantPublic
+    # Mutual overlap, the number of tags of each plant ad which the owner of the other one has on their plant ads
+    overlap: int
+
+
+# Class to return the plant ads matching a plant ad, with the largest mutual overlap first
+class PlantMatchesPublic(SQLModel):
+    data: list[PlantMatchPublic]
+    count: int
 
 
 # Link model (table) for many-to-many relationship of incoming and outgoing trade requests
@@ -175,9 +253,47 @@ class TradeRequest(SQLModel, table=True):
     )
     # 0 = pending, 1 = accepted, 2 = rejected
     status: int = Field(default=0)
+    creation_date: datetime = Field(default_factory=datetime.now)
+    # Composite indexes for the keyset (cursor) pagination of the outgoing and incoming requests of a user. The unique
+    # index on the unordered pair of plants allows at most one trade request between two plants, in either direction
+    __table_args__ = (
+        Index(
+            "ix_traderequest_plant_pair",
+            func.least(text("outgoing_plant_id"), text("incoming_plant_id")),
+            func.greatest(text("outgoing_plant_id"), text("incoming_plant_id")),
+            unique=True,
+        ),
+        Index(
+            "ix_traderequest_outgoing_user_id_creation_date",
+            "outgoing_user_id",
+            "creation_date",
+            "outgoing_plant_id",
+            "incoming_plant_id",
+        ),
+        Index(
+            "ix_traderequest_incoming_user_id_creation_date",
+            "incoming_user_id",
+            "creation_date",
+            "outgoing_plant_id",
+            "incoming_plant_id",
+        ),
+        # Pending trade requests of a plant, which are rejected when another trade request of the plant is accepted
+        Index(
+            "ix_traderequest_pending_outgoing_plant_id",
+            "outgoing_plant_id",
+            postgresql_where=text("status = 0"),
+        ),
+        Index(
+            "ix_traderequest_pending_incoming_plant_id",
+            "incoming_plant_id",
+            postgresql_where=text("status = 0"),
+        ),
+    )
     messages: list["Message"] = Relationship(
         back_populates="trade_request",
         cascade_delete=True,
+        # Chronological order of the conversation, backed by the index on Message
+        sa_relationship_kwargs={"order_by": "[Message.timestamp, Message.id]"},
     )
 
 
@@ -190,18 +306,35 @@ class TradeRequestPublic(SQLModel):
     outgoing_plant: Plant
     incoming_plant: Plant
     status: int
-    messages: list["Message"]
+    # None if the messages were left out of the payload (include_messages=false)
+    messages: list["Message"] | None
+
+
+# Trade request which was accepted, with the number of other pending trade requests of its plants which were rejected
+class TradeRequestAcceptedPublic(TradeRequestPublic):
+    rejected_count: int
 
 
 # Class to return multiple TradeRequest instances at the same time
 class TradeRequestsPublic(SQLModel):
     data: list[TradeRequestPublic]
     count: int
+    # Cursor to retrieve the next page, None if this is the last page
+    next_cursor: str | None = None
+    # Total number of rows of the listing (not only of this page) and whether it is a planner estimate
+    total: int | None = None
+    total_is_estimate: bool = False
 
 
-# Token data class for JWT Encoding
+# Token data class for JWT Encoding. Version 1 tokens only carry the email, version 2 tokens the id and flags of the user
 class TokenData(BaseModel):
     email: str | None = None
+    user_id: uuid.UUID | None = None
+    is_active: bool = True
+    is_superuser: bool = False
+    # Id and expiry of the token, used to revoke it. Tokens issued before ids were added cannot be revoked
+    jti: str | None = None
+    expires_at: datetime | None = None
 
 
 # Session token used with OAuth2
@@ -226,9 +359,130 @@ class Message(SQLModel, table=True):
             ["traderequest.incoming_plant_id", "traderequest.outgoing_plant_id"],
             ondelete="CASCADE",
         ),
+        # Keyset (cursor) pagination of the messages of a trade request
+        Index(
+            "ix_message_trade_request_timestamp_id",
+            "incoming_plant_id",
+            "outgoing_plant_id",
+            "timestamp",
+            "id",
+        ),
     )
 
     # Relationship to TradeRequest with cascade behavior
     trade_request: "TradeRequest" = Relationship(
         back_populates="messages",
     )
+
+
+# Class to return a page of the messages of a trade request
+class MessagesPublic(SQLModel):
+    data: list[Message]
+    count: int
+    # Cursor to retrieve the next page, None if this is the last page
+    next_cursor: str | None = None
+
+
+# Pending trade request which is part of a swap cycle
+class SwapCycleTradeRequestPublic(SQLModel):
+    outgoing_user_id: uuid.UUID
+    incoming_user_id: uuid.UUID
+    outgoing_plant_id: uuid.UUID
+    incoming_plant_id: uuid.UUID
+
+
+# Swap between three or more users formed by pending trade requests, each wanting a plant of the next user. Every user
+# gets the incoming plant of their trade request and gives the incoming plant of the trade request of the previous user
+class SwapCyclePublic(SQLModel):
+    trade_requests: list[SwapCycleTradeRequestPublic]
+
+
+# Class to return the swap cycles proposed to a user
+class SwapCyclesPublic(SQLModel):
+    data: list[SwapCyclePublic]
+    count: int
+    # False if the search was cut short (by the limit or the search budget), so further cycles might exist
+    complete: bool
+
+
+# State of a database connection pool, used to size the pools against the connection limit of the database
+class PoolStatisticsPublic(SQLModel):
+    name: str
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    max_overflow: int
+    checkouts: int
+    timeouts: int
+    average_wait_ms: float
+    max_wait_ms: float
+
+
+# Class to return the statistics of multiple connection pools at the same time
+class PoolsStatisticsPublic(SQLModel):
+    data: list[PoolStatisticsPublic]
+    count: int
+
+
+# State of an in-process cache, used to judge whether the cache is sized well
+class CacheStatisticsPublic(SQLModel):
+    name: str
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+
+
+# Class to return the statistics of multiple caches at the same time
+class CachesStatisticsPublic(SQLModel):
+    data: list[CacheStatisticsPublic]
+    count: int
+
+
+# State of the pool of threads hashing passwords, used to size the pool
+class PasswordHashingStatisticsPublic(SQLModel):
+    workers: int
+    max_pending: int
+    pending: int
+    queue_depth: int
+    max_pending_seen: int
+    completed: int
+    rejected: int
+
+
+# Version of the database schema, used to only bootstrap/migrate the database if it is not current
+class SchemaVersion(SQLModel, table=True):
+    version: int = Field(primary_key=True)
+
+
+# Number of plant ads and trade requests (by direction and status) of a user. Maintained by database triggers, so
+# list responses can report exact totals without counting the rows of the user on every request
+class RowCount(SQLModel, table=True):
+    # "plant", "outgoing_request" or "incoming_request"
+    scope: str = Field(primary_key=True, max_length=32)
+    owner_id: uuid.UUID = Field(primary_key=True)
+    # Status of the trade requests, always 0 for plants
+    status: int = Field(default=0, primary_key=True)
+    count: int = Field(default=0)
+
+
+# Token bucket of a rate limit shared by all workers (see app.core.rate_limit.PostgresRateLimitBackend)
+class RateLimitBucket(SQLModel, table=True):
+    key: str = Field(primary_key=True, max_length=320)
+    tokens: float
+    updated_at: datetime
+    # Time at which the bucket is full again at the latest, afterwards it can be deleted. None if it is never refilled
+    full_at: datetime | None = Field(default=None, index=True)
+
+
+# Access token revoked on logout. Kept until the token expires (see app.core.token_denylist)
+class RevokedToken(SQLModel, table=True):
+    jti: str = Field(primary_key=True, max_length=64)
+    expires_at: datetime = Field(sa_type=DateTime(timezone=True), index=True)  # type: ignore
+    revoked_at: datetime = Field(
+        sa_type=DateTime(timezone=True),  # type: ignore
+        sa_column_kwargs={"server_default": func.now()},
+        default=None,
+        index=True,
+    )
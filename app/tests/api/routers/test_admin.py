@@ -0,0 +1,95 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, create_engine
+
+from app.core.config import settings
+from app.tests.utils.users import create_random_user
+
+
+def test_read_pool_statistics_superuser(
+    client: TestClient, superuser_auth_cookie: tuple[str, str]
+) -> None:
+    response = client.get("/admin/pools", cookies=[superuser_auth_cookie])
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["count"] == 2
+    pools = {pool["name"]: pool for pool in json_response["data"]}
+    assert set(pools.keys()) == {"sync", "async"}
+    async_pool = pools["async"]
+    assert async_pool["size"] == settings.POSTGRES_POOL_SIZE
+    assert async_pool["max_overflow"] == settings.POSTGRES_POOL_MAX_OVERFLOW
+    assert async_pool["checkouts"] >= 1
+    assert async_pool["timeouts"] == 0
+    assert async_pool["max_wait_ms"] >= async_pool["average_wait_ms"] >= 0
+
+
+def test_read_pool_statistics_random_user(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (_, _, auth_cookie):
+        response = client.get("/admin/pools", cookies=[auth_cookie])
+        assert response.status_code == 401
+        assert response.json() == {
+            "detail": "You are not authorized to view the database statistics."
+        }
+
+
+def test_read_pool_statistics_with_replica(
+    client: TestClient, superuser_auth_cookie: tuple[str, str]
+) -> None:
+    replica_engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    with patch("app.api.routers.admin.async_read_engine", replica_engine):
+        response = client.get("/admin/pools", cookies=[superuser_auth_cookie])
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["count"] == 3
+    assert json_response["data"][2]["name"] == "replica"
+    replica_engine.dispose()
+
+
+def test_read_cache_statistics_superuser(
+    client: TestClient, superuser_auth_cookie: tuple[str, str]
+) -> None:
+    client.get("/users/me", cookies=[superuser_auth_cookie])
+    response = client.get("/admin/caches", cookies=[superuser_auth_cookie])
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["count"] == 2
+    user_cache_statistics = json_response["data"][0]
+    assert user_cache_statistics["name"] == "users"
+    assert user_cache_statistics["max_size"] == settings.USER_CACHE_SIZE
+    assert user_cache_statistics["size"] >= 1
+    assert user_cache_statistics["hits"] >= 1
+    assert json_response["data"][1]["name"] == "revoked_tokens"
+
+
+def test_read_cache_statistics_random_user(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (_, _, auth_cookie):
+        response = client.get("/admin/caches", cookies=[auth_cookie])
+        assert response.status_code == 401
+        assert response.json() == {
+            "detail": "You are not authorized to view the cache statistics."
+        }
+
+
+def test_read_password_hashing_statistics_superuser(
+    client: TestClient, superuser_auth_cookie: tuple[str, str]
+) -> None:
+    response = client.get("/admin/password-hashing", cookies=[superuser_auth_cookie])
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["workers"] == settings.PASSWORD_HASHING_WORKERS
+    assert json_response["max_pending"] == settings.PASSWORD_HASHING_MAX_PENDING
+    # The login of the superuser verified the password in the pool
+    assert json_response["completed"] >= 1
+    assert json_response["queue_depth"] == 0
+
+
+def test_read_password_hashing_statistics_random_user(
+    client: TestClient, db: Session
+) -> None:
+    with create_random_user(client, db) as (_, _, auth_cookie):
+        response = client.get("/admin/password-hashing", cookies=[auth_cookie])
+        assert response.status_code == 401
+        assert response.json() == {
+            "detail": "You are not authorized to view the password hashing statistics."
+        }
@@ -1,9 +1,15 @@
+from unittest.mock import patch
+
 from fastapi.testclient import TestClient
+from passlib.context import CryptContext
 from sqlmodel import Session
 
 from app.api.dependencies import ACCESS_TOKEN_COOKIE_NAME
 from app.core.config import settings
-from app.core.security import get_password_hash
+from app.core import rate_limit
+from app.core.password_hashing import password_hashing_pool
+from app.core.rate_limit import InMemoryRateLimitBackend, RateLimitUnavailable
+from app.core.security import get_password_hash, pwd_context, verify_password
 from app.models import User, UserCreate
 from app.tests.utils.users import create_random_user
 from app.tests.utils.utils import random_email, random_lower_string
@@ -22,6 +28,63 @@ def test_get_oauth_cookie_superuser(client: TestClient) -> None:
     assert cookies[ACCESS_TOKEN_COOKIE_NAME]
 
 
+def test_get_oauth_cookie_password_hashing_pool_full(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch.object(password_hashing_pool, "max_pending", 0):
+        response = client.post("/login/token", data=login_data)
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Too many login attempts, try again later."}
+    assert response.cookies == {}
+
+
+def test_get_oauth_cookie_rate_limited(client: TestClient) -> None:
+    login_data = {
+        "username": random_email(),
+        "password": random_lower_string(),
+    }
+    with (
+        patch.object(settings, "RATE_LIMIT_ENABLED", True),
+        patch.object(
+            rate_limit,
+            "get_rate_limit_backend",
+            return_value=InMemoryRateLimitBackend(),
+        ),
+        patch.object(rate_limit.login_account_limit, "capacity", 1),
+        patch.object(password_hashing_pool, "verify_and_update_password") as verify,
+    ):
+        verify.return_value = (False, None)
+        response = client.post("/login/token", data=login_data)
+        assert response.status_code == 400
+        response = client.post("/login/token", data=login_data)
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many login attempts, try again later."}
+    # Rate limited attempts are rejected before the password is checked
+    assert verify.call_count <= 1
+
+
+def test_get_oauth_cookie_rehashes_outdated_password_hash(
+    client: TestClient, db: Session
+) -> None:
+    with create_random_user(client, db) as (user, password, _):
+        outdated_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(
+            password
+        )
+        user.hashed_password = outdated_hash
+        db.add(user)
+        db.commit()
+        response = client.post(
+            "/login/token", data={"username": user.email, "password": password}
+        )
+        assert response.status_code == 200
+        db.refresh(user)
+        assert user.hashed_password != outdated_hash
+        assert verify_password(password, user.hashed_password)
+        assert not pwd_context.needs_update(user.hashed_password)
+
+
 def test_get_ouath_cookie_incorrect_username(client: TestClient) -> None:
     login_data = {
         "username": "",
@@ -77,8 +140,39 @@ def test_logout(client: TestClient, db: Session) -> None:
         assert response.json() == {"detail": "You are not logged in"}
 
 
+def test_logout_revokes_access_token(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (_, _, auth_cookie):
+        response = client.get("/users/me", cookies=[auth_cookie])
+        assert response.status_code == 200
+        response = client.post("/logout", cookies=[auth_cookie])
+        assert response.status_code == 200
+        # A copy of the cookie is rejected after the logout
+        response = client.get("/users/me", cookies=[auth_cookie])
+        assert response.status_code == 401
+        response = client.post("/logout", cookies=[auth_cookie])
+        assert response.status_code == 401
+
+
 def test_logout_not_logged_in(client: TestClient) -> None:
     response = client.post("/logout")
     assert response.status_code == 405
     assert response.json() == {"detail": "You are not logged in"}
     assert ACCESS_TOKEN_COOKIE_NAME not in response.cookies
+
+
+def test_get_oauth_cookie_rate_limit_unavailable(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with (
+        patch.object(settings, "RATE_LIMIT_ENABLED", True),
+        patch.object(rate_limit, "get_rate_limit_backend") as get_backend,
+    ):
+        get_backend.return_value.consume.side_effect = RateLimitUnavailable()
+        response = client.post("/login/token", data=login_data)
+    assert response.status_code == 503
+    assert response.json() == {
+        "detail": "Login is temporarily unavailable, try again later."
+    }
+    assert response.cookies == {}
@@ -1,10 +1,14 @@
 import io
+import time
 import uuid
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy import text
+from sqlmodel import Session, select, func
 
 from app.core.config import settings
+from app.models import MAX_PLANT_TAG_LENGTH, MAX_PLANT_TAGS, Plant
 from app.tests.utils.utils import (
     random_lower_string,
 )
@@ -50,6 +54,44 @@ def test_create_plant_new_plant_with_tags(client: TestClient, db: Session) -> No
         assert response_json["tags"].sort() == ["test", "testing", "testinging"].sort()
 
 
+def test_create_plant_with_maximum_tags(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (user, password, auth_cookie):
+        # Multibyte characters, so the event of the plant ad is as large as it gets
+        tags = [
+            f"{i:02}" + "🌱" * (MAX_PLANT_TAG_LENGTH - 2) for i in range(MAX_PLANT_TAGS)
+        ]
+        data = {
+            "name": random_lower_string(),
+            "description": random_lower_string(),
+            "city": random_lower_string(),
+            "tags": tags,
+        }
+        response = client.post(
+            "/plants/create", data=data, files=None, cookies=[auth_cookie]
+        )
+        assert 200 == response.status_code
+        assert response.json()["tags"] == tags
+
+
+def test_create_plant_too_many_or_too_long_tags(
+    client: TestClient, db: Session
+) -> None:
+    with create_random_user(client, db) as (user, password, auth_cookie):
+        for tags in [
+            [f"tag{i}" for i in range(MAX_PLANT_TAGS + 1)],
+            ["a" * (MAX_PLANT_TAG_LENGTH + 1)],
+        ]:
+            data = {
+                "name": random_lower_string(),
+                "city": random_lower_string(),
+                "tags": tags,
+            }
+            response = client.post(
+                "/plants/create", data=data, files=None, cookies=[auth_cookie]
+            )
+            assert 422 == response.status_code
+
+
 def test_create_plant_and_check_if_deleted_when_user_is_deleted(
     client: TestClient, db: Session, superuser_auth_cookie: tuple[str, str]
 ) -> None:
@@ -153,6 +195,181 @@ def test_read_own_plants_limit(client: TestClient, db: Session) -> None:
                 assert len(response_json["data"]) == 2
 
 
+def test_read_own_plants_cursor(client: TestClient, db: Session) -> None:
+    with create_random_plant(client, db) as (user, _, auth_cookie, plant_one):
+        with create_random_plant_for_given_user(db, user) as plant_two:
+            with create_random_plant_for_given_user(db, user) as plant_three:
+                response = client.get("/plants/own?limit=2", cookies=[auth_cookie])
+                assert response.status_code == 200
+                response_json = response.json()
+                assert response_json["count"] == 2
+                assert response_json["total"] == 3
+                assert not response_json["total_is_estimate"]
+                assert [plant_one.id, plant_two.id] == [
+                    uuid.UUID(plant["id"]) for plant in response_json["data"]
+                ]
+                assert response_json["next_cursor"]
+                response = client.get(
+                    f"/plants/own?limit=2&cursor={response_json['next_cursor']}",
+                    cookies=[auth_cookie],
+                )
+                assert response.status_code == 200
+                response_json = response.json()
+                assert [plant_three.id] == [
+                    uuid.UUID(plant["id"]) for plant in response_json["data"]
+                ]
+                assert response_json["next_cursor"] is None
+
+
+def test_read_plants_total(client: TestClient, db: Session) -> None:
+    with create_random_plant(client, db) as (user, _, _, plant):
+        response = client.get("/plants/?limit=1")
+        assert response.status_code == 200
+        response_json = response.json()
+        assert (
+            response_json["total"]
+            == db.exec(select(func.count()).select_from(Plant)).one()
+        )
+        assert not response_json["total_is_estimate"]
+
+
+def test_read_plants_filters(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (user, _, auth_cookie):
+        city = random_lower_string()
+        for name, tags in [("One", ["rare", "large"]), ("Two", ["large", ""])]:
+            response = client.post(
+                "/plants/create",
+                data={"name": name, "description": "", "city": city, "tags": tags},
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 200
+        response = client.get("/plants/", params={"city": city.upper()})
+        response_json = response.json()
+        assert response.status_code == 200
+        assert [plant["name"] for plant in response_json["data"]] == ["One", "Two"]
+        assert response_json["total"] is None
+        response = client.get(
+            "/plants/", params={"city": city, "tags": ["rare", "small"]}
+        )
+        assert [plant["name"] for plant in response.json()["data"]] == ["One"]
+        response = client.get(
+            "/plants/",
+            params={"city": city, "tags": ["large", "small"], "tags_match": "all"},
+        )
+        assert response.json()["data"] == []
+        response = client.get("/plants/", params={"owner_id": str(user.id)})
+        response_json = response.json()
+        assert [plant["name"] for plant in response_json["data"]] == ["One", "Two"]
+        assert response_json["total"] == 2
+
+
+def test_search_plants(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (user, _, auth_cookie):
+        word = random_lower_string()
+        plants = [
+            ("Description match", f"A {word} in a pot"),
+            (f"Name match {word}", "A plant"),
+            ("No match", "A plant"),
+        ]
+        for name, description in plants:
+            response = client.post(
+                "/plants/create",
+                data={"name": name, "description": description, "city": "Bielefeld"},
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 200
+        response = client.get("/plants/search", params={"q": word, "limit": 1})
+        assert response.status_code == 200
+        response_json = response.json()
+        assert [plant["name"] for plant in response_json["data"]] == [
+            f"Name match {word}"
+        ]
+        assert response_json["next_cursor"]
+        response = client.get(
+            "/plants/search",
+            params={"q": word, "limit": 1, "cursor": response_json["next_cursor"]},
+        )
+        response_json = response.json()
+        assert [plant["name"] for plant in response_json["data"]] == [
+            "Description match"
+        ]
+        assert response_json["next_cursor"] is None
+        response = client.get("/plants/search", params={"q": f"{word} -pot"})
+        assert [plant["name"] for plant in response.json()["data"]] == [
+            f"Name match {word}"
+        ]
+
+
+def _pg_trgm_installed(db: Session) -> bool:
+    return (
+        db.exec(
+            select(func.count())
+            .select_from(text("pg_extension"))
+            .where(text("extname = 'pg_trgm'"))
+        ).one()
+        > 0
+    )
+
+
+def test_search_plants_fuzzy(client: TestClient, db: Session) -> None:
+    if not _pg_trgm_installed(db):
+        pytest.skip("pg_trgm is not installed in the database")
+    with create_random_user(client, db) as (user, _, auth_cookie):
+        city = random_lower_string()
+        for name in ["Monstera deliciosa", "Philodendron", "Cactus"]:
+            response = client.post(
+                "/plants/create",
+                data={"name": name, "description": "", "city": city},
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 200
+        response = client.get(
+            "/plants/search", params={"q": "monsterra", "mode": "fuzzy"}
+        )
+        assert response.status_code == 200
+        names = [plant["name"] for plant in response.json()["data"]]
+        assert "Monstera deliciosa" in names
+        assert "Cactus" not in names
+        response = client.get(
+            "/plants/search",
+            params={"q": "philodendrum", "mode": "fuzzy", "limit": 1},
+        )
+        assert response.json()["data"][0]["name"] == "Philodendron"
+        response = client.get(
+            "/plants/search",
+            params={"q": "monsterra", "mode": "fuzzy", "threshold": 1},
+        )
+        assert response.json()["data"] == []
+
+
+def test_search_plants_fuzzy_pg_trgm_not_installed(
+    client: TestClient, db: Session
+) -> None:
+    if _pg_trgm_installed(db):
+        pytest.skip("pg_trgm is installed in the database")
+    response = client.get("/plants/search", params={"q": "monsterra", "mode": "fuzzy"})
+    assert response.status_code == 501
+    assert response.json() == {"detail": "Fuzzy search is not available."}
+
+
+def test_search_plants_fuzzy_invalid_threshold(client: TestClient) -> None:
+    response = client.get(
+        "/plants/search", params={"q": "monstera", "mode": "fuzzy", "threshold": 2}
+    )
+    assert response.status_code == 422
+
+
+def test_search_plants_empty_query(client: TestClient) -> None:
+    response = client.get("/plants/search", params={"q": ""})
+    assert response.status_code == 422
+
+
+def test_read_plants_invalid_cursor(client: TestClient) -> None:
+    response = client.get("/plants/?cursor=invalid")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor."}
+
+
 def test_read_plant_existing_plant(client: TestClient, db: Session) -> None:
     with create_random_plant(client, db) as (_, _, _, plant):
         response = client.get(f"/plants/{plant.id}")
@@ -208,3 +425,77 @@ def test_delete_plant_not_found(client: TestClient, db: Session) -> None:
         print(response.json())
         assert response.status_code == 404
         assert response.json() == {"detail": "No plant with the given id exists."}
+
+
+def test_read_plant_matches(client: TestClient, db: Session) -> None:
+    tag_one, tag_two, tag_three, tag_four = (random_lower_string() for _ in range(4))
+    with (
+        create_random_user(client, db) as (_, _, auth_cookie_one),
+        create_random_user(client, db) as (_, _, auth_cookie_two),
+    ):
+        plant_ids = {}
+        for name, tags, auth_cookie in [
+            ("Mine", [tag_one, tag_two, tag_three], auth_cookie_one),
+            ("Also mine", [tag_one, tag_two, tag_three], auth_cookie_one),
+            ("Two tags", [tag_one, tag_two], auth_cookie_two),
+            ("One tag", [tag_three, tag_four], auth_cookie_two),
+            ("Other tag", [tag_four], auth_cookie_two),
+        ]:
+            response = client.post(
+                "/plants/create",
+                data={
+                    "name": name,
+                    "description": "",
+                    "city": "Bielefeld",
+                    "tags": tags,
+                },
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 200
+            plant_ids[name] = response.json()["id"]
+
+        # The index is updated by the events, which are delivered asynchronously
+        deadline = time.monotonic() + 5
+        while True:
+            response = client.get(
+                f"/plants/{plant_ids['Mine']}/matches", cookies=[auth_cookie_one]
+            )
+            assert response.status_code == 200
+            if response.json()["count"] == 3 or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        response_json = response.json()
+        assert [
+            (match["plant"]["name"], match["overlap"])
+            for match in response_json["data"]
+        ] == [("Two tags", 5), ("One tag", 4), ("Other tag", 3)]
+
+        response = client.get(
+            f"/plants/{plant_ids['Mine']}/matches?limit=1", cookies=[auth_cookie_one]
+        )
+        assert [match["plant"]["name"] for match in response.json()["data"]] == [
+            "Two tags"
+        ]
+
+        # Matches of other users' plants cannot be retrieved
+        response = client.get(
+            f"/plants/{plant_ids['Mine']}/matches", cookies=[auth_cookie_two]
+        )
+        assert response.status_code == 401
+        response = client.get(
+            f"/plants/{uuid.uuid4()}/matches", cookies=[auth_cookie_two]
+        )
+        assert response.status_code == 404
+
+        # Deleted plants are no longer matched
+        response = client.post(
+            f"/plants/{plant_ids['Two tags']}", cookies=[auth_cookie_two]
+        )
+        assert response.status_code == 200
+        response = client.get(
+            f"/plants/{plant_ids['Mine']}/matches", cookies=[auth_cookie_one]
+        )
+        assert [
+            (match["plant"]["name"], match["overlap"])
+            for match in response.json()["data"]
+        ] == [("One tag", 2), ("Other tag", 1)]
@@ -1,9 +1,16 @@
+import time
 import uuid
+from contextlib import ExitStack
 
+import pytest
+from fastapi import status
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from starlette.websockets import WebSocketDisconnect
+from sqlmodel import Session, select, update
 
+from app.core.config import settings
 from app.core.crud import requests_crud
+from app.core.db import async_read_engine
 from app.models import TradeRequest, Message, Plant
 from app.tests.utils.plants import create_random_plant
 from app.tests.utils.requests import (
@@ -11,7 +18,7 @@ from app.tests.utils.requests import (
     create_random_trade_request,
 )
 from app.tests.utils.users import create_random_user
-from app.tests.utils.utils import random_lower_string
+from app.tests.utils.utils import count_queries, random_lower_string
 
 
 def test_create_trade_request_new_request(client: TestClient, db: Session) -> None:
@@ -316,6 +323,127 @@ def test_add_message_to_trade_request_plant_not_owned(client: TestClient, db: Se
             } == response.json()
 
 
+def test_read_trade_request_messages(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        user_one,
+        _,
+        auth_cookie_one,
+        plant_one,
+        user_two,
+        _,
+        auth_cookie_two,
+        plant_two,
+        trade_request,
+    ):
+        contents = [random_lower_string() for _ in range(3)]
+        for content, auth_cookie in zip(
+            contents, [auth_cookie_one, auth_cookie_two, auth_cookie_one]
+        ):
+            response = client.post(
+                f"/requests/message/{plant_one.id}/{plant_two.id}",
+                data={"message": content},
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 200
+        response = client.get(
+            f"/requests/{plant_one.id}/{plant_two.id}/messages?limit=2",
+            cookies=[auth_cookie_two],
+        )
+        assert response.status_code == 200
+        response_json = response.json()
+        assert response_json["count"] == 2
+        assert [message["content"] for message in response_json["data"]] == contents[:2]
+        assert response_json["data"][1]["sender_id"] == str(user_two.id)
+        assert response_json["next_cursor"]
+        response = client.get(
+            f"/requests/{plant_one.id}/{plant_two.id}/messages?limit=2"
+            f"&cursor={response_json['next_cursor']}",
+            cookies=[auth_cookie_one],
+        )
+        assert response.status_code == 200
+        response_json = response.json()
+        assert [message["content"] for message in response_json["data"]] == contents[2:]
+        assert response_json["next_cursor"] is None
+
+
+def test_read_trade_request_messages_not_involved(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        _,
+        _,
+        _,
+        plant_one,
+        _,
+        _,
+        _,
+        plant_two,
+        trade_request,
+    ):
+        with create_random_user(client, db) as (_, _, auth_cookie):
+            response = client.get(
+                f"/requests/{plant_one.id}/{plant_two.id}/messages",
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 404
+            assert response.json() == {
+                "detail": "No trade request with the given plant ids exists."
+            }
+
+
+def test_read_trade_request_messages_invalid_cursor(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        _,
+        _,
+        auth_cookie_one,
+        plant_one,
+        _,
+        _,
+        _,
+        plant_two,
+        trade_request,
+    ):
+        response = client.get(
+            f"/requests/{plant_one.id}/{plant_two.id}/messages?cursor=invalid",
+            cookies=[auth_cookie_one],
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor."}
+
+
+def test_read_trade_requests_without_messages(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        _,
+        _,
+        auth_cookie_one,
+        plant_one,
+        _,
+        _,
+        auth_cookie_two,
+        plant_two,
+        trade_request,
+    ):
+        response = client.post(
+            f"/requests/message/{plant_one.id}/{plant_two.id}",
+            data={"message": random_lower_string()},
+            cookies=[auth_cookie_one],
+        )
+        assert len(response.json()["messages"]) == 1
+        response = client.get(
+            f"/requests/outgoing/{plant_one.id}/{plant_two.id}?include_messages=false",
+            cookies=[auth_cookie_one],
+        )
+        assert response.status_code == 200
+        assert response.json()["messages"] is None
+        assert response.json()["incoming_plant"]["id"] == str(plant_two.id)
+        response = client.get(
+            "/requests/incoming/?include_messages=false", cookies=[auth_cookie_two]
+        )
+        assert response.status_code == 200
+        assert response.json()["count"] == 1
+        assert response.json()["data"][0]["messages"] is None
+        response = client.get("/requests/incoming/", cookies=[auth_cookie_two])
+        assert len(response.json()["data"][0]["messages"]) == 1
+
+
 def test_read_specific_outgoing_trade_request_existing_trade_request(
     client: TestClient, db: Session
 ):
@@ -659,6 +787,94 @@ def test_read_own_trade_requests_two_requests_limit_to_one(
         )
 
 
+def test_read_own_trade_requests_cursor(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        user_one,
+        password_one,
+        auth_cookie_one,
+        plant_one,
+        user_two,
+        password_two,
+        auth_cookie_two,
+        plant_two,
+        trade_request_one,
+    ):
+        with create_random_plant(client, db) as (user, pwd, auth_cookie, plant_three):
+            requests_crud.create_trade_request_from_plant_ids(
+                db, plant_two.id, plant_three.id
+            )
+            response = client.get("/requests/all/?limit=1", cookies=[auth_cookie_two])
+            assert response.status_code == 200
+            response_json = response.json()
+            assert 1 == len(response_json["data"])
+            assert 2 == response_json["total"]
+            assert_if_trade_request_json_and_trade_request_data_match(
+                plant_one, plant_two, response_json["data"][0], []
+            )
+            assert response_json["next_cursor"]
+            response = client.get(
+                f"/requests/all/?limit=1&cursor={response_json['next_cursor']}",
+                cookies=[auth_cookie_two],
+            )
+            assert response.status_code == 200
+            response_json = response.json()
+            assert 1 == len(response_json["data"])
+            assert_if_trade_request_json_and_trade_request_data_match(
+                plant_two, plant_three, response_json["data"][0], []
+            )
+            assert response_json["next_cursor"] is None
+
+
+@pytest.mark.parametrize("listing", ["all", "incoming", "outgoing"])
+def test_read_own_trade_requests_number_of_queries(
+    client: TestClient, db: Session, listing: str
+):
+    with (
+        create_random_trade_request(client, db) as (
+            user_one,
+            password_one,
+            auth_cookie_one,
+            plant_one,
+            user_two,
+            password_two,
+            auth_cookie_two,
+            plant_two,
+            trade_request_one,
+        ),
+        ExitStack() as stack,
+    ):
+        # Three incoming and three outgoing trade requests of plant_two with messages
+        for _ in range(3):
+            _, _, _, plant = stack.enter_context(create_random_plant(client, db))
+            requests_crud.create_trade_request_from_plant_ids(
+                db, plant_two.id, plant.id, random_lower_string()
+            )
+            _, _, _, plant = stack.enter_context(create_random_plant(client, db))
+            requests_crud.create_trade_request_from_plant_ids(
+                db, plant.id, plant_two.id, random_lower_string()
+            )
+        # Cache the current user, so only the queries of the listing are counted
+        client.get(f"/requests/{listing}/", cookies=[auth_cookie_two])
+        numbers_of_queries = []
+        for limit in [1, 3]:
+            with count_queries(async_read_engine.sync_engine) as statements:
+                response = client.get(
+                    f"/requests/{listing}/?limit={limit}", cookies=[auth_cookie_two]
+                )
+            assert response.status_code == 200
+            assert len(response.json()["data"]) == limit
+            numbers_of_queries.append(len(statements))
+        # The trade requests, their messages and the total number of trade requests
+        assert numbers_of_queries == [3, 3]
+
+
+def test_read_own_trade_requests_invalid_cursor(client: TestClient, db: Session):
+    with create_random_user(client, db) as (user, password, auth_cookie):
+        response = client.get("/requests/all/?cursor=invalid", cookies=[auth_cookie])
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor."}
+
+
 def test_accept_trade_request_successful(client: TestClient, db: Session):
     with create_random_trade_request(client, db) as (
         user_one,
@@ -685,6 +901,91 @@ def test_accept_trade_request_successful(client: TestClient, db: Session):
         )
 
 
+def test_accept_trade_request_rejects_competing_trade_requests(
+    client: TestClient, db: Session
+):
+    with (
+        create_random_trade_request(client, db) as (
+            user_one,
+            password_one,
+            auth_cookie_one,
+            plant_one,
+            user_two,
+            password_two,
+            auth_cookie_two,
+            plant_two,
+            trade_request,
+        ),
+        ExitStack() as stack,
+    ):
+        plant_three, plant_four = (
+            stack.enter_context(create_random_plant(client, db))[3] for _ in range(2)
+        )
+        _, _, auth_cookie_five, plant_five = stack.enter_context(
+            create_random_plant(client, db)
+        )
+        # Pending trade requests involving plant one or two in either direction and one not involving them
+        competing_plant_ids = [
+            (plant_three.id, plant_two.id),
+            (plant_two.id, plant_four.id),
+            (plant_one.id, plant_five.id),
+        ]
+        for outgoing_plant_id, incoming_plant_id in competing_plant_ids + [
+            (plant_three.id, plant_four.id)
+        ]:
+            requests_crud.create_trade_request_from_plant_ids(
+                db, outgoing_plant_id, incoming_plant_id
+            )
+        response = client.post(
+            f"/requests/accept/{plant_one.id}/{plant_two.id}",
+            cookies=[auth_cookie_two],
+        )
+        assert response.status_code == 200
+        assert response.json()["status"] == 1
+        assert response.json()["rejected_count"] == 3
+        db.expire_all()
+        assert [
+            db.get(TradeRequest, plant_ids).status  # type: ignore
+            for plant_ids in competing_plant_ids
+        ] == [2, 2, 2]
+        assert db.get(TradeRequest, (plant_three.id, plant_four.id)).status == 0  # type: ignore
+
+        # Rejected trade requests cannot be accepted anymore
+        response = client.post(
+            f"/requests/accept/{plant_one.id}/{plant_five.id}",
+            cookies=[auth_cookie_five],
+        )
+        assert response.status_code == 409
+        assert response.json() == {"detail": "The trade request is not pending."}
+
+
+def test_accept_trade_request_already_rejected(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        user_one,
+        password_one,
+        auth_cookie_one,
+        plant_one,
+        user_two,
+        password_two,
+        auth_cookie_two,
+        plant_two,
+        trade_request,
+    ):
+        response = client.post(
+            f"/requests/reject/{plant_one.id}/{plant_two.id}",
+            cookies=[auth_cookie_two],
+        )
+        assert response.status_code == 200
+        response = client.post(
+            f"/requests/accept/{plant_one.id}/{plant_two.id}",
+            cookies=[auth_cookie_two],
+        )
+        assert response.status_code == 409
+        assert response.json() == {"detail": "The trade request is not pending."}
+        db.expire_all()
+        assert db.get(TradeRequest, (plant_one.id, plant_two.id)).status == 2  # type: ignore
+
+
 def test_accept_trade_request_plant_not_owned(client: TestClient, db: Session):
     with create_random_trade_request(client, db) as (
         user_one,
@@ -872,3 +1173,130 @@ def test_delete_trade_request_not_authorized(client: TestClient, db: Session):
             } == response.json()
             trade_request_in_db = db.get(TradeRequest, (plant_one.id, plant_two.id))
             assert trade_request_in_db is not None
+
+
+def test_trade_request_events(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        user_one,
+        _,
+        auth_cookie_one,
+        plant_one,
+        user_two,
+        _,
+        auth_cookie_two,
+        plant_two,
+        trade_request,
+    ):
+        name, value = auth_cookie_two
+        with client.websocket_connect(
+            "/requests/events",
+            headers={"cookie": f"{name}={value}", "origin": settings.FRONTEND_URLS[0]},
+        ) as websocket:
+            message_content = random_lower_string()
+            response = client.post(
+                f"/requests/message/{plant_one.id}/{plant_two.id}",
+                data={"message": message_content},
+                cookies=[auth_cookie_one],
+            )
+            assert response.status_code == 200
+            event = websocket.receive_json()
+            assert event["type"] == "message_created"
+            assert event["content"] == message_content
+            assert event["sender_id"] == str(user_one.id)
+            response = client.post(
+                f"/requests/reject/{plant_one.id}/{plant_two.id}",
+                cookies=[auth_cookie_two],
+            )
+            assert response.status_code == 200
+            event = websocket.receive_json()
+            assert event == {
+                "type": "trade_request_status_changed",
+                "outgoing_plant_id": str(plant_one.id),
+                "incoming_plant_id": str(plant_two.id),
+                "outgoing_user_id": str(user_one.id),
+                "incoming_user_id": str(user_two.id),
+                "status": 2,
+            }
+
+
+def test_trade_request_events_not_authenticated(client: TestClient):
+    with pytest.raises(WebSocketDisconnect) as exception_info:
+        with client.websocket_connect("/requests/events"):
+            pass
+    assert exception_info.value.code == status.WS_1008_POLICY_VIOLATION
+
+
+def test_trade_request_events_foreign_origin(client: TestClient, db: Session):
+    with create_random_user(client, db) as (_, _, auth_cookie):
+        name, value = auth_cookie
+        with pytest.raises(WebSocketDisconnect) as exception_info:
+            with client.websocket_connect(
+                "/requests/events",
+                headers={"cookie": f"{name}={value}", "origin": "https://example.com"},
+            ):
+                pass
+        assert exception_info.value.code == status.WS_1008_POLICY_VIOLATION
+
+
+def test_read_own_swap_cycles(client: TestClient, db: Session):
+    with (
+        create_random_plant(client, db) as (user_one, _, auth_cookie_one, plant_one),
+        create_random_plant(client, db) as (user_two, _, auth_cookie_two, plant_two),
+        create_random_plant(client, db) as (
+            user_three,
+            _,
+            auth_cookie_three,
+            plant_three,
+        ),
+    ):
+        # Every user wants the plant of the next one
+        for auth_cookie, outgoing_plant, incoming_plant in [
+            (auth_cookie_one, plant_one, plant_two),
+            (auth_cookie_two, plant_two, plant_three),
+            (auth_cookie_three, plant_three, plant_one),
+        ]:
+            response = client.post(
+                f"/requests/create/{outgoing_plant.id}/{incoming_plant.id}",
+                cookies=[auth_cookie],
+            )
+            assert response.status_code == 200
+        # The index is updated by the events, which are delivered asynchronously
+        deadline = time.monotonic() + 5
+        while True:
+            response = client.get("/requests/cycles/", cookies=[auth_cookie_two])
+            assert response.status_code == 200
+            if response.json()["count"] == 1 or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        response_json = response.json()
+        assert response_json["count"] == 1
+        assert response_json["complete"]
+        assert response_json["data"][0]["trade_requests"] == [
+            {
+                "outgoing_user_id": str(outgoing_user.id),
+                "incoming_user_id": str(incoming_user.id),
+                "outgoing_plant_id": str(outgoing_plant.id),
+                "incoming_plant_id": str(incoming_plant.id),
+            }
+            for outgoing_user, incoming_user, outgoing_plant, incoming_plant in [
+                (user_two, user_three, plant_two, plant_three),
+                (user_three, user_one, plant_three, plant_one),
+                (user_one, user_two, plant_one, plant_two),
+            ]
+        ]
+
+        # Trade requests which are no longer pending are left out, even if the index missed the change
+        db.exec(
+            update(TradeRequest)
+            .where(TradeRequest.outgoing_plant_id == plant_three.id)  # type: ignore
+            .values(status=2)
+        )
+        db.commit()
+        response = client.get("/requests/cycles/", cookies=[auth_cookie_one])
+        assert response.status_code == 200
+        assert response.json() == {"data": [], "count": 0, "complete": True}
+
+        response = client.get(
+            "/requests/cycles/?max_length=2", cookies=[auth_cookie_one]
+        )
+        assert response.status_code == 422
@@ -1,10 +1,14 @@
 import uuid
+from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
 from app.core.crud import users_crud
 from app.core.config import settings
+from app.core import rate_limit
+from app.core.password_hashing import password_hashing_pool
+from app.core.rate_limit import InMemoryRateLimitBackend
 from app.models import UserCreate
 from app.tests.utils.utils import (
     random_email,
@@ -99,6 +103,63 @@ def test_read_plants_limit(client: TestClient, db: Session) -> None:
                 assert len(response_json["data"]) == 2
 
 
+def test_read_users_cursor(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (user_one, _, _):
+        with create_random_user(client, db) as (user_two, _, _):
+            ids: list[str] = []
+            cursor = None
+            while True:
+                url = "/users/?limit=2" + (f"&cursor={cursor}" if cursor else "")
+                response = client.get(url)
+                assert response.status_code == 200
+                response_json = response.json()
+                assert len(response_json["data"]) <= 2
+                ids.extend(user["id"] for user in response_json["data"])
+                cursor = response_json["next_cursor"]
+                if cursor is None:
+                    break
+            assert len(ids) == len(set(ids))
+            assert ids[-2:] == [str(user_one.id), str(user_two.id)]
+
+
+def test_read_users_invalid_cursor(client: TestClient) -> None:
+    response = client.get("/users/?cursor=invalid")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor."}
+
+
+def test_create_user_password_hashing_pool_full(
+    client: TestClient, db: Session
+) -> None:
+    username = random_email()
+    data = {"email": username, "password": random_lower_string()}
+    with patch.object(password_hashing_pool, "max_pending", 0):
+        response = client.post("/users/signup", json=data)
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Too many signups, try again later."}
+    assert users_crud.get_user_by_email(session=db, email=str(username)) is None
+
+
+def test_create_user_rate_limited(client: TestClient, db: Session) -> None:
+    username = random_email()
+    data = {"email": username, "password": random_lower_string()}
+    with (
+        patch.object(settings, "RATE_LIMIT_ENABLED", True),
+        patch.object(
+            rate_limit,
+            "get_rate_limit_backend",
+            return_value=InMemoryRateLimitBackend(),
+        ),
+        patch.object(rate_limit.signup_ip_limit, "capacity", 0),
+        patch.object(password_hashing_pool, "hash_password") as hash_password,
+    ):
+        response = client.post("/users/signup", json=data)
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many signups, try again later."}
+    hash_password.assert_not_called()
+    assert users_crud.get_user_by_email(session=db, email=str(username)) is None
+
+
 def test_create_user_new_email(client: TestClient, db: Session) -> None:
     username = random_email()
     password = random_lower_string()
@@ -1,11 +1,27 @@
-from unittest.mock import patch, PropertyMock
+import uuid
+from unittest.mock import patch, PropertyMock, MagicMock
 
 import pytest
 from fastapi import HTTPException, status
-from sqlmodel import Session
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.dependencies import User, get_current_active_user, get_current_user
-from app.models import TokenData
+from app.api.dependencies import (
+    User,
+    get_current_active_user,
+    get_current_user,
+    get_token_data,
+    get_async_read_db,
+    get_client_ip,
+    READ_PRIMARY_COOKIE_NAME,
+)
+from app.core.config import settings
+from app.core.security import create_access_token, create_user_access_token
+from app.models import RevokedToken, TokenData, UserCreate
+from app.core.crud import users_crud
+from app.core.token_denylist import token_denylist
+from app.core.user_cache import user_cache
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -44,14 +60,14 @@ async def test_get_current_active_user_active_user():
 
 
 @pytest.mark.asyncio
-async def test_get_current_user_no_email(db: Session):
+async def test_get_current_user_no_email(async_db: AsyncSession):
     mocked_jwt_payload = {"sub": "example@example.com"}
     mocked_token_data = TokenData(email=None)
 
     with patch("jwt.decode", return_value=mocked_jwt_payload):
         with patch("app.api.dependencies.TokenData", return_value=mocked_token_data):
             with pytest.raises(HTTPException) as exception_info:
-                await get_current_user("fake_token", db)
+                await get_current_user("fake_token", async_db)
             response = exception_info.value
             assert response.status_code == status.HTTP_401_UNAUTHORIZED
             assert response.detail == "Could not validate credentials"
@@ -59,13 +75,136 @@ async def test_get_current_user_no_email(db: Session):
 
 
 @pytest.mark.asyncio
-async def test_get_current_user_no_user(db: Session):
+async def test_get_current_user_no_user(async_db: AsyncSession):
     mocked_jwt_payload = {"sub": "example@example.com"}
 
     with patch("jwt.decode", return_value=mocked_jwt_payload):
         with pytest.raises(HTTPException) as exception_info:
-            await get_current_user("fake_token", db)
+            await get_current_user("fake_token", async_db)
         response = exception_info.value
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
         assert response.detail == "Could not validate credentials"
         assert response.headers == {"WWW-Authenticate": "Bearer"}
+
+
+@pytest.mark.asyncio
+async def test_get_async_read_db_without_replica(async_db: AsyncSession):
+    request = MagicMock(cookies={})
+    read_sessions = get_async_read_db(request, async_db)
+    assert await read_sessions.__anext__() is async_db
+
+
+@pytest.mark.asyncio
+async def test_get_async_read_db_with_replica(async_db: AsyncSession):
+    replica_engine = create_async_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    with patch("app.api.dependencies.async_read_engine", replica_engine):
+        # Clients which did not write recently read from the replica
+        read_sessions = get_async_read_db(MagicMock(cookies={}), async_db)
+        read_session = await read_sessions.__anext__()
+        assert read_session is not async_db
+        assert read_session.bind is replica_engine
+        await read_sessions.aclose()
+        # Clients which wrote recently read from the primary
+        request = MagicMock(cookies={READ_PRIMARY_COOKIE_NAME: "1"})
+        read_sessions = get_async_read_db(request, async_db)
+        assert await read_sessions.__anext__() is async_db
+    await replica_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_by_id(db: Session, async_db: AsyncSession):
+    user = users_crud.create_user(
+        db, UserCreate(email=random_email(), password=random_lower_string())
+    )
+    try:
+        user_cache.clear()
+        current_user = await get_current_user(create_user_access_token(user), async_db)
+        assert current_user.id == user.id
+        # The user is in the identity map of the session
+        assert await async_db.get(User, user.id) is current_user
+    finally:
+        users_crud.delete_user(db, user)
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_legacy_email_token(db: Session, async_db: AsyncSession):
+    user = users_crud.create_user(
+        db, UserCreate(email=random_email(), password=random_lower_string())
+    )
+    try:
+        user_cache.clear()
+        token = create_access_token({"sub": user.email})
+        current_user = await get_current_user(token, async_db)
+        assert current_user.id == user.id
+    finally:
+        users_crud.delete_user(db, user)
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_unknown_token_version():
+    token = create_access_token({"sub": random_email(), "ver": 99})
+    with pytest.raises(HTTPException) as exception_info:
+        await get_current_user(token, None)  # type: ignore[arg-type]
+    assert exception_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_invalid_user_id():
+    token = create_access_token({"sub": "not-a-uuid", "ver": 2})
+    with pytest.raises(HTTPException) as exception_info:
+        await get_current_user(token, None)  # type: ignore[arg-type]
+    assert exception_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_token_data(async_db: AsyncSession):
+    user = User(
+        id=uuid.uuid4(), email=random_email(), hashed_password="", is_active=False
+    )
+    token_data = await get_token_data(create_user_access_token(user), async_db)
+    assert token_data.user_id == user.id
+    assert token_data.email is None
+    assert not token_data.is_active
+    assert not token_data.is_superuser
+    assert token_data.jti is not None
+    assert token_data.expires_at is not None
+
+
+@pytest.mark.asyncio
+async def test_get_token_data_revoked(async_db: AsyncSession):
+    user = User(id=uuid.uuid4(), email=random_email(), hashed_password="")
+    token = create_user_access_token(user)
+    token_data = await get_token_data(token, async_db)
+    await token_denylist.revoke(async_db, token_data.jti, token_data.expires_at)  # type: ignore[arg-type]
+    try:
+        with pytest.raises(HTTPException) as exception_info:
+            await get_token_data(token, async_db)
+        assert exception_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+        with pytest.raises(HTTPException) as exception_info:
+            await get_current_user(token, async_db)
+        assert exception_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+    finally:
+        await async_db.execute(
+            delete(RevokedToken).where(RevokedToken.jti == token_data.jti)  # type: ignore
+        )
+        await async_db.commit()
+
+
+@pytest.mark.asyncio
+async def test_get_token_data_not_authenticated():
+    with pytest.raises(HTTPException) as exception_info:
+        await get_token_data(None, None)  # type: ignore[arg-type]
+    assert exception_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert exception_info.value.detail == "Not authenticated"
+
+
+def test_get_client_ip_ignores_forwarded_headers_without_client_ip_header():
+    request = MagicMock()
+    request.client.host = "10.0.0.1"
+    request.headers = {"X-Forwarded-For": "1.2.3.4", "Fly-Client-IP": "1.2.3.4"}
+    with patch.object(settings, "CLIENT_IP_HEADER", None):
+        assert get_client_ip(request) == "10.0.0.1"
+    with patch.object(settings, "CLIENT_IP_HEADER", "Fly-Client-IP"):
+        assert get_client_ip(request) == "1.2.3.4"
+        request.headers = {}
+        assert get_client_ip(request) == "10.0.0.1"
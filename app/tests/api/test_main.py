@@ -1,10 +1,14 @@
+from unittest.mock import patch, MagicMock
 from urllib.request import Request
 
 import pytest
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
+from sqlmodel import Session
 
+from app.api.dependencies import READ_PRIMARY_COOKIE_NAME
 from app.main import validation_exception_handler
+from app.tests.utils.users import create_random_user
 
 
 def test_read_main(client: TestClient):
@@ -29,3 +33,20 @@ async def test_validation_exception_handler():
         response.body
         == b'{"status_code":10422,"message":"422: Validation error","data":null}'
     )
+
+
+def test_read_your_writes_cookie_with_replica(client: TestClient, db: Session) -> None:
+    with create_random_user(client, db) as (_, _, auth_cookie):
+        # Without a replica there is no need to pin clients to the primary
+        data = {"name": "Monstera", "description": "Nice", "city": "Bielefeld"}
+        response = client.post("/plants/create", data=data, cookies=[auth_cookie])
+        assert response.status_code == 200
+        assert READ_PRIMARY_COOKIE_NAME not in response.cookies
+        with patch("app.api.dependencies.async_read_engine", MagicMock()):
+            response = client.post("/plants/create", data=data, cookies=[auth_cookie])
+            assert response.status_code == 200
+            assert response.cookies[READ_PRIMARY_COOKIE_NAME] == "1"
+            # Read-only requests do not commit and thereby do not pin the client
+            response = client.get("/users/me", cookies=[auth_cookie])
+            assert response.status_code == 200
+            assert READ_PRIMARY_COOKIE_NAME not in response.cookies
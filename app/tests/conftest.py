@@ -5,15 +5,25 @@ os.environ["USE_IMAGE_UPLOAD"] = "False"
 os.environ["CLOUDINARY_CLOUD_NAME"] = "Test"
 os.environ["CLOUDINARY_API_KEY"] = "Test"
 os.environ["CLOUDINARY_API_SECRET"] = "Test"
+# Rate limits are tested explicitly in test_rate_limit.py
+os.environ["RATE_LIMIT_ENABLED"] = "False"
 
-from collections.abc import Generator
+import time
+from collections.abc import AsyncGenerator, Generator
 
 import pytest
+import pytest_asyncio
 from fastapi import Response
 from fastapi.testclient import TestClient
+from sqlalchemy import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.core.config import settings
 from app.core.db import engine, init_db
+from app.core.plant_matches import tag_index
+from app.core.swap_cycles import swap_graph
 from app.main import app
 from app.models import User, Plant, TradeRequest
 from app.tests.utils.users import get_superuser_authentication_cookie
@@ -33,6 +43,12 @@ def override_set_cookie(monkeypatch):
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
+        # The indexes are built in the background after the startup
+        deadline = time.monotonic() + 10
+        while (
+            not (swap_graph.ready and tag_index.ready) and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
         yield c
 
 
@@ -41,6 +57,17 @@ def superuser_auth_cookie(client: TestClient, override_set_cookie) -> tuple[str,
     return get_superuser_authentication_cookie(client)
 
 
+@pytest_asyncio.fixture
+async def async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Every async test runs in its own event loop, so pooled connections cannot be shared between tests
+    test_async_engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
+        yield session
+    await test_async_engine.dispose()
+
+
 @pytest.fixture(scope="session", autouse=True)
 def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
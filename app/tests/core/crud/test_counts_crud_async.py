@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.crud import requests_crud
+from app.core.crud.counts_crud_async import get_row_count, get_table_count
+from app.models import Plant
+from app.tests.utils.plants import create_random_plant_for_given_user
+from app.tests.utils.requests import create_random_trade_request
+from app.tests.utils.users import create_random_user
+
+
+@pytest.mark.asyncio
+async def test_get_row_count_plants(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with create_random_user(client, db) as (user, _, _):
+        assert await get_row_count(async_db, user.id, ["plant"]) == 0
+        with create_random_plant_for_given_user(db, user):
+            with create_random_plant_for_given_user(db, user):
+                assert await get_row_count(async_db, user.id, ["plant"]) == 2
+            assert await get_row_count(async_db, user.id, ["plant"]) == 1
+        assert await get_row_count(async_db, user.id, ["plant"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_get_row_count_trade_requests(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with create_random_trade_request(client, db) as (
+        user_one,
+        _,
+        _,
+        _,
+        user_two,
+        _,
+        _,
+        _,
+        trade_request,
+    ):
+        assert await get_row_count(async_db, user_one.id, ["outgoing_request"]) == 1
+        assert await get_row_count(async_db, user_one.id, ["incoming_request"]) == 0
+        assert await get_row_count(async_db, user_two.id, ["incoming_request"]) == 1
+        # Changing the status moves the request to another count of the same scope
+        requests_crud.accept_trade_request(db, trade_request)
+        assert (
+            await get_row_count(
+                async_db, user_two.id, ["outgoing_request", "incoming_request"]
+            )
+            == 1
+        )
+    assert await get_row_count(async_db, user_one.id, ["outgoing_request"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_get_table_count_exact(db: Session, async_db: AsyncSession):
+    count, is_estimate = await get_table_count(async_db, Plant)
+    assert not is_estimate
+    assert count == db.exec(select(func.count()).select_from(Plant)).one()
+
+
+@pytest.mark.asyncio
+async def test_get_table_count_estimate(db: Session, async_db: AsyncSession):
+    db.connection().exec_driver_sql("ANALYZE plant")
+    db.commit()
+    with patch.object(settings, "EXACT_COUNT_THRESHOLD", 0):
+        count, is_estimate = await get_table_count(async_db, Plant)
+    assert is_estimate
+    assert count >= 0
@@ -6,10 +6,11 @@ from fastapi import UploadFile
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
-from app.core.crud.plants_crud import create_plant, delete_plant_ad
+from app.core.crud.plants_crud import create_plant, delete_plant_ad, get_all_plant_ads
 from app.models import PlantCreate
 from app.tests.utils.plants import create_random_plant
 from app.tests.utils.users import create_random_user
+from app.tests.utils.utils import random_lower_string
 
 
 def test_create_plant_with_image_exception(client: TestClient, db: Session):
@@ -40,3 +41,26 @@ def test_delete_plant_ad_with_image_exception(client: TestClient, db: Session):
             with pytest.raises(ValueError) as exception_info:
                 delete_plant_ad(db, plant)
             assert (str(exception_info.value)).startswith("Failed to delete image:")
+
+
+def test_get_all_plant_ads_filters(client: TestClient, db: Session):
+    with create_random_user(client, db) as (user, _, _):
+        city = random_lower_string()
+        plant_one = create_plant(
+            db,
+            user,
+            PlantCreate(name="One", description="", city=city, tags=["a", "b"]),
+        )
+        plant_two = create_plant(
+            db, user, PlantCreate(name="Two", description="", city=city, tags=["b"])
+        )
+        plants = get_all_plant_ads(db, city=city.upper())
+        assert {plant.id for plant in plants.data} == {plant_one.id, plant_two.id}
+        plants = get_all_plant_ads(db, city=city, tags=["a", "c"])
+        assert [plant.id for plant in plants.data] == [plant_one.id]
+        plants = get_all_plant_ads(db, city=city, tags=["a", "b"], tags_match="all")
+        assert [plant.id for plant in plants.data] == [plant_one.id]
+        plants = get_all_plant_ads(db, tags=["a", "c"], tags_match="all")
+        assert plants.data == []
+        plants = get_all_plant_ads(db, owner_id=user.id)
+        assert {plant.id for plant in plants.data} == {plant_one.id, plant_two.id}
@@ -0,0 +1,67 @@
+import io
+import uuid
+from unittest.mock import patch, PropertyMock
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.crud.plants_crud_async import (
+    create_plant,
+    delete_plant_ad,
+    get_plant,
+    owns_any_plant,
+)
+from app.models import PlantCreate
+from app.tests.utils.plants import create_random_plant
+from app.tests.utils.users import create_random_user
+
+
+@pytest.mark.asyncio
+async def test_create_plant_with_image_exception(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with create_random_user(client, db) as (user, _, _):
+        plant_in = PlantCreate(
+            name="Test Plant",
+            description="This is a test plant",
+            city="Bielefeld",
+            tags=["test", "plant"],
+        )
+        file_content = b"This is a test image file"
+        upload_file = UploadFile(
+            filename="test_image.png", file=io.BytesIO(file_content)
+        )
+        with pytest.raises(ValueError) as exception_info:
+            await create_plant(async_db, user, plant_in, image=upload_file)
+        assert (str(exception_info.value)).startswith("Failed to upload image:")
+
+
+@pytest.mark.asyncio
+async def test_delete_plant_ad_with_image_exception(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with create_random_plant(client, db) as (_, _, _, plant):
+        async_plant = await get_plant(async_db, plant.id)
+        assert async_plant
+        async_plant.image_url = "https://localhost"
+        with patch(
+            "app.core.crud.plants_crud_async.settings.USE_IMAGE_UPLOAD",
+            new_callable=PropertyMock,
+        ) as a:
+            a.return_value = True
+            with pytest.raises(ValueError) as exception_info:
+                await delete_plant_ad(async_db, async_plant)
+            assert (str(exception_info.value)).startswith("Failed to delete image:")
+
+
+@pytest.mark.asyncio
+async def test_owns_any_plant(client: TestClient, db: Session, async_db: AsyncSession):
+    with create_random_plant(client, db) as (user, _, _, plant):
+        with create_random_plant(client, db) as (other_user, _, _, other_plant):
+            assert await owns_any_plant(async_db, user.id, plant.id)
+            assert await owns_any_plant(async_db, user.id, other_plant.id, plant.id)
+            assert not await owns_any_plant(async_db, user.id, other_plant.id)
+            assert not await owns_any_plant(async_db, other_user.id, uuid.uuid4())
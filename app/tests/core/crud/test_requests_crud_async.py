@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.crud import requests_crud
+from app.core.crud.requests_crud_async import (
+    accept_trade_request,
+    create_trade_request,
+    get_all_trade_requests,
+    get_trade_request,
+)
+from app.models import TradeRequest
+from app.tests.utils.plants import create_random_plant
+from app.tests.utils.users import create_random_user
+
+
+@pytest.mark.asyncio
+async def test_get_all_trade_requests_outgoing_and_incoming_only(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with create_random_user(client, db) as (user, _, _):
+        with pytest.raises(ValueError) as e:
+            await get_all_trade_requests(
+                user, async_db, 0, 100, outgoing_only=True, incoming_only=True
+            )
+        assert e is not None
+        assert e.value.args[0] == "Cannot filter by both outgoing and incoming only."
+
+
+@pytest.mark.asyncio
+async def test_create_trade_request_concurrently_in_both_directions(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with (
+        create_random_plant(client, db) as (user_one, _, _, plant_one),
+        create_random_plant(client, db) as (user_two, _, _, plant_two),
+    ):
+        async with AsyncSession(async_db.bind, expire_on_commit=False) as other_db:
+            results = await asyncio.gather(
+                create_trade_request(
+                    async_db,
+                    TradeRequest(
+                        outgoing_plant_id=plant_one.id,
+                        incoming_plant_id=plant_two.id,
+                        outgoing_user_id=user_one.id,
+                        incoming_user_id=user_two.id,
+                    ),
+                    "Hello",
+                ),
+                create_trade_request(
+                    other_db,
+                    TradeRequest(
+                        outgoing_plant_id=plant_two.id,
+                        incoming_plant_id=plant_one.id,
+                        outgoing_user_id=user_two.id,
+                        incoming_user_id=user_one.id,
+                    ),
+                    "Hello",
+                ),
+            )
+        # Only one of the trade requests is created, the other one conflicts with it
+        created = [result for result in results if result is not None]
+        assert len(created) == 1
+        assert [message.content for message in created[0].messages] == ["Hello"]
+
+
+@pytest.mark.asyncio
+async def test_accept_trade_requests_of_same_plant_concurrently(
+    client: TestClient, db: Session, async_db: AsyncSession
+):
+    with (
+        create_random_plant(client, db) as (_, _, _, plant_one),
+        create_random_plant(client, db) as (_, _, _, plant_two),
+        create_random_plant(client, db) as (_, _, _, plant_three),
+    ):
+        for outgoing_plant in (plant_one, plant_three):
+            requests_crud.create_trade_request_from_plant_ids(
+                db, outgoing_plant.id, plant_two.id
+            )
+        async with AsyncSession(async_db.bind, expire_on_commit=False) as other_db:
+            trade_requests = [
+                await get_trade_request(session, outgoing_plant.id, plant_two.id)
+                for session, outgoing_plant in [
+                    (async_db, plant_one),
+                    (other_db, plant_three),
+                ]
+            ]
+            results = await asyncio.gather(
+                accept_trade_request(async_db, trade_requests[0]),  # type: ignore
+                accept_trade_request(other_db, trade_requests[1]),  # type: ignore
+            )
+        # Only one of the trade requests is accepted, the other one is rejected by it
+        accepted = [result for result in results if result is not None]
+        assert len(accepted) == 1
+        assert accepted[0].status == 1
+        assert accepted[0].rejected_count == 1
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from sqlmodel import Session, delete, select
+
+from app.bootstrap import main as bootstrap_main
+from app.core.config import settings
+from app.core.db import (
+    engine,
+    get_schema_version,
+    init_db_on_startup,
+    migrate_db,
+    SCHEMA_VERSION,
+)
+from app.models import SchemaVersion, User
+
+
+def test_engine_prepares_statements():
+    with engine.connect() as connection:
+        driver_connection = connection.connection.driver_connection
+        assert (
+            driver_connection.prepare_threshold == settings.POSTGRES_PREPARE_THRESHOLD
+        )
+
+
+def test_migrate_db_schema_current():
+    assert not migrate_db()
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+
+
+def test_migrate_db_concurrently(db: Session):
+    # Simulate a database from before the schema was versioned
+    db.exec(delete(SchemaVersion))  # type: ignore
+    db.commit()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: migrate_db(), range(4)))
+    assert results.count(True) == 1
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+
+
+def test_init_db_on_startup_schema_current():
+    with patch("app.core.db.create_first_superuser") as create_first_superuser:
+        init_db_on_startup()
+        create_first_superuser.assert_not_called()
+
+
+def test_init_db_on_startup_schema_outdated(db: Session):
+    db.exec(delete(SchemaVersion))  # type: ignore
+    db.commit()
+    with patch("app.core.db.create_first_superuser") as create_first_superuser:
+        init_db_on_startup()
+        create_first_superuser.assert_called_once()
+
+
+def test_bootstrap(db: Session):
+    bootstrap_main()
+    # noinspection Pydantic
+    superuser = db.exec(
+        select(User).where(User.email == settings.FIRST_SUPERUSER)  # type: ignore
+    ).first()
+    assert superuser
+    assert superuser.is_superuser
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.crud import requests_crud
+from app.core.db import engine
+from app.core.events import (
+    EVENTS_CHANNEL,
+    EventBroker,
+    PostgresEventListener,
+    event_broker,
+)
+from app.models import Message
+from app.tests.utils.requests import create_random_trade_request
+
+
+@pytest.mark.asyncio
+async def test_event_broker_delivers_events_to_subscribers_of_user():
+    broker = EventBroker(max_queue_size=10)
+    user_id, other_user_id = uuid.uuid4(), uuid.uuid4()
+    with broker.subscribe(user_id) as subscription:
+        with broker.subscribe(other_user_id) as other_subscription:
+            assert broker.subscriber_count() == 2
+            # Events can be published from other threads
+            thread = threading.Thread(
+                target=broker.publish, args=([user_id], {"type": "test"})
+            )
+            thread.start()
+            thread.join()
+            assert await asyncio.wait_for(subscription.get(), 1) == {"type": "test"}
+            broker.publish([user_id, other_user_id], {"type": "both"})
+            assert await asyncio.wait_for(subscription.get(), 1) == {"type": "both"}
+            assert await asyncio.wait_for(other_subscription.get(), 1) == {
+                "type": "both"
+            }
+    assert broker.subscriber_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_event_broker_full_queue():
+    broker = EventBroker(max_queue_size=2)
+    user_id = uuid.uuid4()
+    with broker.subscribe(user_id) as subscription:
+        for i in range(3):
+            broker.publish([user_id], {"type": "test", "number": i})
+        await asyncio.sleep(0)
+        # The events are dropped and the subscriber is told to resynchronize
+        assert await asyncio.wait_for(subscription.get(), 1) is None
+
+
+@pytest.mark.asyncio
+async def test_events_are_published_on_commit(client: TestClient, db: Session):
+    with create_random_trade_request(client, db) as (
+        user_one,
+        _,
+        _,
+        plant_one,
+        user_two,
+        _,
+        _,
+        plant_two,
+        trade_request,
+    ):
+        with event_broker.subscribe(user_two.id) as subscription:
+            message = Message(
+                sender_id=user_one.id,
+                content="Hello",
+                outgoing_plant_id=plant_one.id,
+                incoming_plant_id=plant_two.id,
+            )
+            trade_request.messages.append(message)
+            db.add(trade_request)
+            db.flush()
+            # Rolled back changes are not published
+            db.rollback()
+            requests_crud.accept_trade_request(db, trade_request)
+            event = await asyncio.wait_for(subscription.get(), 1)
+            assert event is not None
+            assert event["type"] == "trade_request_status_changed"
+            assert event["status"] == 1
+            assert event["incoming_user_id"] == str(user_two.id)
+            requests_crud.add_message_to_trade_request(
+                db,
+                trade_request,
+                Message(
+                    sender_id=user_one.id,
+                    content="Hello",
+                    outgoing_plant_id=plant_one.id,
+                    incoming_plant_id=plant_two.id,
+                ),
+            )
+            event = await asyncio.wait_for(subscription.get(), 1)
+            assert event is not None
+            assert event["type"] == "message_created"
+            assert event["content"] == "Hello"
+            assert event["sender_id"] == str(user_one.id)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fanout", ["memory", "postgres"])
+async def test_events_are_not_published_on_rollback(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch, fanout: str
+):
+    monkeypatch.setattr(settings, "EVENT_FANOUT", fanout)
+    with create_random_trade_request(client, db) as (
+        _,
+        _,
+        _,
+        _,
+        user_two,
+        _,
+        _,
+        _,
+        trade_request,
+    ):
+        with event_broker.subscribe(user_two.id) as subscription:
+            trade_request.status = 1
+            db.add(trade_request)
+            db.flush()
+            db.rollback()
+            requests_crud.reject_trade_request(db, trade_request)
+            event = await asyncio.wait_for(subscription.get(), 1)
+            assert event is not None
+            assert event["type"] == "trade_request_status_changed"
+            assert event["status"] == 2
+
+
+@pytest.mark.asyncio
+async def test_postgres_event_listener_dispatches_notifications():
+    broker = EventBroker(max_queue_size=10)
+    listener = PostgresEventListener(broker, retry_seconds=0.1)
+    user_id = uuid.uuid4()
+    task = await listener.start()
+    try:
+        with broker.subscribe(user_id) as subscription:
+            # Notifications of other workers are dispatched to the subscribers of this worker, malformed ones skipped
+            with engine.begin() as connection:
+                for payload in [
+                    "not json",
+                    f'{{"user_ids": ["{user_id}"], "event": {{"type": "test"}}}}',
+                ]:
+                    connection.execute(
+                        text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": EVENTS_CHANNEL, "payload": payload},
+                    )
+            assert await asyncio.wait_for(subscription.get(), 5) == {"type": "test"}
+
+            # Events might have been missed while the connection was lost, so subscribers are told to resynchronize
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                        "WHERE query = :query AND pid <> pg_backend_pid()"
+                    ),
+                    {"query": f"LISTEN {EVENTS_CHANNEL}"},
+                )
+            assert await asyncio.wait_for(subscription.get(), 5) is None
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
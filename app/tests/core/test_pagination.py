@@ -0,0 +1,49 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.core.pagination import encode_cursor, decode_cursor, paginate
+
+
+def test_encode_and_decode_cursor() -> None:
+    creation_date = datetime.now()
+    id = uuid.uuid4()
+    cursor = encode_cursor(creation_date, id)
+    assert decode_cursor(cursor, (datetime, uuid.UUID)) == (creation_date, id)
+
+
+def test_encode_and_decode_cursor_float() -> None:
+    rank = 0.0607927106320858
+    id = uuid.uuid4()
+    cursor = encode_cursor(rank, id)
+    assert decode_cursor(cursor, (float, uuid.UUID)) == (rank, id)
+
+
+def test_decode_cursor_invalid_cursor() -> None:
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor", (datetime, uuid.UUID))
+
+
+def test_decode_cursor_wrong_types() -> None:
+    cursor = encode_cursor(datetime.now())
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, (datetime, uuid.UUID))
+    cursor = encode_cursor(uuid.uuid4(), uuid.uuid4())
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, (datetime, uuid.UUID))
+
+
+def test_paginate_more_rows_than_limit() -> None:
+    rows = [(datetime(2024, 1, day), uuid.uuid4()) for day in range(1, 4)]
+    page, next_cursor = paginate(rows, 2, lambda row: row)
+    assert page == rows[:2]
+    assert next_cursor
+    assert decode_cursor(next_cursor, (datetime, uuid.UUID)) == rows[1]
+
+
+def test_paginate_last_page() -> None:
+    rows = [(datetime(2024, 1, day), uuid.uuid4()) for day in range(1, 3)]
+    page, next_cursor = paginate(rows, 2, lambda row: row)
+    assert page == rows
+    assert next_cursor is None
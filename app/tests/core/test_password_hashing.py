@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from app.core.password_hashing import PasswordHashingPool, PasswordHashingUnavailable
+from app.core.security import verify_password
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_pool_hash_and_verify():
+    pool = PasswordHashingPool(workers=1, max_pending=4)
+    try:
+        hashed_password = await pool.hash_password("password")
+        assert verify_password("password", hashed_password)
+        assert await pool.verify_password("password", hashed_password)
+        assert not await pool.verify_password("wrong password", hashed_password)
+        statistics = pool.get_statistics()
+        assert statistics.completed == 3
+        assert statistics.pending == 0
+        assert statistics.rejected == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_pool_threads():
+    pool = PasswordHashingPool(workers=0, max_pending=4)
+    hashed_password = await pool.hash_password("password")
+    assert await pool.verify_password("password", hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_pool_rejects_when_full():
+    pool = PasswordHashingPool(workers=0, max_pending=2)
+    results = await asyncio.gather(
+        *(pool.hash_password("password") for _ in range(3)), return_exceptions=True
+    )
+    assert (
+        sum(isinstance(result, PasswordHashingUnavailable) for result in results) == 1
+    )
+    statistics = pool.get_statistics()
+    assert statistics.rejected == 1
+    assert statistics.max_pending_seen == 2
+    assert statistics.completed == 2
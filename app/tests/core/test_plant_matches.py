@@ -0,0 +1,70 @@
+import uuid
+
+from app.core.plant_matches import TagIndex
+
+
+def _plant_created_event(
+    plant_id: uuid.UUID, owner_id: uuid.UUID, tags: list[str]
+) -> dict:
+    return {
+        "type": "plant_created",
+        "id": str(plant_id),
+        "owner_id": str(owner_id),
+        "tags": tags,
+    }
+
+
+def test_tag_index_finds_matches():
+    index = TagIndex()
+    owner, other_owner, third_owner, fourth_owner, unrelated_owner = (
+        uuid.uuid4() for _ in range(5)
+    )
+    (
+        plant,
+        own_plant,
+        two_tags,
+        one_tag,
+        other_tag,
+        third_plant,
+        fourth_plant,
+        unrelated_plant,
+    ) = (uuid.UUID(int=i) for i in range(1, 9))
+    for plant_id, owner_id, tags in [
+        (plant, owner, ["common", "rare", "large"]),
+        (own_plant, owner, ["common", "rare"]),
+        (two_tags, other_owner, ["common", "rare"]),
+        (one_tag, other_owner, ["common"]),
+        (other_tag, other_owner, ["small"]),
+        (third_plant, third_owner, ["common"]),
+        (fourth_plant, fourth_owner, ["common"]),
+        (unrelated_plant, unrelated_owner, ["small"]),
+    ]:
+        index.apply_event(_plant_created_event(plant_id, owner_id, tags))
+    index.apply_event({"type": "trade_request_created"})
+    assert index.size == 8
+
+    # The owner of two_tags, one_tag and other_tag has the tags common and rare of the plant
+    assert index.find_matches(plant, limit=10, budget=100) == [
+        (two_tags, 4),
+        (one_tag, 3),
+        (fourth_plant, 2),
+        (third_plant, 2),
+        (other_tag, 2),
+    ]
+    assert index.find_matches(plant, limit=1, budget=100) == [(two_tags, 4)]
+    # The owners of the least common tags are counted first, so common is not counted
+    assert index.find_matches(plant, limit=10, budget=6) == [
+        (two_tags, 3),
+        (one_tag, 2),
+        (other_tag, 1),
+    ]
+    assert index.find_matches(uuid.uuid4(), limit=10, budget=100) == []
+
+    index.apply_event({"type": "plant_deleted", "id": str(two_tags)})
+    assert index.find_matches(plant, limit=10, budget=100) == [
+        (fourth_plant, 2),
+        (third_plant, 2),
+        (one_tag, 2),
+        (other_tag, 1),
+    ]
+    assert index.size == 7
@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import exc
+
+from app.core.pool import TimedQueuePool, get_pool_statistics
+
+
+def test_timed_queue_pool_statistics():
+    pool = TimedQueuePool(
+        lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.01
+    )
+    connection = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    statistics = get_pool_statistics("test", pool)
+    assert statistics.name == "test"
+    assert statistics.size == 1
+    assert statistics.checked_out == 1
+    assert statistics.idle == 0
+    assert statistics.overflow == 0
+    assert statistics.checkouts == 1
+    assert statistics.timeouts == 1
+    connection.close()
+    statistics = get_pool_statistics("test", pool)
+    assert statistics.checked_out == 0
+    assert statistics.idle == 1
@@ -1,7 +1,63 @@
-from app.core.security import create_access_token
+import uuid
+
+from unittest.mock import patch
+
+from passlib.context import CryptContext
+
+from app.core.security import (
+    ACCESS_TOKEN_VERSION,
+    MIN_BCRYPT_ROUNDS,
+    calibrate_bcrypt_rounds,
+    verify_and_update_password,
+    create_access_token,
+    create_user_access_token,
+    decode_access_token,
+)
+from app.models import User
 
 
 def test_create_access_token():
     data = {"sub": "", "exp": ""}
     create_access_token(data, None)
     assert data["exp"] == ""
+
+
+def test_create_user_access_token():
+    user = User(
+        id=uuid.uuid4(), email="user@example.com", hashed_password="", is_superuser=True
+    )
+    claims = decode_access_token(create_user_access_token(user))
+    assert claims["sub"] == str(user.id)
+    assert claims["ver"] == ACCESS_TOKEN_VERSION
+    assert claims["is_active"] is True
+    assert claims["is_superuser"] is True
+    assert "exp" in claims
+
+
+def test_verify_and_update_password_outdated_hash():
+    hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("pw")
+    verified, new_hashed_password = verify_and_update_password("pw", hashed_password)
+    assert verified
+    assert new_hashed_password is not None
+    assert verify_and_update_password("pw", new_hashed_password) == (True, None)
+    assert verify_and_update_password("wrong", hashed_password) == (False, None)
+
+
+def test_calibrate_bcrypt_rounds():
+    # Verifications take 60, 120, 240 and 480 ms, like bcrypt doubling the duration with every round
+    timestamps = [0, 0.06, 1, 1.12, 2, 2.24, 3, 3.48]
+    with (
+        patch("app.core.security.time.perf_counter", side_effect=timestamps),
+        patch("app.core.security.CryptContext"),
+    ):
+        rounds = calibrate_bcrypt_rounds(target_ms=250, samples=1)
+    assert rounds == MIN_BCRYPT_ROUNDS + 2
+
+
+def test_calibrate_bcrypt_rounds_never_below_minimum():
+    with (
+        patch("app.core.security.time.perf_counter", side_effect=[0, 1, 2, 3]),
+        patch("app.core.security.CryptContext"),
+    ):
+        rounds = calibrate_bcrypt_rounds(target_ms=250, samples=1)
+    assert rounds == MIN_BCRYPT_ROUNDS
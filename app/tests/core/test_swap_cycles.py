@@ -0,0 +1,77 @@
+import uuid
+
+from app.core.swap_cycles import SwapGraph
+
+
+def _trade_request_event(
+    event_type: str,
+    outgoing_user_id: uuid.UUID,
+    incoming_user_id: uuid.UUID,
+    status: int = 0,
+) -> dict:
+    return {
+        "type": event_type,
+        "outgoing_plant_id": str(uuid.UUID(int=outgoing_user_id.int + 1)),
+        "incoming_plant_id": str(uuid.UUID(int=incoming_user_id.int + 1)),
+        "outgoing_user_id": str(outgoing_user_id),
+        "incoming_user_id": str(incoming_user_id),
+        "status": status,
+    }
+
+
+def _add_trade_requests(graph: SwapGraph, *users: uuid.UUID) -> None:
+    """
+    Add trade requests from every user to the next one.
+    """
+    for user, next_user in zip(users, users[1:]):
+        graph.apply_event(
+            _trade_request_event("trade_request_created", user, next_user)
+        )
+
+
+def test_swap_graph_finds_cycles():
+    graph = SwapGraph()
+    one, two, three, four = (uuid.UUID(int=i * 10) for i in range(1, 5))
+    # Direct trade between one and two, a cycle of three and a cycle of four users
+    _add_trade_requests(graph, one, two, one)
+    _add_trade_requests(graph, two, three, one)
+    _add_trade_requests(graph, three, four, one)
+    graph.apply_event({"type": "message_created"})
+    assert graph.edge_count == 6
+
+    cycles, complete = graph.find_cycles(one, max_length=4, limit=10, budget=1000)
+    assert complete
+    assert sorted([key[1] for key in cycle] for cycle in cycles) == [
+        [two, three, one],
+        [two, three, four, one],
+    ]
+    assert all(cycle[0][0] == one for cycle in cycles)
+    assert cycles[0][0][2:] == (uuid.UUID(int=one.int + 1), uuid.UUID(int=two.int + 1))
+
+    cycles, _ = graph.find_cycles(one, max_length=3, limit=10, budget=1000)
+    assert [[key[1] for key in cycle] for cycle in cycles] == [[two, three, one]]
+
+    # Search stops at the limit and when the budget is used up
+    cycles, complete = graph.find_cycles(one, max_length=4, limit=1, budget=1000)
+    assert len(cycles) == 1
+    assert not complete
+    cycles, complete = graph.find_cycles(one, max_length=4, limit=10, budget=2)
+    assert cycles == []
+    assert not complete
+
+
+def test_swap_graph_removes_trade_requests_which_are_no_longer_pending():
+    graph = SwapGraph()
+    one, two, three = (uuid.UUID(int=i * 10) for i in range(1, 4))
+    _add_trade_requests(graph, one, two, three, one)
+    graph.apply_event(
+        _trade_request_event("trade_request_status_changed", two, three, status=2)
+    )
+    assert graph.find_cycles(one, 5, 10, 1000) == ([], True)
+    graph.apply_event(
+        _trade_request_event("trade_request_status_changed", two, three, status=0)
+    )
+    assert len(graph.find_cycles(one, 5, 10, 1000)[0]) == 1
+    graph.apply_event(_trade_request_event("trade_request_deleted", three, one))
+    assert graph.find_cycles(one, 5, 10, 1000) == ([], True)
+    assert graph.edge_count == 2
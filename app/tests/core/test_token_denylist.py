@@ -0,0 +1,69 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.token_denylist import BloomFilter, TokenDenylist
+from app.models import RevokedToken
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [uuid.uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom_filter.add(item)
+    assert all(item in bloom_filter for item in items)
+    # Items which are false positives when they are added are not counted
+    count = bloom_filter.count
+    assert 990 <= count <= 1000
+    # Items already in the filter are not counted again
+    assert not bloom_filter.add(items[0])
+    assert bloom_filter.count == count
+    false_positives = sum(uuid.uuid4().hex in bloom_filter for _ in range(10_000))
+    assert false_positives < 300
+
+
+@pytest.mark.asyncio
+async def test_token_denylist_rebuild_and_refresh(async_db: AsyncSession):
+    denylist = TokenDenylist(capacity=100, error_rate=0.001)
+    other_worker_denylist = TokenDenylist(capacity=100, error_rate=0.001)
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    revoked_jti, later_revoked_jti = uuid.uuid4().hex, uuid.uuid4().hex
+    expired_jti = uuid.uuid4().hex
+    try:
+        await denylist.revoke(async_db, revoked_jti, expires_at)
+        await denylist.revoke(
+            async_db, expired_jti, datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        # Until the filter was built, every token is looked up
+        assert not other_worker_denylist.ready
+        assert await other_worker_denylist.is_revoked(async_db, revoked_jti)
+        await other_worker_denylist.rebuild(async_db)
+        assert await async_db.get(RevokedToken, expired_jti) is None
+        assert await other_worker_denylist.is_revoked(async_db, revoked_jti)
+        assert not await other_worker_denylist.is_revoked(async_db, uuid.uuid4().hex)
+
+        await denylist.revoke(async_db, later_revoked_jti, expires_at)
+        await other_worker_denylist.refresh(async_db)
+        assert await other_worker_denylist.is_revoked(async_db, later_revoked_jti)
+        statistics = other_worker_denylist.get_statistics("revoked_tokens")
+        assert statistics.size >= 2
+        # The lookup before the filter was built is not counted
+        assert statistics.hits == 2
+        assert statistics.misses == 1
+        # Revocations selected again by later refreshes are not added again
+        await other_worker_denylist.refresh(async_db)
+        await other_worker_denylist.refresh(async_db)
+        assert (
+            other_worker_denylist.get_statistics("revoked_tokens").size
+            == statistics.size
+        )
+    finally:
+        await async_db.exec(
+            delete(RevokedToken).where(
+                RevokedToken.jti.in_([revoked_jti, later_revoked_jti, expired_jti])  # type: ignore
+            )
+        )
+        await async_db.commit()
@@ -0,0 +1,91 @@
+import uuid
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.crud import users_crud
+from app.core.user_cache import UserCache, user_cache
+from app.models import User, UserCreate
+from app.tests.utils.users import create_random_user, get_user_authentication_cookie
+from app.tests.utils.utils import random_email, random_lower_string
+
+
+def _user() -> User:
+    return User(id=uuid.uuid4(), email=random_email(), hashed_password="hash")
+
+
+def test_user_cache_hit_and_miss() -> None:
+    cache = UserCache(max_size=2, ttl_seconds=60)
+    user = _user()
+    assert cache.get(user.email) is None
+    cache.set(user.email, user)
+    cached_user = cache.get(user.email)
+    assert cached_user is not None
+    assert cached_user is not user
+    assert cached_user.id == user.id
+    assert cached_user.email == user.email
+    statistics = cache.get_statistics("test")
+    assert (statistics.hits, statistics.misses, statistics.size) == (1, 1, 1)
+
+
+def test_user_cache_ttl() -> None:
+    cache = UserCache(max_size=2, ttl_seconds=60)
+    user = _user()
+    with patch("app.core.user_cache.time.monotonic", return_value=0):
+        cache.set(user.email, user)
+    with patch("app.core.user_cache.time.monotonic", return_value=61):
+        assert cache.get(user.email) is None
+    assert cache.get_statistics("test").size == 0
+
+
+def test_user_cache_evicts_least_recently_used() -> None:
+    cache = UserCache(max_size=2, ttl_seconds=60)
+    user_one, user_two, user_three = _user(), _user(), _user()
+    cache.set(user_one.email, user_one)
+    cache.set(user_two.email, user_two)
+    assert cache.get(user_one.email) is not None
+    cache.set(user_three.email, user_three)
+    assert cache.get(user_two.email) is None
+    assert cache.get(user_one.email) is not None
+    assert cache.get(user_three.email) is not None
+
+
+def test_user_cache_disabled() -> None:
+    cache = UserCache(max_size=0, ttl_seconds=60)
+    user = _user()
+    cache.set(user.email, user)
+    assert cache.get(user.email) is None
+
+
+def test_user_cache_invalidated_when_user_is_deactivated(
+    client: TestClient, db: Session
+) -> None:
+    with create_random_user(client, db) as (user, _, auth_cookie):
+        response = client.get("/users/me", cookies=[auth_cookie])
+        assert response.json()["is_active"]
+        assert user_cache.get(str(user.id)) is not None
+        user.is_active = False
+        db.add(user)
+        db.flush()
+        # Until the commit, other requests still read the old values from the database
+        assert user_cache.get(str(user.id)) is not None
+        db.commit()
+        assert user_cache.get(str(user.id)) is None
+        response = client.get("/users/me", cookies=[auth_cookie])
+        assert not response.json()["is_active"]
+
+
+def test_user_cache_invalidated_when_user_is_deleted(
+    client: TestClient, db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = users_crud.create_user(db, UserCreate(email=email, password=password))
+    auth_cookie = get_user_authentication_cookie(client, str(email), password)
+    client.get("/users/me", cookies=[auth_cookie])
+    assert user_cache.get(str(user.id)) is not None
+    users_crud.delete_user(db, user)
+    assert user_cache.get(str(user.id)) is None
+    response = client.get("/users/me", cookies=[auth_cookie])
+    assert response.status_code == 401
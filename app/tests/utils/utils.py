@@ -1,7 +1,10 @@
 import random
 import string
+from collections.abc import Generator
+from contextlib import contextmanager
 
 from pydantic import EmailStr
+from sqlalchemy import Engine, event
 
 
 def random_lower_string() -> str:
@@ -10,3 +13,22 @@ def random_lower_string() -> str:
 
 def random_email() -> EmailStr:
     return f"{random_lower_string()}@{random_lower_string()}.com"
+
+
+@contextmanager
+def count_queries(engine: Engine) -> Generator[list[str], None, None]:
+    """
+    Context manager collecting the statements executed on the given engine, e.g. to detect N+1 queries.
+    :param engine: Engine to listen on, the sync_engine of async engines
+    :return: List which the executed statements are appended to
+    """
+    statements: list[str] = []
+
+    def before_cursor_execute(_connection, _cursor, statement, *_args) -> None:
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
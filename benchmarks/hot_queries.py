@@ -0,0 +1,67 @@
+"""
+Benchmark of the user lookup which runs on every authenticated request.
+
+Compares building the statement on every call (as done before) with the pre-built statement used by
+users_crud_async.get_user_by_email, each with and without server-side prepared statements.
+Needs the database configured in .env to be running. Run with: python -m benchmarks.hot_queries
+"""
+
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.crud.users_crud_async import get_user_by_email
+from app.models import User
+
+ITERATIONS = 2000
+
+
+async def get_user_by_email_rebuilt(session: AsyncSession, email: str) -> User | None:
+    # noinspection Pydantic
+    statement = select(User).where(User.email == email)  # type: ignore
+    return (await session.exec(statement)).first()
+
+
+async def measure(lookup, prepare_threshold: int | None) -> float:
+    """
+    Measure the average time of a lookup in microseconds, using a single connection.
+    """
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        connect_args={"prepare_threshold": prepare_threshold},
+    )
+    async with AsyncSession(engine) as session:
+        # Warm up the connection, SQLAlchemy's compiled cache and the prepared statement
+        for _ in range(10):
+            await lookup(session, settings.FIRST_SUPERUSER)
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            await lookup(session, settings.FIRST_SUPERUSER)
+        elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed / ITERATIONS * 1_000_000
+
+
+async def main() -> None:
+    results = {
+        "rebuilt statement, not prepared": await measure(
+            get_user_by_email_rebuilt, None
+        ),
+        "rebuilt statement, prepared": await measure(get_user_by_email_rebuilt, 1),
+        "pre-built statement, not prepared": await measure(get_user_by_email, None),
+        "pre-built statement, prepared": await measure(get_user_by_email, 1),
+    }
+    baseline = results["rebuilt statement, not prepared"]
+    for name, microseconds in results.items():
+        print(
+            f"{name:<36} {microseconds:8.1f} µs per lookup "
+            f"({baseline - microseconds:+7.1f} µs saved)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())